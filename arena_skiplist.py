@@ -0,0 +1,197 @@
+import random
+from array import array
+
+# Node 0 is the head of the list, so a link to 0 marks the end of a level.
+HEAD = 0
+
+
+class ArenaSkiplist:
+    """
+    ArenaSkiplist is a skiplist from bytes keys to bytes values, ordered by the
+    native bytes ordering, which does not allocate a python object per entry.
+
+    The keys and values are appended to one growable arena buffer, and a node is
+    an index into array-typed tables holding the offsets of its key and value in
+    the arena and the offset of its links in a shared link table.
+
+    A single writer may insert concurrently with readers: a node is fully built
+    before it is linked into the list, and the nodes are never removed.
+    """
+
+    MAX_HEIGHT = 12
+    BRANCHING = 4
+
+    def __init__(self):
+        self._arena = bytearray()
+        # Per node tables. Node 0 is the head, which has no key.
+        self._key_start = array('Q', [0])
+        self._key_end = array('Q', [0])
+        self._value_end = array('Q', [0])
+        self._link_base = array('Q', [0])
+        # links[link_base[n] + level] is the next node of n at level
+        self._links = array('Q', [HEAD] * ArenaSkiplist.MAX_HEIGHT)
+        self._max_height = 1
+
+    def size(self) -> int:
+        return len(self._key_start) - 1
+
+    def memory_usage(self) -> int:
+        """
+        Return the number of bytes used by the arena and the node tables.
+        """
+        tables = [self._key_start, self._key_end, self._value_end, self._link_base, self._links]
+        return len(self._arena) + sum(t.itemsize * len(t) for t in tables)
+
+    def _random_height(self) -> int:
+        # Increase height with probability 1 in BRANCHING
+        height = 1
+        while height < ArenaSkiplist.MAX_HEIGHT and random.randrange(ArenaSkiplist.BRANCHING) == 0:
+            height += 1
+        return height
+
+    def insert(self, key: bytes, value: bytes):
+        """
+        REQUIRES: nothing that compares equal to key is currently in the list.
+        """
+        prev = [HEAD] * ArenaSkiplist.MAX_HEIGHT
+        x = self.find_greater_or_equal(key, prev)
+        # Our data structure does not allow duplicate insertion
+        assert x == HEAD or self.key(x) != key
+
+        height = self._random_height()
+        if height > self._max_height:
+            # The head is the predecessor of the new node at the new levels, which
+            # is already set in prev. Readers seeing the new height before the
+            # node is linked only find the end of those levels at the head.
+            self._max_height = height
+
+        # Build the node in the arena and the tables before linking it
+        node = len(self._key_start)
+        start = len(self._arena)
+        self._arena += key
+        self._arena += value
+        self._key_start.append(start)
+        self._key_end.append(start + len(key))
+        self._value_end.append(len(self._arena))
+        base = len(self._links)
+        links = self._links
+        links.extend([links[self._link_base[prev[i]] + i] for i in range(height)])
+        self._link_base.append(base)
+
+        # Publish the node in each level, from the bottom up
+        for i in range(height):
+            links[self._link_base[prev[i]] + i] = node
+
+    def key(self, node: int) -> bytes:
+        return bytes(self._arena[self._key_start[node]:self._key_end[node]])
+
+    def value(self, node: int) -> bytes:
+        return bytes(self._arena[self._key_end[node]:self._value_end[node]])
+
+    def next(self, node: int) -> int:
+        return self._links[self._link_base[node]]
+
+    def find_greater_or_equal(self, key: bytes, prev: list = None) -> int:
+        """
+        Return the first node with a key >= key, or HEAD if there is no such node.
+        If prev is not None, fill prev[level] with the last node < key at every level.
+        """
+        arena = self._arena
+        links = self._links
+        link_base = self._link_base
+        key_start = self._key_start
+        key_end = self._key_end
+        x = HEAD
+        level = self._max_height - 1
+        while True:
+            nxt = links[link_base[x] + level]
+            if nxt != HEAD and arena[key_start[nxt]:key_end[nxt]] < key:
+                # Keep searching in this list
+                x = nxt
+            else:
+                if prev is not None:
+                    prev[level] = x
+                if level == 0:
+                    return nxt
+                # Switch to next list
+                level -= 1
+
+    def find_less_than(self, key: bytes) -> int:
+        """
+        Return the last node with a key < key, or HEAD if there is no such node.
+        """
+        arena = self._arena
+        links = self._links
+        link_base = self._link_base
+        key_start = self._key_start
+        key_end = self._key_end
+        x = HEAD
+        level = self._max_height - 1
+        while True:
+            nxt = links[link_base[x] + level]
+            if nxt != HEAD and arena[key_start[nxt]:key_end[nxt]] < key:
+                x = nxt
+            elif level == 0:
+                return x
+            else:
+                level -= 1
+
+    def find_last(self) -> int:
+        """
+        Return the last node in the list, or HEAD if the list is empty.
+        """
+        links = self._links
+        link_base = self._link_base
+        x = HEAD
+        level = self._max_height - 1
+        while True:
+            nxt = links[link_base[x] + level]
+            if nxt != HEAD:
+                x = nxt
+            elif level == 0:
+                return x
+            else:
+                level -= 1
+
+    def iter(self) -> 'ArenaSkiplistIterator':
+        return ArenaSkiplistIterator(self)
+
+
+class ArenaSkiplistIterator:
+    """
+    Iterates over the entries of an ArenaSkiplist. The iterator is initially invalid.
+    """
+
+    def __init__(self, skiplist: ArenaSkiplist):
+        self._list = skiplist
+        self._node = HEAD
+
+    def valid(self) -> bool:
+        return self._node != HEAD
+
+    def key(self) -> bytes:
+        assert self.valid()
+        return self._list.key(self._node)
+
+    def value(self) -> bytes:
+        assert self.valid()
+        return self._list.value(self._node)
+
+    def next(self):
+        assert self.valid()
+        self._node = self._list.next(self._node)
+
+    def prev(self):
+        # Instead of using explicit "prev" links, we just search for the
+        # last node that falls before key.
+        assert self.valid()
+        self._node = self._list.find_less_than(self._list.key(self._node))
+
+    def seek(self, target: bytes):
+        self._node = self._list.find_greater_or_equal(target)
+
+    def seek_to_first(self):
+        self._node = self._list.next(HEAD)
+
+    def seek_to_last(self):
+        self._node = self._list.find_last()
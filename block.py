@@ -0,0 +1,180 @@
+from dbformat import byte_order
+from status import Status
+
+
+class Block:
+    """
+    An immutable block read from a table. See BlockBuilder for the format.
+    """
+
+    def __init__(self, contents: bytes):
+        self._data = bytes(contents)
+        self._size = len(self._data)
+        self._restart_offset = 0
+        self._num_restarts = 0
+        if self._size < 4:
+            # Error marker
+            self._size = 0
+        else:
+            self._num_restarts = int.from_bytes(self._data[-4:], byte_order)
+            max_restarts_allowed = (self._size - 4) // 4
+            if self._num_restarts > max_restarts_allowed:
+                # The size is too small for num_restarts
+                self._size = 0
+            else:
+                self._restart_offset = self._size - (1 + self._num_restarts) * 4
+
+    def size(self) -> int:
+        return self._size
+
+    def new_iterator(self, comparator) -> 'BlockIterator':
+        if self._size == 0:
+            return BlockIterator(self, comparator, Status.Corruption('bad block contents'))
+        return BlockIterator(self, comparator)
+
+
+class BlockIterator:
+    def __init__(self, block: Block, comparator, status: Status = None):
+        self._data = block._data
+        self._restarts = block._restart_offset
+        self._num_restarts = block._num_restarts
+        self._comparator = comparator
+        self._status = status if status is not None else Status.OK()
+        # Offset of the current entry, _restarts if the iterator is not valid
+        self._current = self._restarts
+        # Index of the restart block in which _current falls
+        self._restart_index = self._num_restarts
+        self._next_offset = self._restarts
+        self._key = b''
+        self._value = b''
+
+    def valid(self) -> bool:
+        return self._current < self._restarts
+
+    def status(self) -> Status:
+        return self._status
+
+    def key(self) -> bytes:
+        assert self.valid()
+        return self._key
+
+    def value(self) -> bytes:
+        assert self.valid()
+        return self._value
+
+    def _restart_point(self, index: int) -> int:
+        start = self._restarts + index * 4
+        return int.from_bytes(self._data[start:start + 4], byte_order)
+
+    def _seek_to_restart_point(self, index: int):
+        self._key = b''
+        self._restart_index = index
+        # _current will be fixed by _parse_next_key()
+        self._next_offset = self._restart_point(index)
+
+    def _corruption_error(self):
+        self._current = self._restarts
+        self._restart_index = self._num_restarts
+        self._status = Status.Corruption('bad entry in block')
+        self._key = b''
+        self._value = b''
+
+    def _parse_next_key(self) -> bool:
+        self._current = self._next_offset
+        if self._current >= self._restarts:
+            # No more entries to return. Mark as invalid.
+            self._current = self._restarts
+            self._restart_index = self._num_restarts
+            return False
+
+        data = self._data
+        p = self._current
+        if p + 12 > self._restarts:
+            self._corruption_error()
+            return False
+        shared = int.from_bytes(data[p:p + 4], byte_order)
+        non_shared = int.from_bytes(data[p + 4:p + 8], byte_order)
+        value_size = int.from_bytes(data[p + 8:p + 12], byte_order)
+        p += 12
+        if shared > len(self._key) or p + non_shared + value_size > self._restarts:
+            self._corruption_error()
+            return False
+
+        self._key = self._key[:shared] + data[p:p + non_shared]
+        p += non_shared
+        self._value = data[p:p + value_size]
+        self._next_offset = p + value_size
+        while self._restart_index + 1 < self._num_restarts and \
+                self._restart_point(self._restart_index + 1) < self._current:
+            self._restart_index += 1
+        return True
+
+    def next(self):
+        assert self.valid()
+        self._parse_next_key()
+
+    def prev(self):
+        assert self.valid()
+
+        # Scan backwards to a restart point before _current
+        original = self._current
+        while self._restart_point(self._restart_index) >= original:
+            if self._restart_index == 0:
+                # No more entries
+                self._current = self._restarts
+                self._restart_index = self._num_restarts
+                return
+            self._restart_index -= 1
+
+        self._seek_to_restart_point(self._restart_index)
+        # Loop until end of current entry hits the start of original entry
+        while self._parse_next_key() and self._next_offset < original:
+            pass
+
+    def seek(self, target: bytes):
+        if self._num_restarts == 0:
+            return
+        # Binary search in restart array to find the last restart point
+        # with a key < target
+        left = 0
+        right = self._num_restarts - 1
+        while left < right:
+            mid = (left + right + 1) // 2
+            region_offset = self._restart_point(mid)
+            p = region_offset
+            shared = int.from_bytes(self._data[p:p + 4], byte_order)
+            non_shared = int.from_bytes(self._data[p + 4:p + 8], byte_order)
+            if shared != 0:
+                self._corruption_error()
+                return
+            mid_key = self._data[p + 12:p + 12 + non_shared]
+            if self._comparator(mid_key, target) < 0:
+                # Key at "mid" is smaller than "target". Therefore all
+                # blocks before "mid" are uninteresting.
+                left = mid
+            else:
+                # Key at "mid" is >= "target". Therefore all blocks at or
+                # after "mid" are uninteresting.
+                right = mid - 1
+
+        # Linear search (within restart block) for first key >= target
+        self._seek_to_restart_point(left)
+        while True:
+            if not self._parse_next_key():
+                return
+            if self._comparator(self._key, target) >= 0:
+                return
+
+    def seek_to_first(self):
+        if self._num_restarts == 0:
+            return
+        self._seek_to_restart_point(0)
+        self._parse_next_key()
+
+    def seek_to_last(self):
+        if self._num_restarts == 0:
+            return
+        self._seek_to_restart_point(self._num_restarts - 1)
+        while self._parse_next_key() and self._next_offset < self._restarts:
+            # Keep skipping
+            pass
@@ -0,0 +1,84 @@
+from dbformat import byte_order
+
+
+class BlockBuilder:
+    """
+    BlockBuilder generates blocks where keys are prefix-compressed.
+
+    When we store a key, we drop the prefix shared with the previous key.
+    Once every block_restart_interval keys, we do not apply the prefix
+    compression and store the entire key. We call this a restart point.
+    The tail end of the block stores the offsets of all the restart points,
+    which is used to do a binary search when looking for a particular key.
+
+    An entry of a block:
+    |shared: 4 bytes|non_shared: 4 bytes|value_size: 4 bytes|key_delta|value|
+
+    The trailer of a block:
+    |restarts: 4 bytes * num_restarts|num_restarts: 4 bytes|
+    """
+
+    def __init__(self, block_restart_interval: int):
+        assert block_restart_interval >= 1
+        self._block_restart_interval = block_restart_interval
+        self._buffer = bytearray()
+        self._restarts = [0]
+        self._counter = 0
+        self._finished = False
+        self._last_key = b''
+
+    def reset(self):
+        self._buffer = bytearray()
+        self._restarts = [0]
+        self._counter = 0
+        self._finished = False
+        self._last_key = b''
+
+    def add(self, key: bytes, value: bytes):
+        """
+        Add a key value pair to the block. The key must be larger than any previously added key.
+        :param key:
+        :param value:
+        :return:
+        """
+        assert not self._finished
+        assert self._counter <= self._block_restart_interval
+
+        shared = 0
+        if self._counter < self._block_restart_interval:
+            # See how much sharing to do with the previous key
+            last_key = self._last_key
+            min_length = min(len(last_key), len(key))
+            while shared < min_length and last_key[shared] == key[shared]:
+                shared += 1
+        else:
+            # Restart compression
+            self._restarts.append(len(self._buffer))
+            self._counter = 0
+
+        non_shared = len(key) - shared
+        self._buffer.extend(shared.to_bytes(4, byte_order))
+        self._buffer.extend(non_shared.to_bytes(4, byte_order))
+        self._buffer.extend(len(value).to_bytes(4, byte_order))
+        self._buffer.extend(key[shared:])
+        self._buffer.extend(value)
+
+        self._last_key = bytes(key)
+        self._counter += 1
+
+    def finish(self) -> bytearray:
+        """
+        Append the restart array and return the content of the block.
+        The content is valid until reset() is called.
+        """
+        for restart in self._restarts:
+            self._buffer.extend(restart.to_bytes(4, byte_order))
+        self._buffer.extend(len(self._restarts).to_bytes(4, byte_order))
+        self._finished = True
+        return self._buffer
+
+    def current_size_estimate(self) -> int:
+        return len(self._buffer) + len(self._restarts) * 4 + 4
+
+    def empty(self) -> bool:
+        return len(self._buffer) == 0
@@ -1,27 +1,72 @@
+import zlib
+
+HASH_SEED = 0xbc9f1d34
+
+
+def bloom_hash(key) -> int:
+    """
+    (str or bytes) -> int
+    A stable 32-bit hash of the key, which is the same in every process.
+    """
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    return zlib.crc32(key, HASH_SEED)
+
+
 class BloomFilter:
-    def __init__(self, size, num_item):
+    """
+    A bloom filter with size bits packed in a bytearray and num_item hash functions.
+    The hash functions are derived from one stable hash by double hashing,
+    so the filter can be persisted and checked by another process.
+    """
+
+    def __init__(self, size, num_item, bit_array: bytearray = None):
         self.size = size
-        self.bit_array = [False] * size
+        self.bit_array = bit_array if bit_array is not None else bytearray((size + 7) // 8)
         self.num_item = num_item
 
     def add(self, key):
+        h = bloom_hash(key)
+        # Rotate right 17 bits
+        delta = ((h >> 17) | (h << 15)) & 0xffffffff
         for i in range(self.num_item):
-            index = self.hash(key, i)
-            self.bit_array[index] = True
+            index = h % self.size
+            self.bit_array[index >> 3] |= 1 << (index & 7)
+            h = (h + delta) & 0xffffffff
 
     def check(self, key):
         """
         (self, object) -> bool
         """
+        h = bloom_hash(key)
+        delta = ((h >> 17) | (h << 15)) & 0xffffffff
         for i in range(self.num_item):
-            index = self.hash(key, i)
-            if self.bit_array[index] == False:
+            index = h % self.size
+            if self.bit_array[index >> 3] & (1 << (index & 7)) == 0:
                 return False
+            h = (h + delta) & 0xffffffff
         return True
 
     def hash(self, key, seed):
         """
         (self, str, int) -> int
         """
-        val = hash(hash(key) + hash(seed))
-        return val % self.size
+        h = bloom_hash(key)
+        delta = ((h >> 17) | (h << 15)) & 0xffffffff
+        return ((h + seed * delta) & 0xffffffff) % self.size
+
+    def to_bytes(self) -> bytes:
+        """
+        Encode the filter as |bit_array|num_item: 1 byte|.
+        """
+        assert self.size == len(self.bit_array) * 8
+        return bytes(self.bit_array) + bytes([self.num_item])
+
+    @staticmethod
+    def from_bytes(data: bytes) -> 'BloomFilter':
+        """
+        Decode a filter encoded by to_bytes. The bit array references data without copying.
+        """
+        if len(data) < 2:
+            return None
+        return BloomFilter(size=(len(data) - 1) * 8, num_item=data[-1], bit_array=memoryview(data)[:-1])
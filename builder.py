@@ -0,0 +1,57 @@
+import os
+
+from option import DBOption
+from status import Status
+from table_builder import TableBuilder
+from utils import table_file_name
+from version_edit import FileMetaData
+
+
+def build_table(db_name: str, option: DBOption, iterator, meta: FileMetaData) -> Status:
+    """
+    Build a table file from the contents of iterator. The generated file will be
+    named according to meta.number. On success, the rest of meta will be filled
+    with metadata about the generated table. If no data is present in iterator,
+    meta.file_size will be set to zero, and no table file will be produced.
+    """
+    s = Status.OK()
+    meta.file_size = 0
+    iterator.seek_to_first()
+
+    file_name = table_file_name(db_name, meta.number)
+    if iterator.valid():
+        try:
+            file = open(file_name, 'wb')
+        except Exception as e:
+            return Status.IOError(str(e))
+
+        builder = TableBuilder(option, file)
+        meta.smallest_key = bytearray(iterator.key())
+        key = None
+        while iterator.valid():
+            key = iterator.key()
+            builder.add(key, iterator.value())
+            iterator.next()
+        meta.greatest_key = bytearray(key)
+
+        s = builder.finish()
+        if s.ok():
+            meta.file_size = builder.file_size()
+            assert meta.file_size > 0
+        try:
+            # Finish and check for file errors
+            if s.ok():
+                file.flush()
+                os.fsync(file.fileno())
+            file.close()
+        except Exception as e:
+            s = Status.IOError(str(e))
+
+    # Check for input iterator errors
+    if not iterator.status().ok():
+        s = iterator.status()
+
+    if not s.ok() or meta.file_size == 0:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+    return s
@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A thread-safe cache that maps keys to values with a bounded total charge.
+    When the total charge exceeds the capacity, the least recently used
+    entries are evicted.
+    """
+
+    def __init__(self, capacity: int, deleter=None):
+        """
+        :param deleter: if not None, deleter(key, value) is called when a value leaves
+                        the cache, i.e. it is replaced, evicted, erased or pruned, or it
+                        is not cached since the capacity is zero
+        """
+        self._capacity = capacity
+        self._deleter = deleter
+        self._lock = threading.Lock()
+        # key -> (value, charge), ordered from the least to the most recently used
+        self._table = OrderedDict()
+        self._usage = 0
+        self._hits = 0
+        self._misses = 0
+
+    def insert(self, key, value, charge: int):
+        """
+        Insert a mapping from key to value into the cache, replacing the old mapping of key.
+        """
+        removed = []
+        with self._lock:
+            old = self._table.pop(key, None)
+            if old is not None:
+                self._usage -= old[1]
+                removed.append((key, old[0]))
+            if self._capacity <= 0:
+                # Caching is turned off
+                removed.append((key, value))
+            else:
+                self._table[key] = (value, charge)
+                self._usage += charge
+                while self._usage > self._capacity and len(self._table) > 0:
+                    evicted_key, (evicted, evicted_charge) = self._table.popitem(last=False)
+                    self._usage -= evicted_charge
+                    removed.append((evicted_key, evicted))
+        self._delete(removed)
+
+    def lookup(self, key):
+        """
+        Return the value of key, or None if the cache has no mapping for key.
+        """
+        with self._lock:
+            entry = self._table.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._table.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def erase(self, key):
+        with self._lock:
+            entry = self._table.pop(key, None)
+            if entry is None:
+                return
+            self._usage -= entry[1]
+        self._delete([(key, entry[0])])
+
+    def prune(self):
+        """
+        Remove all entries from the cache.
+        """
+        with self._lock:
+            removed = [(key, value) for key, (value, _) in self._table.items()]
+            self._table.clear()
+            self._usage = 0
+        self._delete(removed)
+
+    def _delete(self, removed):
+        # The deleter is called without holding the lock
+        if self._deleter is not None:
+            for key, value in removed:
+                self._deleter(key, value)
+
+    def capacity(self) -> int:
+        return self._capacity
+
+    def total_charge(self) -> int:
+        with self._lock:
+            return self._usage
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._table)
+
+    def hits(self) -> int:
+        return self._hits
+
+    def misses(self) -> int:
+        return self._misses
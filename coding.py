@@ -0,0 +1,112 @@
+"""
+Endian-neutral encoding of variable length integers, in the same format as leveldb's util/coding:
+
+- varint32/varint64: 7 bits of the value per byte, least significant group first,
+  the high bit of a byte is set if more bytes follow. A value < 128 takes one byte.
+- length prefixed slice: |length: varint32|contents|
+"""
+
+# The maximum encoded lengths of varint32 and varint64
+MAX_VARINT32_LENGTH = 5
+MAX_VARINT64_LENGTH = 10
+
+
+def varint_length(v: int) -> int:
+    """
+    Return the number of bytes of the varint encoding of v.
+    """
+    length = 1
+    while v >= 128:
+        v >>= 7
+        length += 1
+    return length
+
+
+def _put_varint(dst: bytearray, v: int):
+    while v >= 128:
+        dst.append((v & 0x7f) | 0x80)
+        v >>= 7
+    dst.append(v)
+
+
+def put_varint32(dst: bytearray, v: int):
+    assert 0 <= v < (1 << 32)
+    _put_varint(dst, v)
+
+
+def put_varint64(dst: bytearray, v: int):
+    assert 0 <= v < (1 << 64)
+    _put_varint(dst, v)
+
+
+def encode_varint32(v: int) -> bytes:
+    # Fast path for the lengths of small keys and values
+    if v < 128:
+        return bytes((v,))
+    buf = bytearray()
+    put_varint32(buf, v)
+    return bytes(buf)
+
+
+def encode_varint64(v: int) -> bytes:
+    buf = bytearray()
+    put_varint64(buf, v)
+    return bytes(buf)
+
+
+def _get_varint(data, offset: int, max_length: int) -> (int, int):
+    result = 0
+    shift = 0
+    end = offset + max_length
+    if end > len(data):
+        end = len(data)
+    while offset < end:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 128:
+            return result, offset
+        shift += 7
+    raise ValueError('truncated or malformed varint')
+
+
+def get_varint32(data, offset: int = 0) -> (int, int):
+    """
+    Decode the varint32 at data[offset:].
+    Return the value and the offset just past it, raise ValueError if the data is malformed.
+    """
+    if offset < len(data) and data[offset] < 128:
+        return data[offset], offset + 1
+    v, offset = _get_varint(data, offset, MAX_VARINT32_LENGTH)
+    if v >= (1 << 32):
+        raise ValueError('varint32 overflow')
+    return v, offset
+
+
+def get_varint64(data, offset: int = 0) -> (int, int):
+    """
+    Decode the varint64 at data[offset:].
+    Return the value and the offset just past it, raise ValueError if the data is malformed.
+    """
+    if offset < len(data) and data[offset] < 128:
+        return data[offset], offset + 1
+    v, offset = _get_varint(data, offset, MAX_VARINT64_LENGTH)
+    if v >= (1 << 64):
+        raise ValueError('varint64 overflow')
+    return v, offset
+
+
+def put_length_prefixed_slice(dst: bytearray, value: bytes):
+    put_varint32(dst, len(value))
+    dst += value
+
+
+def get_length_prefixed_slice(data, offset: int = 0) -> (bytes, int):
+    """
+    Decode the length prefixed slice at data[offset:].
+    Return the contents and the offset just past them, raise ValueError if the data is malformed.
+    """
+    length, offset = get_varint32(data, offset)
+    if offset + length > len(data):
+        raise ValueError('truncated length prefixed slice')
+    return bytes(data[offset:offset + length]), offset + length
@@ -1,2 +1,19 @@
 MAX_NUM_LEVEL = 7
-MAX_REUSED_MANIFEST_SIZE = 1024 * 1024
\ No newline at end of file
+
+# Level-0 compaction is started when we hit this many files.
+L0_COMPACTION_TRIGGER = 4
+# Soft limit on number of level-0 files. We slow down writes at this point.
+L0_SLOWDOWN_WRITES_TRIGGER = 8
+# Maximum number of level-0 files. We stop writes at this point.
+L0_STOP_WRITES_TRIGGER = 12
+
+# Number of open files reserved for uses other than the table cache, e.g. the log and the manifest.
+NUM_NON_TABLE_CACHE_FILES = 10
+
+# The logs are decoded by worker processes on recovery if their total size is at least this many bytes.
+PARALLEL_RECOVERY_MIN_LOG_SIZE = 8 * 1024 * 1024
+
+# A new table file is compacted after it is charged with one seek per this many bytes
+# of its size, and at least MIN_ALLOWED_SEEKS seeks.
+BYTES_PER_SEEK = 16 * 1024
+MIN_ALLOWED_SEEKS = 100
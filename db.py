@@ -1,23 +1,93 @@
 import logging
 import os.path
+import threading
+import time
+from collections import deque
 
+import config
+import log_format
+import recovery
 import utils
 from status import Status
 from option import ReadOption, WriteOption, DBOption
-from version_edit import VersionEdit
-from version_set import VersionSet
-from dbformat import LookupKey
+from version_edit import VersionEdit, FileMetaData
+from version_set import VersionSet, Compaction, GetStats
+from builder import build_table
+from table_builder import TableBuilder
+from dbformat import LookupKey, InternalKey, ValueType, MAX_SEQUENCE_NUMBER
+from snapshot import Snapshot, SnapshotList
+from cache import LRUCache
+from histogram import Histogram
+from db_iter import DBIter
+from merger import MergingIterator
+from table_cache import TableCache
+from config import L0_SLOWDOWN_WRITES_TRIGGER, L0_STOP_WRITES_TRIGGER, MAX_NUM_LEVEL, NUM_NON_TABLE_CACHE_FILES
 from memtable import MemTable
 from write_batch import WriteBatch
 from typing import List
 from log_writer import Writer
-from log_reader import Reader
-from utils import log_file_name, current_file_name, USER_KEY_COMPARATOR, manifest_file_name, save_current_file
+from log_reader import Reader, LoggingReporter
+from utils import log_file_name, current_file_name, USER_KEY_COMPARATOR, manifest_file_name, save_current_file, \
+    table_file_name
 
 logging.basicConfig(level=logging.CRITICAL)
 
+# The maximum size of the batches merged into one write group
+MAX_WRITE_GROUP_SIZE = 1 << 20
+# A write group led by a batch of at most this size grows by at most this size
+SMALL_WRITE_SIZE = 128 << 10
+
+
+class CompactionState:
+    """
+    The state of a running compaction job.
+    """
+
+    class Output:
+        def __init__(self, number: int):
+            self.number = number
+            self.file_size = 0
+            self.smallest_key: bytes = b''
+            self.greatest_key: bytes = b''
+
+    def __init__(self, c: Compaction):
+        self.compaction = c
+        # Sequence numbers < smallest_snapshot are not significant since we
+        # will never have to service a snapshot below smallest_snapshot.
+        # Therefore if we have seen a sequence number S <= smallest_snapshot,
+        # we can drop all entries for the same key with sequence numbers < S.
+        self.smallest_snapshot = 0
+        self.outputs: List[CompactionState.Output] = []
+        # State kept for output being generated
+        self.outfile = None
+        self.builder: TableBuilder = None
+        self.total_bytes = 0
+        # Set once the outputs are written to the manifest, before which no
+        # version may refer to them
+        self.logged = False
+
+    def current_output(self) -> 'CompactionState.Output':
+        return self.outputs[-1]
+
+
+class WriteRequest:
+    """
+    A write waiting in the writer queue of a db.
+    """
+
+    def __init__(self, batch: WriteBatch, sync: bool, mutex: threading.Lock):
+        self.batch = batch
+        self.sync = sync
+        self.done = False
+        self.status: Status = None
+        self.cv = threading.Condition(mutex)
+
 
 class DB:
+    """
+    A DB is safe for concurrent access from multiple threads without any external synchronization.
+    """
+
     def __init__(self, db_name: str, option: DBOption):
         self._mem: MemTable = None
         self._imm: MemTable = None
@@ -25,23 +95,50 @@ class DB:
         self._log_file_num: int = None
         self._db_name = db_name
         self._option = option
-        self.versions = VersionSet(db_name=db_name, option=option)
+        # Data blocks shared by the tables of this db
+        self._block_cache = LRUCache(option.block_cache_size)
+        # Reserve ten files or so for other uses and give the rest to the table cache.
+        self._table_cache = TableCache(db_name, option, option.max_open_files - NUM_NON_TABLE_CACHE_FILES,
+                                       self._block_cache)
+        self.versions = VersionSet(db_name=db_name, option=option, table_cache=self._table_cache)
         self.writer: Writer = None
         self._logger = utils.get_logger_from_db_option(db_name, option.log_level)
+        # Table files that are being generated, which must not be deleted.
+        self._pending_outputs = set()
+        # Numbers of the obsolete log files kept to be reused by new logs
+        self._recycled_logs = deque()
+        # The latencies in microseconds of the syncs of the logs by sync writes,
+        # and of the background syncs of wal_bytes_per_sync
+        self._wal_sync_histogram = Histogram()
+        self._wal_background_sync_histogram = Histogram()
+
+        # _mutex protects the state of the db, and the background work signal
+        # is notified when the background work finishes.
+        self._mutex = threading.Lock()
+        self._background_work_finished_signal = threading.Condition(self._mutex)
+        self._background_compaction_scheduled = False
+        self._shutting_down = False
+        # Once a background error is recorded, all writes fail with it.
+        self._bg_error = Status.OK()
+        self._snapshots = SnapshotList()
+        # Queue of writers. The writer at the front writes the batches of a group of writers.
+        self._writers = deque()
+        # Batch used to merge the batches of a group of writers
+        self._tmp_batch = WriteBatch()
 
     @staticmethod
     def open(db_name: str, option: DBOption) -> ('DB', Status):
         db = DB(db_name, option)
         db._logger.info('open db %s' % db_name)
-        s, should_save_manifest = db.recover()
+        edit = VersionEdit()
+        s, should_save_manifest = db.recover(edit)
         if not s.ok():
             return None, s
 
-        edit = VersionEdit()
         if db._mem is None:
             new_log_number = db.versions.new_file_number()
             try:
-                writer = Writer(log_file_name(db_name, new_log_number))
+                writer = db.new_log_writer(new_log_number)
             except Exception as e:
                 return None, Status.IOError(str(e))
 
@@ -58,9 +155,18 @@ class DB:
             if not s.ok():
                 return None, s
 
+        with db._mutex:
+            db.delete_obsolete_files()
+            db.maybe_schedule_compaction()
+
         return db, Status.OK()
 
-    def recover(self) -> (Status, bool):
+    def recover(self, edit: VersionEdit) -> (Status, bool):
+        """
+        Recover the state of the db from the manifest and the logs. The level-0 tables
+        written from the logs are added to edit.
+        :return: status, should_save_manifest
+        """
         s = Status.OK()
         should_save_manifest = False
 
@@ -103,43 +209,96 @@ class DB:
         self._logger.info('recover log numbers: len=%s' % len(log_numbers))
         self._logger.debug('recover log numbers: detail=%s' % log_numbers)
 
-        for log_number in log_numbers:
-            s, max_sequence, should_save_manifest = self.recover_log_file(log_number)
-            if not s.ok():
-                return s, should_save_manifest
+        # Decode the records of large logs in worker processes
+        executor = None
+        log_size = sum(os.path.getsize(log_file_name(self._db_name, n)) for n in log_numbers)
+        if log_size >= config.PARALLEL_RECOVERY_MIN_LOG_SIZE:
+            executor = recovery.new_executor(self._option.recovery_workers)
+        try:
+            for log_number in log_numbers:
+                s, log_max_sequence, log_save_manifest = self.recover_log_file(log_number, edit, executor)
+                should_save_manifest = should_save_manifest or log_save_manifest
+                if not s.ok():
+                    return s, should_save_manifest
 
-            self.versions.mark_file_number_used(log_number)
+                max_sequence = max(max_sequence, log_max_sequence)
+                self.versions.mark_file_number_used(log_number)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
         self.versions.set_last_sequence(max(max_sequence, self.versions.last_sequence()))
 
         return s, should_save_manifest
 
     def get(self, option: ReadOption, key: str, value: List[str]) -> Status:
+        """
+        Read the value of key into value. The mutex is only held to pick the
+        sequence number, the memtables and the current version, so reads do
+        not wait for writers or the background work.
+        """
+        with self._mutex:
+            # Read sequence number from option.
+            # If option.snapshot is None, use the last sequence number from versions.
+            if option.snapshot:
+                seq = option.snapshot.get_sequence_number()
+            else:
+                seq = self.versions.last_sequence()
+            mem = self._mem
+            imm = self._imm
+            # The files of a referenced version are not deleted.
+            current = self.versions.current()
+            current.ref()
+
+        # Unlock while reading from files and memtables
         s = Status.NotFound()
-        # Read sequence number from option.
-        # If option.snapshot is None, use the last sequence number from versions.
-        seq = 0
-        if option.snapshot:
-            seq = option.snapshot.get_sequence_number()
-        else:
-            seq = self.versions.last_sequence()
+        stats = None
+        try:
+            lkey = LookupKey(user_key=key, sequence=seq)
+            # Firstly, try to get from memtable.
+            if mem.get(lkey, value, s):
+                # Done
+                pass
+            # If not found, try to get from immutable memtable.
+            elif imm is not None and imm.get(lkey, value, s):
+                # Done
+                pass
+            # If not found, try to get from SSTable.
+            else:
+                stats = GetStats()
+                s = current.get(option, lkey, value, stats)
+        finally:
+            with self._mutex:
+                if stats is not None and current.update_stats(stats):
+                    self.maybe_schedule_compaction()
+                current.unref()
+        return s
 
-        lkey = LookupKey(user_key=key, sequence=seq)
-        # Firstly, try to get from memtable.
-        if self._mem.get(lkey, value, s):
-            # Done
-            pass
-        # If not found, try to get from immutable memtable.
-        elif self._imm and self._imm.get(lkey, value, s):
-            # Done
-            pass
-        # If not found, try to get from SSTable.
-        # TODO: Read from persistent storage
-        else:
-            pass
+    def new_iterator(self, option: ReadOption) -> DBIter:
+        """
+        Return an iterator over the contents of the db as of option.snapshot, or
+        as of now if option.snapshot is None. The iterator is initially invalid,
+        the caller must call one of the seek methods before using it.
+        The caller must close the iterator when it is no longer needed.
+        """
+        with self._mutex:
+            if option.snapshot:
+                seq = option.snapshot.get_sequence_number()
+            else:
+                seq = self.versions.last_sequence()
 
-        # TODO: schedule to compact the memtable.
+            # Collect together all needed child iterators
+            iters = [self._mem.new_iterator()]
+            if self._imm is not None:
+                iters.append(self._imm.new_iterator())
+            current = self.versions.current()
+            current.add_iterators(option, iters)
+            current.ref()
 
-        return s
+        def cleanup():
+            with self._mutex:
+                current.unref()
+
+        return DBIter(MergingIterator(iters), seq, option.lower_bound, option.upper_bound, cleanup)
 
     def put(self, option: WriteOption, key, value) -> Status:
         batch = WriteBatch()
@@ -152,26 +311,121 @@ class DB:
         return self.write(option, batch)
 
     def write(self, option: WriteOption, batch: WriteBatch) -> Status:
-        s = Status.OK()
+        """
+        Apply the batch to the db. Concurrent writers are queued, and the writer at the
+        front of the queue writes the batches of the writers behind it as a group with
+        a single log record and a single flush.
+        """
+        w = WriteRequest(batch, option.sync, self._mutex)
+        with self._mutex:
+            self._writers.append(w)
+            while not w.done and w is not self._writers[0]:
+                w.cv.wait()
+            if w.done:
+                return w.status
+            return self._write(w)
 
-        # TODO: Initialize the writers
-
-        # Acquire last sequence number
+    def _write(self, w: WriteRequest) -> Status:
+        """
+        Write the group of writers led by w, which is at the front of the queue.
+        REQUIRES: _mutex is held
+        """
+        # May temporarily unlock and wait.
+        s = self.make_room_for_write(force=(w.batch is None))
         last_sequence = self.versions.last_sequence()
-        batch.set_sequence_number(last_sequence + 1)
-        last_sequence += batch.count()
+        last_writer = w
+        if s.ok() and w.batch is not None:
+            write_batch, last_writer = self.build_batch_group()
+            write_batch.set_sequence_number(last_sequence + 1)
+            last_sequence += write_batch.count()
+
+            # Add to log and apply to memtable. We can release the lock during
+            # this phase since w is currently responsible for logging and protects
+            # against concurrent loggers and concurrent writes into _mem.
+            mem = self._mem
+            self._mutex.release()
+            sync_error = False
+            try:
+                try:
+                    self.writer.write_record(write_batch.serialize())
+                    self.writer.flush()
+                except Exception as e:
+                    s = Status.IOError(str(e))
+                if s.ok() and w.sync:
+                    try:
+                        self.writer.sync()
+                    except Exception as e:
+                        s = Status.IOError(str(e))
+                        sync_error = True
+                if s.ok():
+                    s = write_batch.apply(mem_table=mem)
+            finally:
+                self._mutex.acquire()
 
-        s = self.make_room_for_write(force=(batch is None))
-        self.writer.write_record(batch.serialize())
+            if sync_error:
+                # The state of the log file is indeterminate: the log record we
+                # just added may or may not show up when the db is re-opened.
+                # So we force the db into a mode where all future writes fail.
+                self.record_background_error(s)
+            if write_batch is self._tmp_batch:
+                self._tmp_batch.clear()
 
-        # Write to memtable
-        s = batch.apply(mem_table=self._mem)
+            # Update last sequence number
+            self.versions.set_last_sequence(last_sequence)
 
-        # Update last sequence number
-        self.versions.set_last_sequence(last_sequence)
+        while True:
+            ready = self._writers.popleft()
+            if ready is not w:
+                ready.status = s
+                ready.done = True
+                ready.cv.notify()
+            if ready is last_writer:
+                break
 
+        # Notify new head of write queue
+        if len(self._writers) > 0:
+            self._writers[0].cv.notify()
         return s
 
+    def build_batch_group(self) -> (WriteBatch, WriteRequest):
+        """
+        Merge the batches of the writers at the front of the queue into one batch.
+        REQUIRES: _mutex is held, and the writer at the front has a non-None batch
+        :return: the merged batch, the last writer in the group
+        """
+        first = self._writers[0]
+        result = first.batch
+        assert result is not None
+
+        size = first.batch.size()
+        # Allow the group to grow up to a maximum size, but if the
+        # original write is small, limit the growth so we do not slow
+        # down the small write too much.
+        max_size = MAX_WRITE_GROUP_SIZE
+        if size <= SMALL_WRITE_SIZE:
+            max_size = size + SMALL_WRITE_SIZE
+
+        last_writer = first
+        for i in range(1, len(self._writers)):
+            w = self._writers[i]
+            if w.sync and not first.sync:
+                # Do not include a sync write into a batch handled by a non-sync write.
+                break
+            if w.batch is not None:
+                size += w.batch.size()
+                if size > max_size:
+                    # Do not make batch too big
+                    break
+                # Append to result
+                if result is first.batch:
+                    # Switch to temporary batch instead of disturbing caller's batch
+                    result = self._tmp_batch
+                    assert result.count() == 0
+                    result.append(first.batch)
+                result.append(w.batch)
+            last_writer = w
+        return result, last_writer
+
     def new_db(self) -> Status:
         self._logger.info('new db %s' % self._db_name)
         if not os.path.exists(self._db_name):
@@ -199,8 +453,15 @@ class DB:
 
         return Status.OK()
 
-    def recover_log_file(self, log_number: int) -> (Status, int, bool):
-        s = Status.OK()
+    def recover_log_file(self, log_number: int, edit: VersionEdit, executor=None) -> (Status, int, bool):
+        """
+        Replay the log into a memtable, which is written to a level-0 table added to edit
+        whenever it is full and at the end of the log, so the memory used by the recovery is
+        bounded and the log is no longer needed once edit is saved. With only_mem, the log
+        is replayed into the memtable of the db instead.
+        The records are decoded by executor if it is not None, and applied in the log order.
+        :return: status, max sequence number, should_save_manifest
+        """
         max_sequence = 0
         should_save_manifest = False
 
@@ -208,47 +469,150 @@ class DB:
         if not os.path.exists(path):
             return Status.IOError('Log file not exist'), max_sequence, should_save_manifest
 
-        reader = Reader(path)
-        while True:
-            record = reader.read_record()
-            if record is None:
+        # If paranoid_checks is False, the corrupted records are dropped and logged
+        status = Status.OK()
+        reporter = LoggingReporter(self._logger, path, status if self._option.paranoid_checks else None)
+        reader = Reader(path, reporter, log_number=log_number)
+        records = recovery.read_decoded_records(reader, executor, self._option.recovery_workers)
+        mem = self._mem if self._option.only_mem else None
+        s = Status.OK()
+        for record_status, last_seq, entries, record_size in records:
+            if not status.ok():
                 break
-            try:
-                batch = WriteBatch.deserialize(record)
-                assert batch.count() is not None and batch.sequence_number() is not None
-            except Exception as e:
-                return Status.SerdeError(str(e)), max_sequence, should_save_manifest
+            if not record_status.ok():
+                reporter.corruption(record_size, record_status)
+                if not status.ok():
+                    break
+                continue
 
-            last_seq = batch.sequence_number() + batch.count() - 1
-
-            if self._mem is None:
-                self._mem = MemTable()
-
-            s = batch.apply(mem_table=self._mem)
-            if not s.ok():
-                return s, max_sequence, should_save_manifest
+            if mem is None:
+                mem = MemTable()
+            for key, value in entries:
+                mem.add_encoded(key, value)
 
             max_sequence = max(max_sequence, last_seq)
 
+            if not self._option.only_mem and mem.approximate_memory_usage() > self._option.write_buffer_size:
+                should_save_manifest = True
+                with self._mutex:
+                    s = self.write_level0_table(mem, edit)
+                mem = None
+                if not s.ok():
+                    # Reflect errors immediately so that conditions like full
+                    # file-systems cause the DB.open() to fail.
+                    break
+
+        records.close()
         reader.close()
+        if s.ok() and not status.ok():
+            s = status
+
+        if self._option.only_mem:
+            self._mem = mem
+        elif mem is not None and s.ok():
+            # The memtable of the end of the log
+            should_save_manifest = True
+            with self._mutex:
+                s = self.write_level0_table(mem, edit)
 
-        # TODO: schedule to compact the memtable.
-        return Status.OK(), max_sequence, should_save_manifest
+        return s, max_sequence, should_save_manifest
 
     def last_sequence(self) -> int:
         return self.versions.last_sequence()
 
+    def get_snapshot(self) -> Snapshot:
+        """
+        Return a handle to the current DB state. Reads with this snapshot will
+        observe a stable view of the DB, and compactions keep the entries
+        visible to it until release_snapshot is called.
+        """
+        with self._mutex:
+            return self._snapshots.new(self.versions.last_sequence())
+
+    def release_snapshot(self, snapshot: Snapshot):
+        with self._mutex:
+            self._snapshots.delete(snapshot)
+
+    def get_property(self, name: str) -> str:
+        """
+        Return the value of a db property, or None if the property is unknown.
+        Valid property names include:
+            'spadgerdb.num-files-at-level<N>': the number of files at level <N>
+            'spadgerdb.block-cache-hits': the number of data block lookups served by the block cache
+            'spadgerdb.block-cache-misses': the number of data block lookups missing the block cache
+            'spadgerdb.block-cache-usage': the total size in bytes of the blocks in the block cache
+            'spadgerdb.wal-sync-micros': the histogram of the latencies of the log syncs of sync writes
+            'spadgerdb.wal-background-sync-micros': the histogram of the latencies of the background
+                log syncs, see DBOption.wal_bytes_per_sync
+        """
+        prefix = 'spadgerdb.'
+        if not name.startswith(prefix):
+            return None
+        name = name[len(prefix):]
+
+        if name.startswith('num-files-at-level'):
+            level = name[len('num-files-at-level'):]
+            if not level.isdigit() or int(level) >= MAX_NUM_LEVEL:
+                return None
+            with self._mutex:
+                return str(self.versions.num_level_files(int(level)))
+        elif name == 'block-cache-hits':
+            return str(self._block_cache.hits())
+        elif name == 'block-cache-misses':
+            return str(self._block_cache.misses())
+        elif name == 'block-cache-usage':
+            return str(self._block_cache.total_charge())
+        elif name == 'wal-sync-micros':
+            return str(self._wal_sync_histogram)
+        elif name == 'wal-background-sync-micros':
+            return str(self._wal_background_sync_histogram)
+        return None
+
     def close(self):
+        # Wait for background work to finish
+        with self._mutex:
+            self._shutting_down = True
+            while self._background_compaction_scheduled:
+                self._background_work_finished_signal.wait()
+            # A compaction finishing while reads still used its inputs could not delete them
+            self.delete_obsolete_files()
+
         if self.writer and not self.writer.closed():
             self.writer.close()
 
         if self.versions:
             self.versions.close()
 
+        # The tables still used by iterators are closed with their last iterator
+        self._table_cache.close()
+
     def log_number(self) -> int:
         return self._log_file_num
 
+    def new_log_writer(self, log_number: int) -> Writer:
+        """
+        Create the log file of log_number, reusing the file of a recycled log if any.
+        The logs are written in the recyclable format if recycling is enabled.
+        """
+        path = log_file_name(self._db_name, log_number)
+        reuse = False
+        if self._option.recycle_log_file_num <= 0:
+            log_number = None
+        elif self._recycled_logs:
+            old_number = self._recycled_logs.popleft()
+            self._logger.info('reuse log %s for log %s' % (old_number, log_number))
+            os.rename(log_file_name(self._db_name, old_number), path)
+            reuse = True
+        return Writer(path, log_number, reuse, self._option.log_preallocate_size, self._option.wal_bytes_per_sync,
+                      self._wal_sync_histogram, self._wal_background_sync_histogram)
+
     def make_room_for_write(self, force: bool) -> Status:
+        """
+        Make sure there is room in the memtable for the next write.
+        If the memtable is full while the previous one is still being flushed,
+        wait for the background flush to finish.
+        REQUIRES: _mutex is held
+        """
         if self._mem is None:
             # New memtable
             self._mem = MemTable()
@@ -258,34 +622,478 @@ class DB:
             if self.writer:
                 self.writer.close()
             self._log_file_num = self.versions.new_file_number()
-            self.writer = Writer(log_file_name(self._db_name, self._log_file_num))
+            self.writer = self.new_log_writer(self._log_file_num)
 
         if self._option.only_mem:
             return Status.OK()
 
-        if self._mem.approximate_memory_usage() < self._option.write_buffer_size:
-            # There is room for writing, we do not need to force
-            return Status.OK()
-        elif self._imm is not None:
-            # We have filled up the current memtable, but the previous one is not
-            # being compacted, so we can wait for the previous one to be compacted.
-            # TODO: At this time, we raise an exception.
-            raise Exception('imm is not None')
+        allow_delay = not force
+        while True:
+            if not self._bg_error.ok():
+                # Yield previous error
+                return self._bg_error
+            elif allow_delay and self.versions.num_level_files(0) >= L0_SLOWDOWN_WRITES_TRIGGER:
+                # We are getting close to hitting a hard limit on the number of
+                # L0 files. Rather than delaying a single write by several
+                # seconds when we hit the hard limit, start delaying each
+                # individual write by 1ms to reduce latency variance. Also,
+                # this delay hands over some CPU to the compaction thread in
+                # case it is sharing the same core as the writer.
+                self._mutex.release()
+                time.sleep(0.001)
+                self._mutex.acquire()
+                # Do not delay a single write more than once
+                allow_delay = False
+            elif not force and self._mem.approximate_memory_usage() < self._option.write_buffer_size:
+                # There is room in current memtable
+                return Status.OK()
+            elif self._imm is not None:
+                # We have filled up the current memtable, but the previous
+                # one is still being flushed, so we wait.
+                self._logger.info('current memtable full; waiting...')
+                self._background_work_finished_signal.wait()
+            elif self.versions.num_level_files(0) >= L0_STOP_WRITES_TRIGGER:
+                # There are too many level-0 files.
+                self._logger.info('too many L0 files; waiting...')
+                self._background_work_finished_signal.wait()
+            else:
+                # Attempt to switch to a new memtable and trigger flush of old
+                try:
+                    new_log_number = self.versions.new_file_number()
+                    writer = self.new_log_writer(new_log_number)
+                except Exception as e:
+                    return Status.IOError(str(e))
+                self._logger.info('switch to a new memtable')
+                self.writer.close()
+                self.writer = writer
+                self._log_file_num = new_log_number
+                self._imm = self._mem
+                self._has_imm = True
+                self._mem = MemTable()
+                # Do not force another switch
+                force = False
+                self.maybe_schedule_compaction()
+
+    def maybe_schedule_compaction(self):
+        """
+        Start a background thread to flush the immutable memtable if needed.
+        REQUIRES: _mutex is held
+        """
+        if self._background_compaction_scheduled:
+            # Already scheduled
+            pass
+        elif self._shutting_down:
+            # DB is being deleted; no more background compactions
+            pass
+        elif not self._bg_error.ok():
+            # Already got an error; no more changes
+            pass
+        elif self._imm is None and not self.versions.needs_compaction():
+            # No work to be done
+            pass
         else:
-            # Switch to a new memtable
-            self._logger.info("switch to a new memtable")
-            self._imm = self._mem
-            self._mem = MemTable()
-            self._has_imm = True
-            self._logger = self.versions.new_file_number()
-            self.writer.close()
-            self.writer = Writer(log_file_name(self._db_name, self._log_file_num))
+            self._background_compaction_scheduled = True
+            threading.Thread(target=self._background_call, daemon=True).start()
+
+    def _background_call(self):
+        with self._mutex:
+            assert self._background_compaction_scheduled
+            if self._shutting_down:
+                # No more background work when shutting down.
+                pass
+            elif not self._bg_error.ok():
+                # No more background work after a background error.
+                pass
+            else:
+                self.background_compaction()
+
+            self._background_compaction_scheduled = False
+
+            # Previous compaction may have produced too many files in a level,
+            # so reschedule another compaction if needed.
             self.maybe_schedule_compaction()
-            return Status.OK()
+            self._background_work_finished_signal.notify_all()
 
-    def maybe_schedule_compaction(self):
-        # TODO
-        pass
+    def background_compaction(self):
+        """
+        REQUIRES: _mutex is held
+        """
+        if self._imm is not None:
+            self.compact_mem_table()
+            return
+
+        c = self.versions.pick_compaction()
+        s = Status.OK()
+        if c is None:
+            # Nothing to do
+            pass
+        elif c.is_trivial_move():
+            # Move file to next level
+            assert c.num_input_files(0) == 1
+            f = c.input(0, 0)
+            c.edit.remove_file(c.level(), f.number)
+            c.edit.add_file(c.level() + 1, f.number, f.file_size, f.smallest_key, f.greatest_key)
+            s = self.versions.log_and_apply(c.edit, self._mutex)
+            if not s.ok():
+                self.record_background_error(s)
+            self._logger.info('moved #%d to level-%d %d bytes %s: %s' % (
+                f.number, c.level() + 1, f.file_size, s, self.versions.level_summary()))
+        else:
+            compact = CompactionState(c)
+            s = self.do_compaction_work(compact)
+            if not s.ok():
+                self.record_background_error(s)
+            self.cleanup_compaction(compact)
+
+        if c is not None:
+            c.release_inputs()
+            # The inputs are only obsolete once their version is released, and the
+            # edit may have rolled the manifest over
+            self.delete_obsolete_files()
+
+        if s.ok():
+            # Done
+            pass
+        elif self._shutting_down:
+            # Ignore compaction errors found during shutting down
+            pass
+        else:
+            self._logger.error('compaction error: %s' % s)
+
+    def cleanup_compaction(self, compact: CompactionState):
+        """
+        REQUIRES: _mutex is held
+        """
+        if compact.builder is not None:
+            # May happen if we get a shutdown call in the middle of compaction
+            compact.builder.abandon()
+            compact.outfile.close()
+            compact.builder = None
+            compact.outfile = None
+        for out in compact.outputs:
+            self._pending_outputs.discard(out.number)
+            if not compact.logged:
+                # The compaction failed or was aborted by a shutdown before its outputs were
+                # installed, so delete them even if a background error stops delete_obsolete_files.
+                self._delete_table_file(out.number)
+
+    def _delete_table_file(self, number: int):
+        """
+        Delete the table file of number, which no version refers to.
+        REQUIRES: _mutex is held
+        """
+        self._table_cache.evict(number)
+        path = table_file_name(self._db_name, number)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self._logger.warning('failed to delete %s: %s' % (path, e))
+
+    def open_compaction_output_file(self, compact: CompactionState) -> Status:
+        assert compact.builder is None
+        with self._mutex:
+            file_number = self.versions.new_file_number()
+            self._pending_outputs.add(file_number)
+            compact.outputs.append(CompactionState.Output(file_number))
+
+        # Make the output file
+        try:
+            compact.outfile = open(table_file_name(self._db_name, file_number), 'wb')
+        except Exception as e:
+            return Status.IOError(str(e))
+        compact.builder = TableBuilder(self._option, compact.outfile)
+        return Status.OK()
+
+    def finish_compaction_output_file(self, compact: CompactionState, input_iterator) -> Status:
+        assert compact.outfile is not None
+        assert compact.builder is not None
+
+        output_number = compact.current_output().number
+        assert output_number != 0
+
+        # Check for iterator errors
+        s = input_iterator.status()
+        current_entries = compact.builder.num_entries()
+        if s.ok():
+            s = compact.builder.finish()
+        else:
+            compact.builder.abandon()
+        current_bytes = compact.builder.file_size()
+        compact.current_output().file_size = current_bytes
+        compact.total_bytes += current_bytes
+        compact.builder = None
+
+        # Finish and check for file errors
+        try:
+            if s.ok():
+                compact.outfile.flush()
+                os.fsync(compact.outfile.fileno())
+            compact.outfile.close()
+        except Exception as e:
+            if s.ok():
+                s = Status.IOError(str(e))
+        compact.outfile = None
+
+        if s.ok() and current_entries > 0:
+            self._logger.info('generated table #%d@%d: %d keys, %d bytes' % (
+                output_number, compact.compaction.level(), current_entries, current_bytes))
+        return s
+
+    def install_compaction_results(self, compact: CompactionState) -> Status:
+        """
+        REQUIRES: _mutex is held
+        """
+        c = compact.compaction
+        self._logger.info('compacted %d@%d + %d@%d files => %d bytes' % (
+            c.num_input_files(0), c.level(), c.num_input_files(1), c.level() + 1, compact.total_bytes))
+
+        # Add compaction outputs
+        c.add_input_deletions(c.edit)
+        level = c.level()
+        for out in compact.outputs:
+            c.edit.add_file(level + 1, out.number, out.file_size, out.smallest_key, out.greatest_key)
+        compact.logged = True
+        return self.versions.log_and_apply(c.edit, self._mutex)
+
+    def do_compaction_work(self, compact: CompactionState) -> Status:
+        """
+        Merge the inputs of the compaction into new files of level+1,
+        dropping the entries which are invisible to every snapshot.
+        REQUIRES: _mutex is held
+        """
+        c = compact.compaction
+        self._logger.info('compacting %d@%d + %d@%d files' % (
+            c.num_input_files(0), c.level(), c.num_input_files(1), c.level() + 1))
+
+        assert self.versions.num_level_files(c.level()) > 0
+        assert compact.builder is None
+        assert compact.outfile is None
+        if self._snapshots.empty():
+            compact.smallest_snapshot = self.versions.last_sequence()
+        else:
+            compact.smallest_snapshot = self._snapshots.oldest().get_sequence_number()
+
+        input_iterator = self.versions.make_input_iterator(c)
+
+        # Release mutex while we're actually doing the compaction work
+        self._mutex.release()
+
+        s = Status.OK()
+        input_iterator.seek_to_first()
+        current_user_key = None
+        last_sequence_for_key = MAX_SEQUENCE_NUMBER
+        try:
+            while input_iterator.valid() and not self._shutting_down:
+                # Prioritize immutable compaction work
+                if self._has_imm:
+                    with self._mutex:
+                        if self._imm is not None:
+                            self.compact_mem_table()
+                            # Wake up make_room_for_write if necessary
+                            self._background_work_finished_signal.notify_all()
+
+                key = input_iterator.key()
+                if c.should_stop_before(key) and compact.builder is not None:
+                    s = self.finish_compaction_output_file(compact, input_iterator)
+                    if not s.ok():
+                        break
+
+                # Handle key/value, add to state, etc.
+                drop = False
+                if len(key) < 8:
+                    # Do not hide error keys
+                    current_user_key = None
+                    last_sequence_for_key = MAX_SEQUENCE_NUMBER
+                else:
+                    user_key = InternalKey.extract_user_key(key)
+                    sequence = InternalKey.extract_sequence(key)
+                    if current_user_key is None or user_key != current_user_key:
+                        # First occurrence of this user key
+                        current_user_key = user_key
+                        last_sequence_for_key = MAX_SEQUENCE_NUMBER
+
+                    if last_sequence_for_key <= compact.smallest_snapshot:
+                        # Hidden by a newer entry for same user key
+                        drop = True
+                    elif key[-1] == ValueType.kTypeDeletion.value and \
+                            sequence <= compact.smallest_snapshot and \
+                            c.is_base_level_for_key(user_key):
+                        # For this user key:
+                        # (1) there is no data in higher levels
+                        # (2) data in lower levels will have larger sequence numbers
+                        # (3) data in layers that are being compacted here and have
+                        #     smaller sequence numbers will be dropped in the next
+                        #     few iterations of this loop (by rule (A) above).
+                        # Therefore this deletion marker is obsolete and can be dropped.
+                        drop = True
+
+                    last_sequence_for_key = sequence
+
+                if not drop:
+                    # Open output file if necessary
+                    if compact.builder is None:
+                        s = self.open_compaction_output_file(compact)
+                        if not s.ok():
+                            break
+                    if compact.builder.num_entries() == 0:
+                        compact.current_output().smallest_key = bytes(key)
+                    compact.current_output().greatest_key = bytes(key)
+                    compact.builder.add(key, input_iterator.value())
+
+                    # Close output file if it is big enough
+                    if compact.builder.file_size() >= c.max_output_file_size():
+                        s = self.finish_compaction_output_file(compact, input_iterator)
+                        if not s.ok():
+                            break
+
+                input_iterator.next()
+
+            if s.ok() and self._shutting_down:
+                s = Status.IOError('deleting DB during compaction')
+            if s.ok() and compact.builder is not None:
+                s = self.finish_compaction_output_file(compact, input_iterator)
+            if s.ok():
+                s = input_iterator.status()
+        finally:
+            del input_iterator
+            self._mutex.acquire()
+
+        if s.ok():
+            s = self.install_compaction_results(compact)
+        self._logger.info('compacted to: %s' % self.versions.level_summary())
+        return s
+
+    def record_background_error(self, s: Status):
+        """
+        REQUIRES: _mutex is held
+        """
+        if self._bg_error.ok():
+            self._logger.error('background error: %s' % s)
+            self._bg_error = s
+            self._background_work_finished_signal.notify_all()
+
+    def compact_mem_table(self):
+        """
+        Write the immutable memtable to a level-0 table, and install the new
+        version which no longer needs the log files of the memtable.
+        REQUIRES: _mutex is held
+        """
+        assert self._imm is not None
+
+        edit = VersionEdit()
+        s = self.write_level0_table(self._imm, edit)
+
+        if s.ok() and self._shutting_down:
+            s = Status.IOError('deleting DB during memtable compaction')
+            # The table is not referenced by any version
+            for _, f in edit.new_files:
+                self._delete_table_file(f.number)
+
+        if s.ok():
+            # Earlier logs are no longer needed
+            edit.set_prev_log_number(0)
+            edit.set_log_number(self._log_file_num)
+            s = self.versions.log_and_apply(edit, self._mutex)
+
+        if s.ok():
+            # Commit to the new state
+            self._imm = None
+            self._has_imm = False
+            self.delete_obsolete_files()
+        else:
+            self.record_background_error(s)
+
+    def write_level0_table(self, mem: MemTable, edit: VersionEdit) -> Status:
+        """
+        REQUIRES: _mutex is held
+        """
+        meta = FileMetaData()
+        meta.number = self.versions.new_file_number()
+        self._pending_outputs.add(meta.number)
+        self._logger.info('level-0 table #%s: started' % meta.number)
+
+        # The memtable is immutable, so the table is built without holding the mutex.
+        self._mutex.release()
+        try:
+            s = build_table(self._db_name, self._option, mem.new_iterator(), meta)
+        finally:
+            self._mutex.acquire()
+
+        self._logger.info('level-0 table #%s: %s bytes %s' % (meta.number, meta.file_size, s))
+        self._pending_outputs.remove(meta.number)
+
+        # Note that if file_size is zero, the file has been deleted and
+        # should not be added to the manifest.
+        if s.ok() and meta.file_size > 0:
+            edit.add_file(0, meta.number, meta.file_size, meta.smallest_key, meta.greatest_key)
+        return s
+
+    def _recycle_log(self, number: int) -> bool:
+        """
+        Keep the obsolete log file to be reused if there is room for it.
+        Only the files of recyclable logs can be reused.
+        REQUIRES: _mutex is held
+        """
+        if number in self._recycled_logs:
+            return True
+        if len(self._recycled_logs) >= self._option.recycle_log_file_num:
+            return False
+        try:
+            with open(log_file_name(self._db_name, number), 'rb') as f:
+                version, _ = log_format.decode_header(f.read(log_format.HEADER_SIZE))
+        except OSError:
+            return False
+        if version != log_format.RECYCLABLE_VERSION:
+            return False
+        self._logger.info('recycle log %s' % number)
+        self._recycled_logs.append(number)
+        return True
+
+    def delete_obsolete_files(self):
+        """
+        Delete log files, table files and manifests which are no longer referenced.
+        REQUIRES: _mutex is held
+        """
+        if not self._bg_error.ok():
+            # After a background error, we don't know whether a new version may
+            # or may not have been committed, so we cannot safely garbage collect.
+            return
+
+        live = set(self._pending_outputs)
+        self.versions.add_live_files(live)
+
+        for name in os.listdir(self._db_name):
+            keep = True
+            if name.endswith('.log'):
+                number = int(name[:-4])
+                keep = number >= self.versions.log_number() or number == self.versions.prev_log_number()
+            elif name.endswith('.sst'):
+                number = int(name[:-4])
+                keep = number in live
+            elif name.endswith('.dbtmp'):
+                # Any temp file of the current file is left by a crash, but the one
+                # of the manifest being created
+                number = int(name[:-len('.dbtmp')])
+                keep = number >= self.versions.manifest_file_number()
+            elif name.endswith('.manifest'):
+                number = int(name[:-len('.manifest')])
+                # Keep the manifest named by the current file, and any newer manifest
+                # which may be being written
+                keep = number >= self.versions.live_manifest_file_number()
+
+            if not keep and name.endswith('.log') and self._recycle_log(number):
+                keep = True
+
+            if not keep:
+                if name.endswith('.sst'):
+                    self._table_cache.evict(number)
+                self._logger.info('delete obsolete file %s' % name)
+                try:
+                    os.remove(os.path.join(self._db_name, name))
+                except OSError as e:
+                    self._logger.warning('failed to delete %s: %s' % (name, e))
 
 
 
@@ -0,0 +1,300 @@
+"""
+A micro benchmark of spadgerdb, in the spirit of leveldb's db_bench.
+
+Usage:
+    python db_bench.py [--benchmarks=fillseq,readrandom] [--num=N] [--value_size=N] [--db=path]
+                       [--wal_bytes_per_sync=N] [--histogram=0|1]
+
+Benchmarks:
+    fillseq       -- write N values in sequential key order
+    fillrandom    -- write N values in random key order
+    fillbatch     -- write N values in sequential key order, 1000 per batch
+    fillsync      -- write N/100 values in random key order, syncing the log after every write
+    readrandom    -- read N times in random order
+    readmissing   -- read N missing keys in random order
+    readseq       -- read N times sequentially with an iterator
+    memtable_add  -- add N entries to a memtable
+    memtable_get  -- read N times in random order from a memtable
+    writebatch    -- serialize and deserialize batches of N/10, N and 10*N entries
+    readlog       -- read a log of N single put batches with checksums
+    recover       -- reopen a db whose log holds N puts, replaying the log into the memtable
+    findfile      -- look up N keys among the max(N, 10000) files of a level, with find_file
+                     and Version.get, without reading any table
+"""
+import os
+import random
+import shutil
+import sys
+import time
+
+from db import DB
+from dbformat import InternalKey, LookupKey, MAX_SEQUENCE_NUMBER, ValueType
+from log_reader import Reader
+from log_writer import Writer
+from memtable import MemTable
+from option import DBOption, ReadOption, WriteOption
+from status import Status
+from utils import log_file_name
+from version_edit import VersionEdit
+from version_set import Version, VersionBuilder, VersionSet, find_file
+from write_batch import WriteBatch
+
+DEFAULT_BENCHMARKS = 'fillseq,fillrandom,fillbatch,fillsync,readrandom,readmissing,readseq,memtable_add,memtable_get,' \
+                     'writebatch,readlog,recover,findfile'
+
+
+class Benchmark:
+    def __init__(self, num: int, value_size: int, db_name: str, wal_bytes_per_sync: int = 0,
+                 histogram: bool = False):
+        self._num = num
+        self._value_size = value_size
+        self._db_name = db_name
+        self._wal_bytes_per_sync = wal_bytes_per_sync
+        # Print the histograms of the log syncs after the fill benchmarks
+        self._histogram = histogram
+        self._db: DB = None
+        self._value = 'x' * value_size
+        self._mem: MemTable = None
+        # Set by the benchmarks processing bytes, to report a throughput
+        self._bytes = 0
+        self._start = 0.0
+
+    def run(self, benchmarks):
+        print(f'Keys:       16 bytes each')
+        print(f'Values:     {self._value_size} bytes each')
+        print(f'Entries:    {self._num}')
+        print('-' * 48)
+        for name in benchmarks:
+            method = getattr(self, name, None)
+            if method is None or name.startswith('_') or name == 'run':
+                print(f'unknown benchmark \'{name}\'', file=sys.stderr)
+                continue
+            if name.startswith('fill') or self._db is None and name.startswith('read'):
+                self._open(fresh=name.startswith('fill'))
+            self._bytes = 0
+            self._start = time.perf_counter()
+            done = method()
+            elapsed = time.perf_counter() - self._start
+            rate = f'; {self._bytes / 1048576 / elapsed:8.1f} MB/s' if self._bytes else ''
+            print(f'{name:<14}: {elapsed * 1e6 / max(done, 1):11.3f} micros/op; {done / elapsed:10.0f} ops/sec{rate}')
+            if self._histogram and name.startswith('fill'):
+                for prop in ('wal-sync-micros', 'wal-background-sync-micros'):
+                    print(f'{prop}:\n{self._db.get_property("spadgerdb." + prop)}')
+        self._close()
+
+    def _open(self, fresh: bool):
+        self._close()
+        if fresh:
+            shutil.rmtree(self._db_name, ignore_errors=True)
+        option = DBOption()
+        option.create_if_missing = True
+        option.wal_bytes_per_sync = self._wal_bytes_per_sync
+        self._db, s = DB.open(self._db_name, option)
+        if not s.ok():
+            raise RuntimeError(f'open error: {s}')
+
+    def _reset_timer(self):
+        # Exclude the setup of a benchmark from its time
+        self._start = time.perf_counter()
+
+    def _close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _key(self, i: int) -> str:
+        return f'{i:016d}'
+
+    def _write(self, keys, entries_per_batch: int = 1, sync: bool = False) -> int:
+        option = WriteOption()
+        option.sync = sync
+        for i in range(0, len(keys), entries_per_batch):
+            batch = WriteBatch()
+            for k in keys[i:i + entries_per_batch]:
+                batch.put(k, self._value)
+            s = self._db.write(option, batch)
+            if not s.ok():
+                raise RuntimeError(f'put error: {s}')
+        return len(keys)
+
+    def fillseq(self) -> int:
+        return self._write([self._key(i) for i in range(self._num)])
+
+    def fillrandom(self) -> int:
+        return self._write([self._key(random.randrange(self._num)) for _ in range(self._num)])
+
+    def fillbatch(self) -> int:
+        return self._write([self._key(i) for i in range(self._num)], 1000)
+
+    def fillsync(self) -> int:
+        return self._write([self._key(random.randrange(self._num)) for _ in range(self._num // 100)], sync=True)
+
+    def readrandom(self) -> int:
+        option = ReadOption()
+        found = 0
+        for _ in range(self._num):
+            value = []
+            if self._db.get(option, self._key(random.randrange(self._num)), value).ok():
+                found += 1
+        print(f'({found} of {self._num} found)')
+        return self._num
+
+    def readmissing(self) -> int:
+        option = ReadOption()
+        for _ in range(self._num):
+            value = []
+            s = self._db.get(option, self._key(random.randrange(self._num)) + '.', value)
+            assert s == Status.NotFound()
+        return self._num
+
+    def readseq(self) -> int:
+        done = 0
+        with self._db.new_iterator(ReadOption()) as it:
+            it.seek_to_first()
+            while it.valid() and done < self._num:
+                done += 1
+                it.next()
+        return done
+
+    def memtable_add(self) -> int:
+        self._mem = MemTable()
+        for i in range(self._num):
+            self._mem.add(i + 1, self._key(random.randrange(self._num)), self._value, ValueType.kTypeValue)
+        return self._num
+
+    def memtable_get(self) -> int:
+        if self._mem is None:
+            self.memtable_add()
+        sequence = self._num + 1
+        for _ in range(self._num):
+            value = []
+            self._mem.get(LookupKey(self._key(random.randrange(self._num)), sequence), value, Status.NotFound())
+        return self._num
+
+    def writebatch(self) -> int:
+        # The time per entry should not grow with the size of the batch
+        done = 0
+        for n in (max(self._num // 10, 1), self._num, self._num * 10):
+            batch = WriteBatch()
+            for i in range(n):
+                batch.put(self._key(i), self._value)
+            batch.set_sequence_number(1)
+            start = time.perf_counter()
+            data = batch.serialize()
+            middle = time.perf_counter()
+            WriteBatch.deserialize(data)
+            end = time.perf_counter()
+            print(f'  {n:>8} entries: serialize {(middle - start) * 1e6 / n:.3f} micros/entry, '
+                  f'deserialize {(end - middle) * 1e6 / n:.3f} micros/entry')
+            done += 2 * n
+        return done
+
+    def readlog(self) -> int:
+        log_name = self._db_name + '.log'
+        writer = Writer(log_name)
+        for i in range(self._num):
+            batch = WriteBatch()
+            batch.put(self._key(i), self._value)
+            writer.write_record(batch.serialize())
+        writer.close()
+        self._reset_timer()
+
+        reader = Reader(log_name)
+        done = 0
+        while reader.read_record() is not None:
+            done += 1
+        self._bytes = os.path.getsize(log_name)
+        os.remove(log_name)
+        return done
+
+    def recover(self) -> int:
+        # Keep all the writes in the log
+        self._close()
+        shutil.rmtree(self._db_name, ignore_errors=True)
+        option = DBOption()
+        option.create_if_missing = True
+        option.write_buffer_size = 1 << 40
+        self._db, s = DB.open(self._db_name, option)
+        if not s.ok():
+            raise RuntimeError(f'open error: {s}')
+        self._write([self._key(i) for i in range(self._num)])
+        log_size = os.path.getsize(log_file_name(self._db_name, self._db.log_number()))
+        self._close()
+        self._reset_timer()
+
+        self._db, s = DB.open(self._db_name, option)
+        if not s.ok():
+            raise RuntimeError(f'open error: {s}')
+        self._bytes = log_size
+        return self._num
+
+    def findfile(self) -> int:
+        # File i holds the keys from key(2i) to key(2i) + '~', so the odd keys fall
+        # between two files and Version.get finds their file without reading it.
+        num_files = max(self._num, 10000)
+        vs = VersionSet(self._db_name, DBOption())
+        edit = VersionEdit()
+        for i in range(num_files):
+            key = self._key(2 * i).encode('utf-8')
+            edit.add_file(1, i + 1, 2 * 1024 * 1024, InternalKey.make(key, 1, ValueType.kTypeValue),
+                          InternalKey.make(key + b'~', 1, ValueType.kTypeValue))
+        builder = VersionBuilder(vs, vs.current())
+        builder.apply(edit)
+        v = Version(vs)
+        builder.build(v)
+        files = v.files[1]
+        greatest_keys = v.greatest_keys[1]
+        lkeys = [LookupKey(self._key(2 * random.randrange(num_files) + 1), MAX_SEQUENCE_NUMBER)
+                 for _ in range(self._num)]
+        ikeys = [bytes(lkey.internal_key()) for lkey in lkeys]
+        self._reset_timer()
+
+        option = ReadOption()
+        start = time.perf_counter()
+        for ikey in ikeys:
+            find_file(files, ikey)
+        compared = time.perf_counter()
+        for ikey in ikeys:
+            find_file(files, ikey, greatest_keys)
+        indexed = time.perf_counter()
+        for lkey in lkeys:
+            value = []
+            s = v.get(option, lkey, value)
+            assert s == Status.NotFound()
+        end = time.perf_counter()
+        print(f'  {num_files} files: find_file {(compared - start) * 1e6 / self._num:.3f} micros/key, '
+              f'find_file with greatest_keys {(indexed - compared) * 1e6 / self._num:.3f} micros/key, '
+              f'Version.get {(end - indexed) * 1e6 / self._num:.3f} micros/key')
+        return 3 * self._num
+
+
+def main(argv):
+    benchmarks = DEFAULT_BENCHMARKS
+    num = 10000
+    value_size = 100
+    db_name = 'tmp_dbbench'
+    wal_bytes_per_sync = 0
+    histogram = False
+    for arg in argv:
+        if arg.startswith('--benchmarks='):
+            benchmarks = arg[len('--benchmarks='):]
+        elif arg.startswith('--num='):
+            num = int(arg[len('--num='):])
+        elif arg.startswith('--value_size='):
+            value_size = int(arg[len('--value_size='):])
+        elif arg.startswith('--db='):
+            db_name = arg[len('--db='):]
+        elif arg.startswith('--wal_bytes_per_sync='):
+            wal_bytes_per_sync = int(arg[len('--wal_bytes_per_sync='):])
+        elif arg.startswith('--histogram='):
+            histogram = arg[len('--histogram='):] == '1'
+        else:
+            print(f'invalid flag \'{arg}\'', file=sys.stderr)
+            sys.exit(1)
+
+    Benchmark(num, value_size, db_name, wal_bytes_per_sync, histogram).run([b for b in benchmarks.split(',') if b])
+    shutil.rmtree(db_name, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,240 @@
+from db_types import SequenceNumber
+from dbformat import InternalKey, ValueType, MAX_SEQUENCE_NUMBER
+from status import Status
+
+# The value type used when seeking: entries with the same user key and sequence
+# number are ordered by decreasing type, so the largest type is sought first.
+VALUE_TYPE_FOR_SEEK = ValueType.kTypeValue
+
+
+class DBIter:
+    """
+    DBIter iterates over the user keys and values of a db, as of a sequence number.
+
+    The internal iterator yields entries of the form (user_key, seq, type) => value
+    in internal key order. DBIter combines the multiple entries for the same user key
+    into a single entry: entries newer than the sequence number are hidden, only the
+    newest remaining entry of a user key is used, and deleted keys are skipped.
+
+    Keys are in [lower_bound, upper_bound) if the bounds are given.
+    The iterator holds the state the internal iterator depends on, e.g. a version,
+    until close() is called.
+    """
+
+    # Which direction is the iterator currently moving?
+    # (1) When moving forward, the internal iterator is positioned at
+    #     the exact entry that yields key(), value()
+    # (2) When moving backwards, the internal iterator is positioned
+    #     just before all entries whose user key == key().
+    FORWARD = 0
+    REVERSE = 1
+
+    def __init__(self, internal_iter, sequence: SequenceNumber, lower_bound: str = None, upper_bound: str = None,
+                 cleanup=None):
+        """
+        :param internal_iter: a merging iterator over internal keys
+        :param sequence: only the entries with sequence numbers <= sequence are visible
+        :param cleanup: called on close() to release the state of the internal iterator
+        """
+        self._iter = internal_iter
+        self._sequence = sequence
+        self._lower_bound = lower_bound.encode('utf-8') if lower_bound is not None else None
+        self._upper_bound = upper_bound.encode('utf-8') if upper_bound is not None else None
+        self._cleanup = cleanup
+        self._status = Status.OK()
+        # Current key when direction is REVERSE
+        self._saved_key = b''
+        # Current value when direction is REVERSE
+        self._saved_value = b''
+        self._direction = DBIter.FORWARD
+        self._valid = False
+
+    def valid(self) -> bool:
+        return self._valid
+
+    def key(self) -> str:
+        assert self._valid
+        if self._direction == DBIter.FORWARD:
+            return InternalKey.extract_user_key(self._iter.key()).decode('utf-8')
+        return self._saved_key.decode('utf-8')
+
+    def value(self) -> str:
+        assert self._valid
+        if self._direction == DBIter.FORWARD:
+            return self._iter.value().decode('utf-8')
+        return self._saved_value.decode('utf-8')
+
+    def status(self) -> Status:
+        if self._status.ok():
+            return self._iter.status()
+        return self._status
+
+    def next(self):
+        assert self._valid
+
+        if self._direction == DBIter.REVERSE:
+            # Switch directions?
+            self._direction = DBIter.FORWARD
+            # The internal iterator is pointing just before the entries for key(),
+            # so advance into the range of entries for key() and then
+            # use the normal skipping code below.
+            if not self._iter.valid():
+                self._iter.seek_to_first()
+            else:
+                self._iter.next()
+            if not self._iter.valid():
+                self._valid = False
+                self._saved_key = b''
+                return
+            # _saved_key already contains the key to skip past.
+        else:
+            # Store in _saved_key the current key so we skip it below.
+            self._saved_key = bytes(InternalKey.extract_user_key(self._iter.key()))
+
+            self._iter.next()
+            if not self._iter.valid():
+                self._valid = False
+                self._saved_key = b''
+                return
+
+        self._find_next_user_entry(True, self._saved_key)
+
+    def _find_next_user_entry(self, skipping: bool, skip: bytes):
+        """
+        Loop until we hit an acceptable entry to yield.
+        """
+        assert self._iter.valid()
+        assert self._direction == DBIter.FORWARD
+        while True:
+            ikey = self._iter.key()
+            user_key = InternalKey.extract_user_key(ikey)
+            if self._upper_bound is not None and user_key >= self._upper_bound:
+                break
+            if InternalKey.extract_sequence(ikey) <= self._sequence:
+                value_type = InternalKey.extract_value_type(ikey)
+                if value_type == ValueType.kTypeDeletion:
+                    # Arrange to skip all upcoming entries for this key since
+                    # they are hidden by this deletion.
+                    skip = bytes(user_key)
+                    skipping = True
+                elif value_type == ValueType.kTypeValue:
+                    if skipping and user_key <= skip:
+                        # Entry hidden
+                        pass
+                    else:
+                        self._valid = True
+                        self._saved_key = b''
+                        return
+            self._iter.next()
+            if not self._iter.valid():
+                break
+        self._saved_key = b''
+        self._valid = False
+
+    def prev(self):
+        assert self._valid
+
+        if self._direction == DBIter.FORWARD:
+            # Switch directions?
+            # The internal iterator is pointing at the current entry. Scan backwards
+            # until the key changes so we can use the normal reverse scanning code.
+            assert self._iter.valid()
+            self._saved_key = bytes(InternalKey.extract_user_key(self._iter.key()))
+            while True:
+                self._iter.prev()
+                if not self._iter.valid():
+                    self._valid = False
+                    self._saved_key = b''
+                    self._saved_value = b''
+                    return
+                if InternalKey.extract_user_key(self._iter.key()) < self._saved_key:
+                    break
+            self._direction = DBIter.REVERSE
+
+        self._find_prev_user_entry()
+
+    def _find_prev_user_entry(self):
+        assert self._direction == DBIter.REVERSE
+
+        value_type = ValueType.kTypeDeletion
+        if self._iter.valid():
+            while True:
+                ikey = self._iter.key()
+                user_key = InternalKey.extract_user_key(ikey)
+                if self._lower_bound is not None and user_key < self._lower_bound:
+                    break
+                if InternalKey.extract_sequence(ikey) <= self._sequence:
+                    if value_type != ValueType.kTypeDeletion and user_key < self._saved_key:
+                        # We encountered a non-deleted value in entries for previous keys.
+                        break
+                    value_type = InternalKey.extract_value_type(ikey)
+                    if value_type == ValueType.kTypeDeletion:
+                        self._saved_key = b''
+                        self._saved_value = b''
+                    else:
+                        self._saved_key = bytes(user_key)
+                        self._saved_value = bytes(self._iter.value())
+                self._iter.prev()
+                if not self._iter.valid():
+                    break
+
+        if value_type == ValueType.kTypeDeletion:
+            # End
+            self._valid = False
+            self._saved_key = b''
+            self._saved_value = b''
+            self._direction = DBIter.FORWARD
+        else:
+            self._valid = True
+
+    def seek(self, target: str):
+        """
+        Position at the first key that is at or past target and in the bounds.
+        """
+        self._direction = DBIter.FORWARD
+        self._saved_value = b''
+        self._saved_key = target.encode('utf-8')
+        if self._lower_bound is not None and self._saved_key < self._lower_bound:
+            self._saved_key = self._lower_bound
+        self._iter.seek(InternalKey.make(self._saved_key, self._sequence, VALUE_TYPE_FOR_SEEK))
+        if self._iter.valid():
+            self._find_next_user_entry(False, self._saved_key)
+        else:
+            self._valid = False
+
+    def seek_to_first(self):
+        if self._lower_bound is not None:
+            self.seek(self._lower_bound.decode('utf-8'))
+            return
+        self._direction = DBIter.FORWARD
+        self._saved_value = b''
+        self._iter.seek_to_first()
+        if self._iter.valid():
+            self._find_next_user_entry(False, self._saved_key)
+        else:
+            self._valid = False
+
+    def seek_to_last(self):
+        self._direction = DBIter.REVERSE
+        self._saved_value = b''
+        if self._upper_bound is not None:
+            # Position at the last entry before upper_bound
+            self._iter.seek(InternalKey.make(self._upper_bound, MAX_SEQUENCE_NUMBER, VALUE_TYPE_FOR_SEEK))
+            if self._iter.valid():
+                self._iter.prev()
+            else:
+                self._iter.seek_to_last()
+        else:
+            self._iter.seek_to_last()
+        self._find_prev_user_entry()
+
+    def close(self):
+        if self._cleanup is not None:
+            self._cleanup()
+            self._cleanup = None
+
+    def __enter__(self) -> 'DBIter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
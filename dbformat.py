@@ -1,8 +1,12 @@
 from enum import Enum
+from coding import encode_varint32, get_varint32
 from db_types import SequenceNumber
 
 byte_order = 'little'
 
+# The largest sequence number which can be encoded in 7 bytes
+MAX_SEQUENCE_NUMBER = (1 << 56) - 1
+
 
 class ValueType(Enum):
     kTypeDeletion = 0
@@ -53,7 +57,7 @@ class Encoder:
         """
 
         Encode Format:
-        |<internal_key_size>|<internal_key>|<value_size>|<value>|
+        |<internal_key_size: varint32>|<internal_key>|<value_size: varint32>|<value>|
 
         Args:
             s (SequenceNumber): 
@@ -65,21 +69,23 @@ class Encoder:
             bytearray: memtable_key
         """
         internal_key_bytes = Encoder.encode_user_key_sequence_type(key, s, t)
-        encoded_len = 4 + len(internal_key_bytes) + 4 + len(value)
-        buf = bytearray(int(len(internal_key_bytes)).to_bytes(4, byte_order))
+        value_bytes = value.encode('utf-8')
+        buf = bytearray(encode_varint32(len(internal_key_bytes)))
         buf.extend(internal_key_bytes)
-        buf.extend(int(len(value)).to_bytes(4, byte_order))
-        buf.extend(value.encode('utf-8'))
-        assert len(buf) == encoded_len
+        buf.extend(encode_varint32(len(value_bytes)))
+        buf.extend(value_bytes)
 
         return buf
 
 
 class Decoder:
+    """
+    Decode the fields of a memtable key, see Encoder.encode_full_memtable_key.
+    """
 
     @staticmethod
     def decode_internal_size_from_memtable_key(mkey: bytearray) -> int:
-        return int.from_bytes(mkey[:4], byte_order)
+        return get_varint32(mkey)[0]
 
     @staticmethod
     def decode_user_size_from_memtable_key(mkey: bytearray) -> int:
@@ -87,31 +93,36 @@ class Decoder:
 
     @staticmethod
     def decode_user_key_from_memtable_key(mkey: bytearray) -> str:
-        return mkey[4: 4 + Decoder.decode_user_size_from_memtable_key(mkey)].decode('utf-8')
+        internal_size, start = get_varint32(mkey)
+        return mkey[start: start + internal_size - 8].decode('utf-8')
 
     @staticmethod
     def decode_tag_from_memtable_key(mkey: bytearray) -> bytes:
-        start = 4 + Decoder.decode_user_size_from_memtable_key(mkey)
+        internal_size, start = get_varint32(mkey)
+        start += internal_size - 8
         return mkey[start: start + 8]
 
     @staticmethod
     def decode_value_from_memtable_key(mkey: bytearray) -> str:
-        start = 4 + Decoder.decode_user_size_from_memtable_key(mkey) + 8 + 4
-        return mkey[start:].decode('utf-8')
+        internal_size, start = get_varint32(mkey)
+        value_size, start = get_varint32(mkey, start + internal_size)
+        return mkey[start: start + value_size].decode('utf-8')
 
 
 class LookupKey:
     def __init__(self, user_key: str, sequence: SequenceNumber):
+        user_key = user_key.encode('utf-8')
         length = len(user_key) + 8  # The length of internal key
-        self._bytes = bytearray(length.to_bytes(4, byte_order))
-        self._bytes.extend(user_key.encode('utf-8'))
+        self._bytes = bytearray(encode_varint32(length))
+        self._kstart = len(self._bytes)
+        self._bytes.extend(user_key)
         self._bytes.extend(Encoder.encode_sequence_and_type(
             sequence, ValueType.kTypeValue))
         """
-        |<length>|<user_key>|<sequence>|<type> |
-        | 4 bytes|<user_key>| 7 bytes  | 1 byte|
-        |<-            memtable key          ->|
-        |        |<-        internal key     ->|
+        |<length> |<user_key>|<sequence>|<type> |
+        | varint32|<user_key>| 7 bytes  | 1 byte|
+        |<-            memtable key           ->|
+        |         |<-        internal key     ->|
         """
 
     def __eq__(self, other):
@@ -124,7 +135,43 @@ class LookupKey:
         return self._bytes
 
     def internal_key(self) -> bytearray:
-        return self._bytes[4:]
+        return self._bytes[self._kstart:]
 
     def user_key(self) -> str:
-        return str(self._bytes[4:-8], 'utf-8')
+        return str(self._bytes[self._kstart:-8], 'utf-8')
+
+    def sort_key(self) -> tuple:
+        return InternalKey.sort_key(self._bytes[self._kstart:])
+
+
+class InternalKey:
+    """
+    Helpers for internal keys without the length prefix used by memtable keys.
+    |<user_key>|<sequence>|<type> |
+    |<user_key>| 7 bytes  | 1 byte|
+    """
+
+    @staticmethod
+    def make(user_key: bytes, seq: SequenceNumber, t: ValueType) -> bytes:
+        return bytes(user_key) + Encoder.encode_sequence_and_type(seq, t)
+
+    @staticmethod
+    def extract_user_key(internal_key: bytes) -> bytes:
+        return internal_key[:-8]
+
+    @staticmethod
+    def extract_sequence(internal_key: bytes) -> SequenceNumber:
+        return int.from_bytes(internal_key[-8:-1], byte_order)
+
+    @staticmethod
+    def extract_value_type(internal_key: bytes) -> ValueType:
+        return ValueType(internal_key[-1])
+
+    @staticmethod
+    def sort_key(internal_key: bytes) -> tuple:
+        """
+        Return a tuple which is ordered in the same way as the internal keys:
+        increasing user key, decreasing sequence number and decreasing type.
+        """
+        packed = (int.from_bytes(internal_key[-8:-1], byte_order) << 8) | internal_key[-1]
+        return bytes(internal_key[:-8]), -packed
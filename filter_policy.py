@@ -0,0 +1,43 @@
+from typing import List
+
+from bloom_filter import BloomFilter
+
+
+class BloomFilterPolicy:
+    """
+    BloomFilterPolicy creates a bloom filter for a set of keys, using
+    approximately bits_per_key bits per key. A good value for bits_per_key
+    is 10, which yields a filter with ~1% false positive rate.
+    """
+
+    def __init__(self, bits_per_key: int):
+        self._bits_per_key = bits_per_key
+        # We intentionally round down to reduce probing cost a little bit
+        # 0.69 =~ ln(2)
+        self._k = int(bits_per_key * 0.69)
+        self._k = max(1, min(30, self._k))
+
+    @staticmethod
+    def name() -> str:
+        return 'spadgerdb.BloomFilter'
+
+    def create_filter(self, keys: List[bytes]) -> bytes:
+        # For small n, we can see a very high false positive rate.
+        # Fix it by enforcing a minimum bloom filter length.
+        bits = max(64, len(keys) * self._bits_per_key)
+        num_bytes = (bits + 7) // 8
+        bf = BloomFilter(size=num_bytes * 8, num_item=self._k)
+        for key in keys:
+            bf.add(key)
+        return bf.to_bytes()
+
+    @staticmethod
+    def key_may_match(key: bytes, bloom_filter: bytes) -> bool:
+        bf = BloomFilter.from_bytes(bloom_filter)
+        if bf is None:
+            return False
+        if bf.num_item > 30:
+            # Reserved for potentially new encodings for short bloom filters.
+            # Consider it a match.
+            return True
+        return bf.check(key)
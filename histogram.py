@@ -0,0 +1,108 @@
+"""
+A histogram of latencies, the same as leveldb's util/histogram.
+"""
+import math
+from bisect import bisect_right
+
+
+def _bucket_limits() -> list:
+    limits = [1, 2, 3, 4, 5, 6, 7, 8, 9]
+    steps = [10, 12, 14, 16, 18, 20, 25, 30, 35, 40, 45, 50, 60, 70, 80, 90]
+    scale = 1
+    while scale <= 10 ** 10:
+        limits.extend(step * scale for step in steps)
+        scale *= 10
+    limits.append(1e200)
+    return limits
+
+
+# The upper bound of every bucket, the last one holding any larger value
+BUCKET_LIMITS = _bucket_limits()
+NUM_BUCKETS = len(BUCKET_LIMITS)
+
+
+class Histogram:
+    """
+    Histogram counts the values added into buckets of increasing sizes, to report
+    the percentiles of a distribution. It is not thread safe, each histogram should
+    have a single writer.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._min = math.inf
+        self._max = 0.0
+        self._num = 0
+        self._sum = 0.0
+        self._sum_squares = 0.0
+        self._buckets = [0] * NUM_BUCKETS
+
+    def add(self, value: float):
+        b = min(bisect_right(BUCKET_LIMITS, value), NUM_BUCKETS - 1)
+        self._buckets[b] += 1
+        self._min = min(self._min, value)
+        self._max = max(self._max, value)
+        self._num += 1
+        self._sum += value
+        self._sum_squares += value * value
+
+    def merge(self, other: 'Histogram'):
+        self._min = min(self._min, other._min)
+        self._max = max(self._max, other._max)
+        self._num += other._num
+        self._sum += other._sum
+        self._sum_squares += other._sum_squares
+        for b in range(NUM_BUCKETS):
+            self._buckets[b] += other._buckets[b]
+
+    def num(self) -> int:
+        return self._num
+
+    def median(self) -> float:
+        return self.percentile(50.0)
+
+    def percentile(self, p: float) -> float:
+        threshold = self._num * (p / 100.0)
+        total = 0
+        for b in range(NUM_BUCKETS):
+            total += self._buckets[b]
+            if total >= threshold and self._buckets[b] > 0:
+                # Scale linearly within this bucket
+                left_point = 0 if b == 0 else BUCKET_LIMITS[b - 1]
+                right_point = BUCKET_LIMITS[b]
+                left_sum = total - self._buckets[b]
+                pos = (threshold - left_sum) / self._buckets[b]
+                r = left_point + (right_point - left_point) * pos
+                return min(max(r, self._min), self._max)
+        return self._max
+
+    def average(self) -> float:
+        if self._num == 0:
+            return 0.0
+        return self._sum / self._num
+
+    def standard_deviation(self) -> float:
+        if self._num == 0:
+            return 0.0
+        variance = (self._sum_squares * self._num - self._sum * self._sum) / (self._num * self._num)
+        return math.sqrt(max(variance, 0.0))
+
+    def __str__(self) -> str:
+        lines = ['Count: %.0f  Average: %.4f  StdDev: %.2f' % (self._num, self.average(), self.standard_deviation()),
+                 'Min: %.4f  Median: %.4f  Max: %.4f' % (0.0 if self._num == 0 else self._min, self.median(),
+                                                         self._max),
+                 '-' * 54]
+        mult = 100.0 / self._num if self._num else 0.0
+        total = 0
+        for b in range(NUM_BUCKETS):
+            if self._buckets[b] <= 0:
+                continue
+            total += self._buckets[b]
+            # Add hash marks based on the percentage of the values in this bucket
+            marks = int(20 * (self._buckets[b] / self._num) + 0.5)
+            lines.append('[ %7.0f, %7.0f ) %7d %7.3f%% %7.3f%% %s' % (
+                0 if b == 0 else BUCKET_LIMITS[b - 1], BUCKET_LIMITS[b], self._buckets[b],
+                mult * self._buckets[b], mult * total, '#' * marks))
+        return '\n'.join(lines) + '\n'
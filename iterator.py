@@ -0,0 +1,37 @@
+from status import Status
+
+
+class EmptyIterator:
+    """
+    An iterator over nothing. If status is not OK, it is used to report an error.
+    """
+
+    def __init__(self, status: Status = None):
+        self._status = status if status is not None else Status.OK()
+
+    def valid(self) -> bool:
+        return False
+
+    def status(self) -> Status:
+        return self._status
+
+    def seek(self, target):
+        pass
+
+    def seek_to_first(self):
+        pass
+
+    def seek_to_last(self):
+        pass
+
+    def next(self):
+        assert False
+
+    def prev(self):
+        assert False
+
+    def key(self):
+        assert False
+
+    def value(self):
+        assert False
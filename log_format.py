@@ -0,0 +1,72 @@
+"""
+Log format information shared by the log reader and writer.
+
+A log file starts with a header naming the format of its records:
+    |magic: 4 bytes|version: 1 byte|
+Files written before the header existed have no header and are read as LEGACY_VERSION.
+The magic read as a legacy record length would be a record of more than 1GB, so the
+two cannot be confused.
+
+The records of each version:
+    LEGACY_VERSION:  |length: 4 bytes|data|checksum: 4 bytes|
+    VARINT_VERSION:  |length: varint32|data|checksum: 4 bytes|
+The checksum is the crc32 of the length and the data.
+
+BLOCK_VERSION is the format of leveldb: the file is a sequence of BLOCK_SIZE blocks,
+the file header taking the first bytes of the first block. A record is stored as one
+or more fragments, a fragment never spans a block boundary:
+    |checksum: 4 bytes|length: 2 bytes|type: 1 byte|data|
+The checksum is the crc32 of the type and the data. A record fitting in the rest of
+a block is stored as a FULL_TYPE fragment, else it is split into a FIRST_TYPE fragment,
+any number of MIDDLE_TYPE fragments and a LAST_TYPE fragment. If less than
+RECORD_HEADER_SIZE bytes are left in a block, they are filled with zeroes and skipped.
+
+RECYCLABLE_VERSION is the block format with the number of the log in every fragment,
+so that the file of an obsolete log can be reused for a new log without truncating it:
+    |checksum: 4 bytes|length: 2 bytes|type: 1 byte|log_number: 4 bytes|data|
+The checksum is the crc32 of the type, the log number and the data. A fragment of
+another log number is a leftover of the previous use of the file, and ends the log.
+"""
+
+MAGIC = b'\xffLOG'
+HEADER_SIZE = len(MAGIC) + 1
+
+LEGACY_VERSION = 0
+VARINT_VERSION = 1
+BLOCK_VERSION = 2
+RECYCLABLE_VERSION = 3
+
+# The version of the records written to new log files, which are not meant to be recycled
+CURRENT_VERSION = BLOCK_VERSION
+# The latest version a reader can read
+MAX_VERSION = RECYCLABLE_VERSION
+
+# Zero is reserved for preallocated files
+ZERO_TYPE = 0
+FULL_TYPE = 1
+# For fragments
+FIRST_TYPE = 2
+MIDDLE_TYPE = 3
+LAST_TYPE = 4
+MAX_RECORD_TYPE = LAST_TYPE
+
+BLOCK_SIZE = 32768
+
+# Header is checksum (4 bytes), length (2 bytes), type (1 byte).
+RECORD_HEADER_SIZE = 4 + 2 + 1
+
+# Header is checksum (4 bytes), length (2 bytes), type (1 byte), log number (4 bytes).
+RECYCLABLE_RECORD_HEADER_SIZE = RECORD_HEADER_SIZE + 4
+
+
+def encode_header(version: int) -> bytes:
+    return MAGIC + bytes((version,))
+
+
+def decode_header(data: bytes) -> (int, int):
+    """
+    Return the version of a log file starting with data, and the size of its header.
+    """
+    if len(data) >= HEADER_SIZE and data[:len(MAGIC)] == MAGIC:
+        return data[len(MAGIC)], HEADER_SIZE
+    return LEGACY_VERSION, 0
@@ -1,21 +1,129 @@
+import logging
+import mmap
+import struct
 import zlib
 
+import log_format
+from coding import get_varint32
 from dbformat import byte_order
+from log_format import BLOCK_SIZE, RECORD_HEADER_SIZE, RECYCLABLE_RECORD_HEADER_SIZE, ZERO_TYPE, FULL_TYPE, \
+    FIRST_TYPE, MIDDLE_TYPE, LAST_TYPE
+from status import Status
+
+# |checksum: 4 bytes|length: 2 bytes|type: 1 byte|
+_RECORD_HEADER = struct.Struct('<IHB')
+# |checksum: 4 bytes|length: 2 bytes|type: 1 byte|log_number: 4 bytes|
+_RECYCLABLE_RECORD_HEADER = struct.Struct('<IHBI')
+
+# Extend record types with the following special values
+# Returned whenever we reach the end of the file
+_EOF = log_format.MAX_RECORD_TYPE + 1
+# Returned whenever we find an invalid physical record.
+# Currently there are three situations in which this happens:
+# * The record has an invalid CRC
+# * The record is a 0-length record (no drop is reported)
+# * The record has a bad length
+_BAD_RECORD = log_format.MAX_RECORD_TYPE + 2
+
+# The crc32 of each record type, the checksum of a fragment continues from it
+_TYPE_CHECKSUMS = [zlib.crc32(bytes((t,))) for t in range(256)]
+
+
+class Reporter:
+    """
+    Interface for reporting errors.
+    """
+
+    def corruption(self, nbytes: int, status: Status):
+        """
+        Some corruption was detected. nbytes is the approximate number
+        of bytes dropped due to the corruption.
+        """
+        pass
+
+
+class LoggingReporter(Reporter):
+    """
+    LoggingReporter logs the data dropped from a log file. If status is not None,
+    the first corruption is recorded in it.
+    """
+
+    def __init__(self, logger: logging.Logger, file_name: str, status: Status = None):
+        self._logger = logger
+        self._file_name = file_name
+        self._status = status
+
+    def corruption(self, nbytes: int, status: Status):
+        self._logger.warning('%s%s: dropping %d bytes; %s', '(ignoring error) ' if self._status is None else '',
+                             self._file_name, nbytes, status)
+        if self._status is not None and self._status.ok():
+            self._status.assign(status)
 
 
 class Reader:
+    """
+    Reader reads the records of a log file.
+
+    The file is mapped in memory: the blocks and fragments are memoryview slices of
+    the mapping and the checksums are computed on them, so the only copy is the one
+    of the returned record. A file which cannot be mapped, e.g. an empty file, is
+    read into memory instead.
 
-    def __init__(self, file_name):
+    A recycled log ends at the first fragment which is not of the log: a fragment
+    left by the previous use of the file, or a torn or corrupted fragment, which
+    cannot be told apart from the leftovers.
+    """
+
+    def __init__(self, file_name, reporter: Reporter = None, checksum: bool = True, log_number: int = None):
+        """
+        :param reporter: if not None, it is notified whenever some data is dropped
+            due to a detected corruption of a block format file
+        :param checksum: verify the checksums of the block format records if True
+        :param log_number: the number of the log, which the fragments of a recyclable
+            log must carry. If None, the fragments of any log number are read.
+        """
         self._fd = open(file_name, 'rb')
         self.end_of_file = False
         self._closed = False
+        self._reporter = reporter
+        self._checksum = checksum
+        try:
+            self._map = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+            self._data = memoryview(self._map)
+        except (ValueError, OSError):
+            self._map = None
+            self._data = memoryview(self._fd.read())
+        # The offset of the next unread byte of the file
+        self._offset = 0
+        # The last block read, and the offset of its unread part
+        self._block = memoryview(b'')
+        self._pos = 0
+        # Last read block was less than BLOCK_SIZE, i.e. the end of the file
+        self._eof = False
+        self._version, header_size = log_format.decode_header(self._data[:log_format.HEADER_SIZE])
+        if self._version > log_format.MAX_VERSION:
+            self.close()
+            raise Exception(f'Unknown log format version {self._version}')
+        self._recyclable = self._version == log_format.RECYCLABLE_VERSION
+        self._header_size = RECYCLABLE_RECORD_HEADER_SIZE if self._recyclable else RECORD_HEADER_SIZE
+        self._log_number = log_number & 0xffffffff if log_number is not None else None
+        if self._version >= log_format.BLOCK_VERSION:
+            # The file header is the start of the first block
+            self._read_block()
+            self._pos = header_size
+        else:
+            self._offset = header_size
 
     def __del__(self):
-        self._fd.close()
+        if hasattr(self, '_data'):
+            self.close()
 
     def end(self):
         return self.end_of_file
 
+    def version(self) -> int:
+        return self._version
+
     def read_record(self) -> bytearray:
         """
         Reads a record from the log file.
@@ -24,27 +132,184 @@ class Reader:
         if self.closed():
             return None
 
-        length = int.from_bytes(self._fd.read(4), byteorder=byte_order)
-        if length == 0:
+        if self._version >= log_format.BLOCK_VERSION:
+            record = self._read_block_record()
+        else:
+            record = self._read_stream_record()
+        if record is None:
             self.end_of_file = True
             self.close()
-            return None
-        data = bytearray(self._fd.read(length))
-        checksum_from_log = int.from_bytes(self._fd.read(4), byteorder=byte_order)
+        return record
+
+    def _read_block_record(self) -> bytearray:
+        scratch = bytearray()
+        in_fragmented_record = False
+        while True:
+            record_type, fragment = self._read_physical_record()
+            if record_type == FULL_TYPE:
+                if in_fragmented_record and scratch:
+                    self._report_corruption(len(scratch), 'partial record without end(1)')
+                return bytearray(fragment)
+            elif record_type == FIRST_TYPE:
+                if in_fragmented_record and scratch:
+                    self._report_corruption(len(scratch), 'partial record without end(2)')
+                scratch = bytearray(fragment)
+                in_fragmented_record = True
+            elif record_type == MIDDLE_TYPE:
+                if not in_fragmented_record:
+                    self._report_corruption(len(fragment), 'missing start of fragmented record(1)')
+                else:
+                    scratch.extend(fragment)
+            elif record_type == LAST_TYPE:
+                if not in_fragmented_record:
+                    self._report_corruption(len(fragment), 'missing start of fragmented record(2)')
+                else:
+                    scratch.extend(fragment)
+                    return scratch
+            elif record_type == _EOF:
+                # This can be caused by the writer dying immediately after
+                # writing a physical record but before completing the next; don't
+                # treat it as a corruption, just ignore the entire logical record.
+                return None
+            elif record_type == _BAD_RECORD:
+                if in_fragmented_record:
+                    self._report_corruption(len(scratch), 'error in middle of record')
+                    in_fragmented_record = False
+                    scratch = bytearray()
+            else:
+                self._report_corruption(len(fragment) + (len(scratch) if in_fragmented_record else 0),
+                                        f'unknown record type {record_type}')
+                in_fragmented_record = False
+                scratch = bytearray()
+
+    def _read_block(self):
+        block = self._data[self._offset:self._offset + BLOCK_SIZE]
+        self._offset += len(block)
+        if len(block) < BLOCK_SIZE:
+            self._eof = True
+        self._block = block
+        self._pos = 0
+
+    def _read_physical_record(self) -> (int, memoryview):
+        """
+        Return the type and the data of the next fragment.
+        """
+        header_size = self._header_size
+        while True:
+            block = self._block
+            pos = self._pos
+            if len(block) - pos < header_size:
+                if not self._eof:
+                    # Last read was a full read, so this is a trailer to skip
+                    self._read_block()
+                    continue
+                # Note that if buffer is non-empty, we have a truncated header at the
+                # end of the file, which can be caused by the writer crashing in the
+                # middle of writing the header. Instead of considering this an error,
+                # just report EOF.
+                self._pos = len(block)
+                return _EOF, None
+
+            # Parse the header
+            if self._recyclable:
+                expected_checksum, length, record_type, log_number = _RECYCLABLE_RECORD_HEADER.unpack_from(block, pos)
+            else:
+                expected_checksum, length, record_type = _RECORD_HEADER.unpack_from(block, pos)
+            start = pos + header_size
+            end = start + length
+            if end > len(block):
+                drop_size = len(block) - pos
+                self._pos = len(block)
+                if not self._eof and not self._recyclable:
+                    self._report_corruption(drop_size, 'bad record length')
+                    return _BAD_RECORD, None
+                # If the end of the file has been reached without reading length bytes
+                # of payload, assume the writer died in the middle of writing the record.
+                # Don't report a corruption.
+                return _EOF, None
+
+            if record_type == ZERO_TYPE and length == 0:
+                # Skip zero length record without reporting any drops since
+                # such records are produced by preallocating file regions.
+                self._pos = len(block)
+                return _BAD_RECORD, None
 
-        # Check CRC32 checksum
-        to_checked = bytearray(length.to_bytes(4, byteorder=byte_order))
-        to_checked.extend(data)
-        checksum = zlib.crc32(to_checked)
+            if self._recyclable and self._log_number is not None and log_number != self._log_number:
+                # A fragment of the previous use of the file
+                self._pos = len(block)
+                return _EOF, None
 
-        if checksum != checksum_from_log:
+            fragment = block[start:end]
+            # Check crc
+            if self._checksum:
+                if self._recyclable:
+                    checksum = zlib.crc32(block[pos + 7:pos + 11], _TYPE_CHECKSUMS[record_type])
+                else:
+                    checksum = _TYPE_CHECKSUMS[record_type]
+                if zlib.crc32(fragment, checksum) != expected_checksum:
+                    drop_size = len(block) - pos
+                    self._pos = len(block)
+                    if self._recyclable:
+                        # A torn fragment over the leftovers of the previous use of the file
+                        return _EOF, None
+                    # Drop the rest of the buffer since "length" itself may have
+                    # been corrupted and if we trust it, we could find some
+                    # fragment of a real log record that just happens to look
+                    # like a valid log record.
+                    self._report_corruption(drop_size, 'checksum mismatch')
+                    return _BAD_RECORD, None
+
+            self._pos = end
+            return record_type, fragment
+
+    def _report_corruption(self, nbytes: int, reason: str):
+        if self._reporter is not None:
+            self._reporter.corruption(nbytes, Status.Corruption(reason))
+
+    def _read_stream_record(self) -> bytearray:
+        """
+        Read a record of the formats without blocks, return None at the end of the file.
+        """
+        data = self._data
+        start = self._offset
+        if start >= len(data):
+            return None
+        if self._version == log_format.LEGACY_VERSION:
+            length = int.from_bytes(data[start:start + 4], byteorder=byte_order)
+            # A legacy record length of 0 marks the end of the file
+            if length == 0:
+                return None
+            offset = start + 4
+        else:
+            try:
+                length, offset = get_varint32(data, start)
+            except ValueError:
+                raise Exception("Malformed record length")
+        end = offset + length
+        if end + 4 > len(data):
+            raise Exception("Truncated record")
+        checksum_from_log = int.from_bytes(data[end:end + 4], byteorder=byte_order)
+
+        # Check CRC32 checksum of the length and the data
+        if zlib.crc32(data[start:end]) != checksum_from_log:
             raise Exception("Checksum mismatch")
 
-        return data
+        self._offset = end + 4
+        return bytearray(data[offset:end])
 
     def close(self):
-        self._fd.close()
+        if self._closed:
+            return
         self._closed = True
+        self._block = memoryview(b'')
+        self._data.release()
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # A slice of the mapping is still alive, the mapping is closed when it is collected
+                pass
+        self._fd.close()
 
     def closed(self) -> bool:
         return self._closed
@@ -1,40 +1,253 @@
+import os
+import struct
+import threading
+import time
 import zlib
+
+import log_format
+from coding import encode_varint32
 from dbformat import byte_order
+from histogram import Histogram
+from log_format import BLOCK_SIZE, RECORD_HEADER_SIZE, RECYCLABLE_RECORD_HEADER_SIZE, FULL_TYPE, FIRST_TYPE, \
+    MIDDLE_TYPE, LAST_TYPE
+
+# |checksum: 4 bytes|length: 2 bytes|type: 1 byte|
+_RECORD_HEADER = struct.Struct('<IHB')
+# |checksum: 4 bytes|length: 2 bytes|type: 1 byte|log_number: 4 bytes|
+_RECYCLABLE_RECORD_HEADER = struct.Struct('<IHBI')
+
+# fdatasync does not write back the metadata which is not needed to read the data, e.g. the mtime
+_datasync = getattr(os, 'fdatasync', os.fsync)
 
 
 class Writer:
-    def __init__(self, file_name):
+    def __init__(self, file_name, log_number: int = None, reuse: bool = False, preallocate_size: int = 0,
+                 bytes_per_sync: int = 0, sync_histogram: Histogram = None, background_sync_histogram: Histogram = None):
+        """
+        :param log_number: if not None, the records are written in the recyclable format
+            with the log number, so that the file can be reused for another log later
+        :param reuse: overwrite the existing file of a recycled log from its start
+        :param preallocate_size: if > 0, the space of the file is allocated ahead of the
+            writes in steps of preallocate_size bytes
+        :param bytes_per_sync: if > 0, a background thread syncs the file whenever this
+            many bytes have been flushed since the last sync, so that the dirty pages are
+            written back incrementally rather than in a burst by a later sync
+        :param sync_histogram: if not None, the latencies of sync() in microseconds are added to it
+        :param background_sync_histogram: if not None, the latencies of the background syncs
+            in microseconds are added to it
+        """
+        assert not reuse or log_number is not None
         self._file_name = file_name
-        self._fd = open(file_name, 'ab')
+        self._fd = open(file_name, 'r+b' if os.path.exists(file_name) else 'w+b')
         self._write_size = 0
         self._closed = False
+        self._log_number = log_number
+        self._preallocate_size = preallocate_size if hasattr(os, 'posix_fallocate') else 0
+        # The end of the space of the file, which is allocated ahead when preallocating
+        self._allocated = self._fd.seek(0, os.SEEK_END)
+        file_size = 0 if reuse else self._allocated
+        self._offset = file_size
+        if file_size == 0:
+            self._fd.seek(0)
+            self._version = log_format.CURRENT_VERSION if log_number is None else log_format.RECYCLABLE_VERSION
+            self._write(log_format.encode_header(self._version))
+        else:
+            # Keep appending records in the format of the existing file
+            self._fd.seek(0)
+            self._version, _ = log_format.decode_header(self._fd.read(log_format.HEADER_SIZE))
+            self._fd.seek(file_size)
+        # The offset in the current block, the file header is in the first block
+        self._block_offset = self._offset % BLOCK_SIZE
+
+        self._bytes_per_sync = bytes_per_sync
+        self._sync_histogram = sync_histogram
+        self._background_sync_histogram = background_sync_histogram
+        # The file is synced up to _synced_offset, and the background thread is asked
+        # to sync it up to _sync_requested_offset. Both are protected by _sync_cv.
+        self._synced_offset = self._offset
+        self._sync_requested_offset = self._offset
+        self._sync_cv = threading.Condition()
+        self._sync_thread: threading.Thread = None
+        self._sync_error: OSError = None
 
     def write_record(self, data: bytearray):
         """
         The log writer writes a record of bytes to the log file.
-        The format of the log file is as follows:
-        |length: 4 bytes|batch_data|checksum: 4 bytes|
+        The record is split into fragments which do not span blocks, see log_format.
         :param data: bytearray to write
         :return:
         """
+        if self._version == log_format.BLOCK_VERSION:
+            header_size = RECORD_HEADER_SIZE
+        elif self._version == log_format.RECYCLABLE_VERSION:
+            header_size = RECYCLABLE_RECORD_HEADER_SIZE
+            log_number = self._log_number & 0xffffffff
+            encoded_log_number = log_number.to_bytes(4, byte_order)
+        else:
+            self._write_stream_record(data)
+            return
+
         buffer = bytearray()
+        view = memoryview(data)
+        left = len(view)
+        begin = True
+        # Fragment the record if necessary and emit it. Note that if data
+        # is empty, we still want to iterate once to emit a single
+        # zero-length record
+        while True:
+            leftover = BLOCK_SIZE - self._block_offset
+            assert leftover >= 0
+            if leftover < header_size:
+                # Switch to a new block
+                if leftover > 0:
+                    # Fill the trailer
+                    buffer.extend(bytes(leftover))
+                self._block_offset = 0
+
+            # Invariant: we never leave < header_size bytes in a block.
+            assert BLOCK_SIZE - self._block_offset >= header_size
+
+            avail = BLOCK_SIZE - self._block_offset - header_size
+            fragment_length = min(left, avail)
+
+            end = left == fragment_length
+            if begin and end:
+                record_type = FULL_TYPE
+            elif begin:
+                record_type = FIRST_TYPE
+            elif end:
+                record_type = LAST_TYPE
+            else:
+                record_type = MIDDLE_TYPE
+
+            fragment = view[:fragment_length]
+            if header_size == RECORD_HEADER_SIZE:
+                checksum = zlib.crc32(fragment, zlib.crc32(bytes((record_type,))))
+                buffer.extend(_RECORD_HEADER.pack(checksum, fragment_length, record_type))
+            else:
+                checksum = zlib.crc32(fragment, zlib.crc32(encoded_log_number, zlib.crc32(bytes((record_type,)))))
+                buffer.extend(_RECYCLABLE_RECORD_HEADER.pack(checksum, fragment_length, record_type, log_number))
+            buffer.extend(fragment)
+            self._block_offset += header_size + fragment_length
+
+            view = view[fragment_length:]
+            left -= fragment_length
+            begin = False
+            if left == 0:
+                break
+
+        self._write(buffer)
+
+    def _write(self, buffer: bytes):
+        end = self._offset + len(buffer)
+        if self._preallocate_size > 0 and end > self._allocated:
+            # Allocate the space of the next writes at once, so that the writes
+            # do not extend the file one by one
+            size = (end - self._allocated + self._preallocate_size - 1) // self._preallocate_size * \
+                self._preallocate_size
+            try:
+                os.posix_fallocate(self._fd.fileno(), self._allocated, size)
+                self._allocated += size
+            except OSError:
+                # The file system does not support it
+                self._preallocate_size = 0
+        self._fd.write(buffer)
+        self._offset = end
+        self._write_size += len(buffer)
 
+    def _write_stream_record(self, data: bytearray):
+        """
+        Write a record to a file of the formats without blocks:
+        |length: 4 bytes or varint32|batch_data|checksum: 4 bytes|
+        """
         length = len(data)
-        buffer.extend(length.to_bytes(4, byteorder=byte_order))
+        if self._version == log_format.LEGACY_VERSION:
+            buffer = bytearray(length.to_bytes(4, byteorder=byte_order))
+        else:
+            buffer = bytearray(encode_varint32(length))
         buffer.extend(data)
         checksum = zlib.crc32(buffer)
         buffer.extend(checksum.to_bytes(4, byteorder=byte_order))
 
-        self._fd.write(buffer)
-        self._write_size += len(buffer)
+        self._write(buffer)
+        self._block_offset = (self._block_offset + len(buffer)) % BLOCK_SIZE
 
     def write_size(self) -> int:
         return self._write_size
 
+    def file_size(self) -> int:
+        """
+        The size of the records of the file, including those before this writer.
+        """
+        return self._offset
+
     def flush(self):
+        """
+        Flush the buffered records to the OS, and start a background sync of them if
+        bytes_per_sync bytes are not synced yet.
+        Raise the error of a previous background sync if any.
+        """
+        self._fd.flush()
+        if self._bytes_per_sync <= 0:
+            return
+        with self._sync_cv:
+            if self._sync_error is not None:
+                raise self._sync_error
+            if self._offset - max(self._synced_offset, self._sync_requested_offset) < self._bytes_per_sync:
+                return
+            self._sync_requested_offset = self._offset
+            if self._sync_thread is None:
+                self._sync_thread = threading.Thread(target=self._background_sync, daemon=True)
+                self._sync_thread.start()
+            self._sync_cv.notify()
+
+    def _background_sync(self):
+        fileno = self._fd.fileno()
+        while True:
+            with self._sync_cv:
+                while self._sync_requested_offset <= self._synced_offset and not self._closed:
+                    self._sync_cv.wait()
+                if self._sync_requested_offset <= self._synced_offset:
+                    # Closed
+                    return
+                offset = self._sync_requested_offset
+            start = time.perf_counter()
+            try:
+                _datasync(fileno)
+            except OSError as e:
+                with self._sync_cv:
+                    self._sync_error = e
+                return
+            if self._background_sync_histogram is not None:
+                self._background_sync_histogram.add((time.perf_counter() - start) * 1e6)
+            with self._sync_cv:
+                self._synced_offset = max(self._synced_offset, offset)
+
+    def sync(self):
+        """
+        Flush the buffered records and force them to the disk with fdatasync, which is
+        enough to read the records back after a crash.
+        """
         self._fd.flush()
+        offset = self._offset
+        start = time.perf_counter()
+        _datasync(self._fd.fileno())
+        if self._sync_histogram is not None:
+            self._sync_histogram.add((time.perf_counter() - start) * 1e6)
+        with self._sync_cv:
+            self._synced_offset = max(self._synced_offset, offset)
 
     def close(self):
+        if self._sync_thread is not None:
+            with self._sync_cv:
+                self._closed = True
+                self._sync_cv.notify()
+            # Let the pending sync finish before the file is closed
+            self._sync_thread.join()
+        if self._allocated > self._offset and self._version != log_format.RECYCLABLE_VERSION:
+            # Release the preallocated space, so that records appended to the file later
+            # do not follow a zero filled gap. The leftovers of a recycled file are kept.
+            self._fd.truncate(self._offset)
         self._fd.close()
         self._closed = True
 
@@ -1,42 +1,74 @@
-from skiplist import Skiplist
+from arena_skiplist import ArenaSkiplist, ArenaSkiplistIterator
 from status import Status
-from dbformat import ValueType, Encoder, Decoder, LookupKey
+from dbformat import ValueType, LookupKey, InternalKey, MAX_SEQUENCE_NUMBER, byte_order
 from db_types import SequenceNumber
-from utils import internal_key_comparator, user_key_comparator
 from typing import List
 
+# The tags (sequence << 8 | type) of comparable keys are stored inverted,
+# so that they are ordered by decreasing sequence number and type.
+MAX_TAG = (MAX_SEQUENCE_NUMBER << 8) | 0xff
+
+
+def encode_comparable_key(user_key: bytes, seq: SequenceNumber, t: int) -> bytes:
+    """
+    Encode an internal key into a key whose bytes ordering is the internal key ordering:
+    |user_key with 0x00 escaped as 0x00 0xff|0x00 0x00|inverted tag: 8 bytes big endian|
+    """
+    return user_key.replace(b'\x00', b'\x00\xff') + b'\x00\x00' + (MAX_TAG - ((seq << 8) | t)).to_bytes(8, 'big')
+
+
+def decode_comparable_key(key: bytes) -> bytes:
+    """
+    Decode a key encoded by encode_comparable_key into the internal key.
+    """
+    tag = MAX_TAG - int.from_bytes(key[-8:], 'big')
+    return key[:-10].replace(b'\x00\xff', b'\x00') + (tag >> 8).to_bytes(7, byte_order) + bytes([tag & 0xff])
+
 
 class MemTable:
-    def __init__(self):
-        self._comparator = internal_key_comparator
-        self._table = Skiplist(comparator=self._comparator)
-        self._mem_usages = 0
+    """
+    MemTable keeps the recent writes in an ArenaSkiplist, which stores all the
+    entries in one arena buffer. An entry is keyed by the comparable encoding of
+    its internal key, so the skiplist compares bytes natively, and its value is
+    the utf-8 encoded value.
+    """
 
-    def compare_internal_key(self, x, y) -> int:
-        return self._comparator(x, y)
+    def __init__(self):
+        self._table = ArenaSkiplist()
 
-    def compare_user_key(self, x, y) -> int:
-        return user_key_comparator(x, y)
+    def add(self, s: SequenceNumber, key, value, t: ValueType):
+        """
+        Add an entry that maps key to value at sequence number s.
+        The key and value are either str or utf-8 encoded bytes.
+        """
+        if isinstance(key, str):
+            key = key.encode('utf-8')
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        self._table.insert(encode_comparable_key(key, s, t.value), value)
 
-    def add(self, s: SequenceNumber, key: str, value: str, t: ValueType):
-        buf = Encoder.encode_full_memtable_key(s, key, value, t)
-        self._table.insert(buf)
-        self._mem_usages += len(buf)
+    def add_encoded(self, key: bytes, value: bytes):
+        """
+        Add an entry whose key is already encoded by encode_comparable_key.
+        """
+        self._table.insert(key, value)
 
     def get(self, lkey: LookupKey, value: List[str], s: Status) -> bool:
+        internal_key = lkey.internal_key()
+        target = encode_comparable_key(bytes(internal_key[:-8]), InternalKey.extract_sequence(internal_key),
+                                       ValueType.kTypeValue.value)
         it = self._table.iter()
-        it.seek(lkey.memtable_key())
+        it.seek(target)
         if it.valid():
-            user_key = Decoder.decode_user_key_from_memtable_key(mkey=it.key())
-            if self.compare_user_key(user_key, lkey.user_key()) == 0:
+            key = it.key()
+            # Compare the encoded user keys and their terminators
+            if key[:-8] == target[:-8]:
                 # We found user_key is matched, and then we check ValueType.
                 # If the ValueType is kTypeValue, we return the true with the value.
                 # Else we return true with NotFound status.
-                tag = Decoder.decode_tag_from_memtable_key(mkey=it.key())
-                value_type = ValueType(tag[7])
+                value_type = ValueType((MAX_TAG - int.from_bytes(key[-8:], 'big')) & 0xff)
                 if value_type == ValueType.kTypeValue:
-                    value.append(
-                        Decoder.decode_value_from_memtable_key(it.key()))
+                    value.append(it.value().decode('utf-8'))
                     s.assign(Status.OK())
                     return True
                 elif value_type == ValueType.kTypeDeletion:
@@ -44,5 +76,47 @@ class MemTable:
                     return True
         return False
 
-    def approximate_memory_usage(self):
-        return self._mem_usages
+    def approximate_memory_usage(self) -> int:
+        return self._table.memory_usage()
+
+    def new_iterator(self) -> 'MemTableIterator':
+        return MemTableIterator(self._table.iter())
+
+
+class MemTableIterator:
+    """
+    MemTableIterator iterates over the entries of a memtable. The keys are
+    internal keys and the values are utf-8 encoded bytes.
+    The iterator is initially invalid, the caller must seek before using it.
+    """
+
+    def __init__(self, it: ArenaSkiplistIterator):
+        self._iter = it
+
+    def valid(self) -> bool:
+        return self._iter.valid()
+
+    def status(self) -> Status:
+        return Status.OK()
+
+    def seek(self, internal_key: bytes):
+        self._iter.seek(encode_comparable_key(bytes(InternalKey.extract_user_key(internal_key)),
+                                              InternalKey.extract_sequence(internal_key), internal_key[-1]))
+
+    def seek_to_first(self):
+        self._iter.seek_to_first()
+
+    def seek_to_last(self):
+        self._iter.seek_to_last()
+
+    def next(self):
+        self._iter.next()
+
+    def prev(self):
+        self._iter.prev()
+
+    def key(self) -> bytes:
+        return decode_comparable_key(self._iter.key())
+
+    def value(self) -> bytes:
+        return self._iter.value()
@@ -0,0 +1,149 @@
+import heapq
+from typing import List
+
+from dbformat import InternalKey
+from status import Status
+
+
+class _Descending:
+    """
+    Wraps a sort key to reverse its order, so that heapq yields the largest key first.
+    """
+    __slots__ = ('sort_key',)
+
+    def __init__(self, sort_key: tuple):
+        self.sort_key = sort_key
+
+    def __lt__(self, other: '_Descending') -> bool:
+        return other.sort_key < self.sort_key
+
+    def __eq__(self, other: '_Descending') -> bool:
+        return self.sort_key == other.sort_key
+
+
+class MergingIterator:
+    """
+    MergingIterator yields the union of the entries of its children in internal key order.
+    The children are kept in a heap ordered by InternalKey.sort_key of their current keys,
+    a min-heap when moving forward and a max-heap when moving backward.
+    If an entry exists in several children, it is yielded once per child.
+    """
+
+    FORWARD = 0
+    REVERSE = 1
+
+    def __init__(self, children: List):
+        self._children = children
+        # Heap of (sort_key, child_index) for the valid children
+        self._heap = []
+        self._current = None
+        self._direction = MergingIterator.FORWARD
+
+    def valid(self) -> bool:
+        return self._current is not None
+
+    def key(self) -> bytes:
+        assert self.valid()
+        return self._current.key()
+
+    def value(self) -> bytes:
+        assert self.valid()
+        return self._current.value()
+
+    def status(self) -> Status:
+        for child in self._children:
+            s = child.status()
+            if not s.ok():
+                return s
+        return Status.OK()
+
+    def seek_to_first(self):
+        for child in self._children:
+            child.seek_to_first()
+        self._direction = MergingIterator.FORWARD
+        self._rebuild_heap()
+
+    def seek_to_last(self):
+        for child in self._children:
+            child.seek_to_last()
+        self._direction = MergingIterator.REVERSE
+        self._rebuild_heap()
+
+    def seek(self, target: bytes):
+        for child in self._children:
+            child.seek(target)
+        self._direction = MergingIterator.FORWARD
+        self._rebuild_heap()
+
+    def next(self):
+        assert self.valid()
+
+        # Ensure that all children are positioned after key().
+        # If we are moving in the forward direction, it is already
+        # true for all of the non-current children since current is
+        # the smallest child and key() == current.key(). Otherwise,
+        # we explicitly position the non-current children.
+        if self._direction != MergingIterator.FORWARD:
+            key = self.key()
+            for child in self._children:
+                if child is not self._current:
+                    child.seek(key)
+                    if child.valid() and child.key() == key:
+                        child.next()
+            self._current.next()
+            self._direction = MergingIterator.FORWARD
+            self._rebuild_heap()
+            return
+
+        self._advance(self._current.next)
+
+    def prev(self):
+        assert self.valid()
+
+        # Ensure that all children are positioned before key().
+        # If we are moving in the reverse direction, it is already
+        # true for all of the non-current children since current is
+        # the largest child and key() == current.key(). Otherwise,
+        # we explicitly position the non-current children.
+        if self._direction != MergingIterator.REVERSE:
+            key = self.key()
+            for child in self._children:
+                if child is not self._current:
+                    child.seek(key)
+                    if child.valid():
+                        # Child is at first entry >= key(). Step back one to be < key()
+                        child.prev()
+                    else:
+                        # Child has no entries >= key(). Position at last entry.
+                        child.seek_to_last()
+            self._current.prev()
+            self._direction = MergingIterator.REVERSE
+            self._rebuild_heap()
+            return
+
+        self._advance(self._current.prev)
+
+    def _advance(self, move):
+        """
+        Move the current child and restore the heap.
+        """
+        index = self._heap[0][1]
+        move()
+        if self._current.valid():
+            heapq.heapreplace(self._heap, (self._heap_key(self._current.key()), index))
+        else:
+            heapq.heappop(self._heap)
+        self._find_top()
+
+    def _heap_key(self, key: bytes):
+        sort_key = InternalKey.sort_key(key)
+        return sort_key if self._direction == MergingIterator.FORWARD else _Descending(sort_key)
+
+    def _rebuild_heap(self):
+        self._heap = [(self._heap_key(child.key()), i)
+                      for i, child in enumerate(self._children) if child.valid()]
+        heapq.heapify(self._heap)
+        self._find_top()
+
+    def _find_top(self):
+        self._current = self._children[self._heap[0][1]] if self._heap else None
@@ -9,14 +9,51 @@ class DBOption:
         self.only_mem: bool = False
         self.create_if_missing = False
         self.error_if_exists = False
+        # If True, recovery stops at the first corruption found in a log file,
+        # else the corrupted records are dropped and the recovery goes on.
+        self.paranoid_checks = False
+        # Number of worker processes decoding the log records on recovery, see
+        # config.PARALLEL_RECOVERY_MIN_LOG_SIZE. Less than 2 decodes them in the db thread.
+        # The workers are forked: only enable them if no other thread of the process may
+        # hold a lock at the time of the fork, e.g. the background threads of another open
+        # db or the threads of the caller, since the forked workers could deadlock on it.
+        self.recovery_workers = 1
+        # Number of obsolete log files kept to be reused for new logs, which avoids
+        # allocating the space of a new file on every memtable switch. 0 disables it.
+        self.recycle_log_file_num = 0
+        # If > 0, the space of the log files is allocated ahead of the writes in steps
+        # of this many bytes with posix_fallocate. 0 disables it.
+        self.log_preallocate_size = 0
+        # If > 0, the log files are synced in the background whenever this many bytes
+        # have been written since the last sync, which spreads the write back of the
+        # logs over time instead of stalling a later sync write. 0 disables it.
+        self.wal_bytes_per_sync = 0
         self.write_buffer_size = 1024 * 1024 * 4
         self.block_size = 4 * 1024
+        self.block_restart_interval = 16
+        # Number of open files that can be used by the db. The table cache keeps
+        # max_open_files - config.NUM_NON_TABLE_CACHE_FILES tables open.
+        self.max_open_files = 1000
+        # Capacity in bytes of the LRU cache of data blocks shared by all tables. 0 disables the cache.
+        self.block_cache_size = 8 * 1024 * 1024
+        # Bits per key of the bloom filter written for every table. 0 disables the filters.
+        self.bits_per_key = 10
+        # Compaction writes output files of up to max_file_size bytes.
+        self.max_file_size = 2 * 1024 * 1024
+        # The total size of level-1 files triggering a compaction, each higher level is 10 times larger.
+        self.max_bytes_for_level_base = 10 * 1024 * 1024
+        # Once the manifest grows past max_manifest_file_size bytes, a new manifest starting
+        # with a snapshot of the current version replaces it, which bounds the edits replayed on open.
+        self.max_manifest_file_size = 4 * 1024 * 1024
         self.log_level = logging.CRITICAL
         self.log_format = utils.basic_logging_format()
 
 
 class WriteOption:
     def __init__(self):
+        # If True, the write is forced to the disk with fdatasync before it returns,
+        # so that it survives a machine crash. Else a crash of the machine may lose it,
+        # though a crash of the process does not.
         self.sync = False
 
 
@@ -25,3 +62,6 @@ class ReadOption:
         self.verify_checksums = True
         self.fill_cache = True
         self.snapshot: Snapshot = None
+        # Iterators only yield keys in [lower_bound, upper_bound) if the bounds are not None.
+        self.lower_bound: str = None
+        self.upper_bound: str = None
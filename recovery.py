@@ -0,0 +1,124 @@
+"""
+The decode pipeline used to replay the logs into a memtable on recovery.
+
+The db thread reads the records of a log and checks their checksums, while the
+batches are validated and decoded into memtable entries by an executor, in chunks
+of about RECOVERY_CHUNK_SIZE bytes. The decoded records are yielded in the log
+order, so the db thread applies them to the memtable in sequence order.
+"""
+import multiprocessing
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+from dbformat import ValueType
+from log_reader import Reader
+from memtable import encode_comparable_key
+from status import Status
+from write_batch import WriteBatch
+
+# The size of the records decoded by a task of the executor
+RECOVERY_CHUNK_SIZE = 1024 * 1024
+# The number of chunks queued per worker, which bounds the decoded entries held in memory
+MAX_PENDING_CHUNKS_PER_WORKER = 2
+
+_TYPE_VALUE = ValueType.kTypeValue.value
+_TYPE_DELETION = ValueType.kTypeDeletion.value
+
+
+class _EntryCollector:
+    """
+    A WriteBatch handler collecting the (comparable key, value) memtable entries of a batch.
+    """
+
+    def __init__(self, sequence: int):
+        self.entries = []
+        self._sequence = sequence
+
+    def put(self, key: bytes, value: bytes):
+        self.entries.append((encode_comparable_key(key, self._sequence, _TYPE_VALUE), value))
+        self._sequence += 1
+
+    def delete(self, key: bytes):
+        self.entries.append((encode_comparable_key(key, self._sequence, _TYPE_DELETION), b''))
+        self._sequence += 1
+
+
+def decode_record(record: bytes) -> Tuple[Status, int, List[Tuple[bytes, bytes]]]:
+    """
+    Decode a log record holding a WriteBatch.
+    Return the status, the last sequence number of the batch and its memtable entries,
+    see MemTable.add_encoded. The entries are only returned if the whole batch is valid.
+    """
+    try:
+        batch = WriteBatch.deserialize(record)
+    except ValueError:
+        return Status.Corruption('log record too small'), 0, []
+    collector = _EntryCollector(batch.sequence_number())
+    s = batch.iterate(collector)
+    if not s.ok():
+        return s, 0, []
+    return s, batch.sequence_number() + batch.count() - 1, collector.entries
+
+
+def decode_records(records: List[bytes]) -> List[Tuple[Status, int, List[Tuple[bytes, bytes]]]]:
+    """
+    Decode a chunk of log records, run by the workers of the executor.
+    """
+    return [decode_record(record) for record in records]
+
+
+def new_executor(workers: int) -> Executor:
+    """
+    Return a pool of worker processes to decode the records, or None if the records
+    should be decoded in the db thread, i.e. there are less than 2 workers or the
+    processes cannot be forked.
+    The processes are forked, so that they do not import the __main__ module of the
+    program again as spawned processes do. A lock held by another thread at the time
+    of the fork stays locked in the workers, which is why the pool is opt-in.
+    """
+    if workers < 2 or 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+
+
+def read_decoded_records(reader: Reader, executor: Executor = None, workers: int = 1) \
+        -> Iterator[Tuple[Status, int, List[Tuple[bytes, bytes]], int]]:
+    """
+    Yield (status, last sequence number, entries, record size) for every record of the log,
+    in the order of the log. The records are decoded by executor if it is not None, which
+    has the given number of workers.
+    """
+    if executor is None:
+        while True:
+            record = reader.read_record()
+            if record is None:
+                return
+            s, last_sequence, entries = decode_record(record)
+            yield s, last_sequence, entries, len(record)
+
+    max_pending = MAX_PENDING_CHUNKS_PER_WORKER * workers
+    pending = deque()
+    chunk = []
+    chunk_size = 0
+    try:
+        while True:
+            record = reader.read_record()
+            if record is not None:
+                chunk.append(record)
+                chunk_size += len(record)
+            if chunk and (record is None or chunk_size >= RECOVERY_CHUNK_SIZE):
+                pending.append((executor.submit(decode_records, chunk), [len(r) for r in chunk]))
+                chunk = []
+                chunk_size = 0
+            # Yield the oldest chunk once enough chunks are queued to keep the workers busy
+            while pending and (record is None or len(pending) >= max_pending):
+                future, sizes = pending.popleft()
+                for (s, last_sequence, entries), size in zip(future.result(), sizes):
+                    yield s, last_sequence, entries, size
+            if record is None:
+                return
+    finally:
+        # The caller stopped early
+        for future, _ in pending:
+            future.cancel()
@@ -1,3 +1,4 @@
+import operator
 import random
 from typing import List
 from utils import default_comparator
@@ -18,6 +19,14 @@ class Skiplist:
         self.max_level = max_level
         self._size = 0
         self._comparator = default_comparator(comparator)
+        # Without a comparator, keys are compared with the native operators,
+        # which avoids a python call per comparison.
+        if comparator is None:
+            self._less = operator.lt
+            self._equal = operator.eq
+        else:
+            self._less = lambda x, y: comparator(x, y) < 0
+            self._equal = lambda x, y: comparator(x, y) == 0
 
     def _compare(self, key_x, key_y) -> int:
         """
@@ -29,31 +38,23 @@ class Skiplist:
         return self._size
 
     def search(self, key) -> Node:
-        x = self._head
-        for l in range(self._head.level, 0, -1):
-            i = l - 1
-            while x.forward[i] and self._compare(x.forward[i].key, key) < 0:
-                x = x.forward[i]
-            if x.forward[i] and self._compare(x.forward[i].key, key) == 0:
-                return x.forward[i]
+        x = self.find_greater_or_equal(key)[0]
+        if x is not None and self._equal(x.key, key):
+            return x
         return None
 
     def contains(self, key):
         return self.search(key) is not None
 
     def insert(self, key, value=None):
-        new_level = self._random_level()
+        x, update = self.find_greater_or_equal(key, need_prev=True)
+        if x is not None and self._equal(x.key, key):
+            x.value = value
+            return
 
-        update = [None] * max(new_level, self._head.level)
-        x = self._head
-        for l in range(self._head.level, 0, -1):
-            i = l - 1
-            while x.forward[i] and self._compare(x.forward[i].key, key) < 0:
-                x = x.forward[i]
-            if x.forward[i] and self._compare(x.forward[i].key, key) == 0:
-                x.forward[i].value = value
-                return
-            update[i] = x
+        new_level = self._random_level()
+        if new_level > len(update):
+            update.extend([None] * (new_level - len(update)))
 
         if new_level > self._head.level:
             self._head.forward = self._head.forward + \
@@ -109,7 +110,7 @@ class Skiplist:
                 if l == 0:
                     return x
                 else:
-                    l -= -1
+                    l -= 1
             else:
                 x = x.forward[l]
 
@@ -117,11 +118,13 @@ class Skiplist:
         return Iterator(self)
 
     def find_less_than(self, key) -> Node:
+        less = self._less
         x = self._head
-        for l in range(self._head.level, 0, -1):
-            i = l - 1
-            while x.forward[i] and x.forward[i].key < key:
-                x = x.forward[i]
+        for i in range(self._head.level - 1, -1, -1):
+            nxt = x.forward[i]
+            while nxt is not None and less(nxt.key, key):
+                x = nxt
+                nxt = x.forward[i]
         return x
 
     def find_greater_or_equal(self, key, need_prev=False) -> (Node, List[Node]):
@@ -129,14 +132,17 @@ class Skiplist:
         Returns the node with the smallest key >= key, and the list of prevent nodes
         that are less than the key for each level.
         """
+        less = self._less
         x = self._head
+        level = self._head.level
         if need_prev:
-            prev = [None] * self._head.level
+            prev = [None] * level
 
-        for l in range(self._head.level, 0, -1):
-            i = l - 1
-            while x.forward[i] and self._compare(x.forward[i].key, key) < 0:
-                x = x.forward[i]
+        for i in range(level - 1, -1, -1):
+            nxt = x.forward[i]
+            while nxt is not None and less(nxt.key, key):
+                x = nxt
+                nxt = x.forward[i]
             if need_prev:
                 prev[i] = x
 
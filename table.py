@@ -0,0 +1,180 @@
+import os
+import threading
+import weakref
+
+from block import Block
+from cache import LRUCache
+from filter_policy import BloomFilterPolicy
+from iterator import EmptyIterator
+from option import DBOption, ReadOption
+from status import Status
+from table_format import BlockHandle, Footer, read_block
+from two_level_iterator import TwoLevelIterator
+from table_builder import filter_block_key
+from dbformat import InternalKey
+from utils import raw_internal_key_comparator, table_file_name, user_key_comparator
+
+
+class Table:
+    """
+    Table is a sorted map from internal keys to values, read from a file built by TableBuilder.
+    Tables are immutable and persistent.
+
+    A table is referenced by its opener and by each of its iterators until the iterator
+    is garbage collected. The file is closed when the last reference is released, so the
+    opener calls close() when it is done with the table, even if iterators are left.
+    """
+
+    def __init__(self, option: DBOption, file, index_block: Block, filter_data: bytes = None,
+                 file_number: int = 0, block_cache: LRUCache = None):
+        self._option = option
+        self._file = file
+        self._index_block = index_block
+        # The bloom filter of the user keys, None if the table has no filter
+        self._filter_data = filter_data
+        self._comparator = raw_internal_key_comparator
+        # Data blocks are cached in block_cache by (file_number, block offset)
+        self._file_number = file_number
+        self._block_cache = block_cache
+        self._lock = threading.Lock()
+        # The reference of the opener
+        self._refs = 1
+
+    @staticmethod
+    def open(option: DBOption, file, file_size: int, file_number: int = 0,
+             block_cache: LRUCache = None) -> (Status, 'Table'):
+        """
+        Open the table stored in bytes [0..file_size) of file.
+        The file should remain open as long as the table is used.
+        :param file_number: the number of the table file, which identifies its blocks in block_cache
+        :param block_cache: the cache of data blocks, None if the blocks are not cached
+        :return: status, table
+        """
+        if file_size < Footer.ENCODED_LENGTH:
+            return Status.Corruption('file is too short to be an sstable'), None
+
+        try:
+            footer_data = os.pread(file.fileno(), Footer.ENCODED_LENGTH, file_size - Footer.ENCODED_LENGTH)
+        except OSError as e:
+            return Status.IOError(str(e)), None
+
+        s, footer = Footer.decode(footer_data)
+        if not s.ok():
+            return s, None
+
+        read_option = ReadOption()
+        s, contents = read_block(file.fileno(), read_option, footer.index_handle)
+        if not s.ok():
+            return s, None
+
+        filter_data = Table.read_filter(file, footer)
+        return Status.OK(), Table(option, file, Block(contents), filter_data, file_number, block_cache)
+
+    @staticmethod
+    def read_filter(file, footer: Footer) -> bytes:
+        """
+        Read the filter block through the metaindex block.
+        Errors are ignored since the filter is not needed for correctness.
+        """
+        s, contents = read_block(file.fileno(), ReadOption(), footer.metaindex_handle)
+        if not s.ok():
+            return None
+
+        key = filter_block_key(BloomFilterPolicy)
+        it = Block(contents).new_iterator(user_key_comparator)
+        it.seek(key)
+        if not it.valid() or it.key() != key:
+            return None
+        s, filter_data = read_block(file.fileno(), ReadOption(), BlockHandle.decode(it.value()))
+        if not s.ok():
+            return None
+        return filter_data
+
+    def block_reader(self, option: ReadOption, index_value: bytes):
+        """
+        Convert an index iterator value (i.e., an encoded BlockHandle) into an
+        iterator over the contents of the corresponding block.
+        If there is a block cache, the block is looked up in the cache first, and the
+        block read from the file is added to the cache only if option.fill_cache is set.
+        """
+        handle = BlockHandle.decode(index_value)
+        cache_key = (self._file_number, handle.offset)
+        if self._block_cache is not None:
+            block = self._block_cache.lookup(cache_key)
+            if block is not None:
+                return block.new_iterator(self._comparator)
+
+        s, contents = read_block(self._file.fileno(), option, handle)
+        if not s.ok():
+            return EmptyIterator(s)
+        block = Block(contents)
+        if self._block_cache is not None and option.fill_cache:
+            self._block_cache.insert(cache_key, block, len(contents))
+        return block.new_iterator(self._comparator)
+
+    def new_iterator(self, option: ReadOption) -> TwoLevelIterator:
+        """
+        Return an iterator over the table, which keeps the file open until it is garbage collected.
+        """
+        it = TwoLevelIterator(self._index_block.new_iterator(self._comparator), self.block_reader, option)
+        self.ref()
+        weakref.finalize(it, self.unref)
+        return it
+
+    def internal_get(self, option: ReadOption, key: bytes, handle_result) -> Status:
+        """
+        Seek to the first entry >= key, and call handle_result(found_key, found_value) if it exists.
+        If the filter shows that the user key is not in the table, no data block is read.
+        """
+        if self._filter_data is not None and \
+                not BloomFilterPolicy.key_may_match(InternalKey.extract_user_key(key), self._filter_data):
+            # Not found
+            return Status.OK()
+
+        index_iter = self._index_block.new_iterator(self._comparator)
+        index_iter.seek(key)
+        if index_iter.valid():
+            block_iter = self.block_reader(option, index_iter.value())
+            block_iter.seek(key)
+            if block_iter.valid():
+                handle_result(block_iter.key(), block_iter.value())
+            s = block_iter.status()
+            if not s.ok():
+                return s
+        return index_iter.status()
+
+    def ref(self):
+        with self._lock:
+            assert self._refs > 0
+            self._refs += 1
+
+    def unref(self):
+        with self._lock:
+            assert self._refs > 0
+            self._refs -= 1
+            if self._refs == 0:
+                self._file.close()
+
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def __del__(self):
+        self._file.close()
+
+    def close(self):
+        """
+        Release the reference of the opener.
+        """
+        self.unref()
+
+
+def open_table_file(db_name: str, option: DBOption, file_number: int, file_size: int,
+                    block_cache: LRUCache = None) -> (Status, Table):
+    try:
+        file = open(table_file_name(db_name, file_number), 'rb')
+    except Exception as e:
+        return Status.IOError(str(e)), None
+    s, table = Table.open(option, file, file_size, file_number, block_cache)
+    if not s.ok():
+        file.close()
+    return s, table
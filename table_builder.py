@@ -0,0 +1,148 @@
+from block_builder import BlockBuilder
+from dbformat import byte_order, InternalKey
+from filter_policy import BloomFilterPolicy
+from option import DBOption
+from status import Status
+from table_format import BlockHandle, Footer, NO_COMPRESSION, block_checksum
+from utils import raw_internal_key_comparator
+
+
+class TableBuilder:
+    """
+    TableBuilder provides the interface used to build a table, which is an immutable
+    and sorted map from internal keys to values.
+
+    The format of a table:
+    |data block 1|...|data block n|filter block|metaindex block|index block|footer|
+
+    Each block is followed by a trailer |type: 1 byte|crc32: 4 bytes|.
+    The index block contains one entry per data block, whose key is the last
+    key of the data block and whose value is the BlockHandle of the data block.
+    The filter block is a bloom filter of all the user keys in the table, and the
+    metaindex block maps 'filter.<policy name>' to its BlockHandle.
+    """
+
+    def __init__(self, option: DBOption, file):
+        self._option = option
+        self._file = file
+        self._offset = 0
+        self._status = Status.OK()
+        self._data_block = BlockBuilder(option.block_restart_interval)
+        self._index_block = BlockBuilder(1)
+        self._last_key = b''
+        self._num_entries = 0
+        self._closed = False
+        self._comparator = raw_internal_key_comparator
+        self._filter_policy = BloomFilterPolicy(option.bits_per_key) if option.bits_per_key > 0 else None
+        # User keys for the filter block
+        self._filter_keys = []
+
+    def add(self, key: bytes, value: bytes):
+        """
+        Add a key value pair to the table being constructed.
+        The key must be larger than any previously added key.
+        """
+        assert not self._closed
+        if not self.ok():
+            return
+        if self._num_entries > 0:
+            assert self._comparator(key, self._last_key) > 0
+
+        if self._filter_policy is not None:
+            user_key = InternalKey.extract_user_key(key)
+            if len(self._filter_keys) == 0 or self._filter_keys[-1] != user_key:
+                self._filter_keys.append(bytes(user_key))
+
+        self._last_key = bytes(key)
+        self._num_entries += 1
+        self._data_block.add(key, value)
+
+        if self._data_block.current_size_estimate() >= self._option.block_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered data block to the file, and add an index entry for it.
+        """
+        assert not self._closed
+        if not self.ok():
+            return
+        if self._data_block.empty():
+            return
+        handle = self._write_block(self._data_block)
+        if self.ok():
+            self._index_block.add(self._last_key, handle.encode())
+
+    def _write_block(self, block: BlockBuilder) -> BlockHandle:
+        contents = block.finish()
+        handle = self._write_raw_block(contents, NO_COMPRESSION)
+        block.reset()
+        return handle
+
+    def _write_raw_block(self, contents: bytes, block_type: int) -> BlockHandle:
+        handle = BlockHandle(self._offset, len(contents))
+        try:
+            self._file.write(contents)
+            trailer = bytearray([block_type])
+            trailer.extend(block_checksum(contents, block_type).to_bytes(4, byte_order))
+            self._file.write(trailer)
+            self._offset += len(contents) + len(trailer)
+        except Exception as e:
+            self._status = Status.IOError(str(e))
+        return handle
+
+    def finish(self) -> Status:
+        """
+        Finish building the table. The file is not closed by the builder.
+        """
+        self.flush()
+        assert not self._closed
+        self._closed = True
+
+        metaindex_block = BlockBuilder(self._option.block_restart_interval)
+        metaindex_handle = BlockHandle()
+        index_handle = BlockHandle()
+
+        # Write filter block
+        if self.ok() and self._filter_policy is not None:
+            filter_handle = self._write_raw_block(self._filter_policy.create_filter(self._filter_keys),
+                                                  NO_COMPRESSION)
+            metaindex_block.add(filter_block_key(self._filter_policy), filter_handle.encode())
+            self._filter_keys = []
+
+        if self.ok():
+            metaindex_handle = self._write_block(metaindex_block)
+        if self.ok():
+            index_handle = self._write_block(self._index_block)
+        if self.ok():
+            footer = Footer(metaindex_handle, index_handle)
+            try:
+                encoded = footer.encode()
+                self._file.write(encoded)
+                self._offset += len(encoded)
+            except Exception as e:
+                self._status = Status.IOError(str(e))
+        return self._status
+
+    def abandon(self):
+        """
+        Indicate that the contents of this builder should be abandoned.
+        """
+        assert not self._closed
+        self._closed = True
+
+    def ok(self) -> bool:
+        return self._status.ok()
+
+    def status(self) -> Status:
+        return self._status
+
+    def num_entries(self) -> int:
+        return self._num_entries
+
+    def file_size(self) -> int:
+        return self._offset
+
+
+def filter_block_key(policy: BloomFilterPolicy) -> bytes:
+    return ('filter.' + policy.name()).encode('utf-8')
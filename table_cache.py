@@ -0,0 +1,92 @@
+import threading
+
+from cache import LRUCache
+from iterator import EmptyIterator
+from option import DBOption, ReadOption
+from status import Status
+from table import Table, open_table_file
+
+
+class TableCache:
+    """
+    TableCache keeps the recently used tables open, keyed by their file numbers.
+    A cached table holds its open file and its parsed index and filter blocks,
+    so a lookup does not reopen the file or re-parse its footer and index.
+    A table evicted from the cache is closed once no iterator references it.
+    """
+
+    def __init__(self, db_name: str, option: DBOption, entries: int, block_cache: LRUCache = None):
+        """
+        :param entries: the maximum number of open tables
+        :param block_cache: the cache of data blocks shared by the tables
+        """
+        self._db_name = db_name
+        self._option = option
+        self._block_cache = block_cache
+        # The cache holds the reference of the opener of each table, and releases it
+        # when the table is evicted. The lock makes a lookup and the reference taken
+        # on its result atomic with respect to evictions.
+        self._lock = threading.Lock()
+        self._cache = LRUCache(entries, lambda _, table: table.close())
+
+    def find_table(self, file_number: int, file_size: int) -> (Status, Table):
+        """
+        Return the table of file_number, with a reference held for the caller,
+        who must call table.unref() when done with it.
+        """
+        with self._lock:
+            table = self._cache.lookup(file_number)
+            if table is not None:
+                table.ref()
+                return Status.OK(), table
+
+        s, table = open_table_file(self._db_name, self._option, file_number, file_size, self._block_cache)
+        if not s.ok():
+            # We do not cache error results so that if the error is transient,
+            # or somebody repairs the file, we recover automatically.
+            return s, None
+        table.ref()
+        with self._lock:
+            self._cache.insert(file_number, table, 1)
+        return s, table
+
+    def new_iterator(self, option: ReadOption, file_number: int, file_size: int):
+        """
+        Return an iterator for the specified file number, whose file must have exactly file_size bytes.
+        """
+        s, table = self.find_table(file_number, file_size)
+        if not s.ok():
+            return EmptyIterator(s)
+        it = table.new_iterator(option)
+        table.unref()
+        return it
+
+    def get(self, option: ReadOption, file_number: int, file_size: int, key: bytes, handle_result) -> Status:
+        """
+        If a seek to internal key in the specified file finds an entry,
+        call handle_result(found_key, found_value).
+        """
+        s, table = self.find_table(file_number, file_size)
+        if not s.ok():
+            return s
+        try:
+            return table.internal_get(option, key, handle_result)
+        finally:
+            table.unref()
+
+    def evict(self, file_number: int):
+        """
+        Evict any entry for the specified file number.
+        """
+        with self._lock:
+            self._cache.erase(file_number)
+
+    def close(self):
+        """
+        Evict all the tables, which are closed once no iterator references them.
+        """
+        with self._lock:
+            self._cache.prune()
+
+    def block_cache(self) -> LRUCache:
+        return self._block_cache
@@ -0,0 +1,103 @@
+import os
+import zlib
+
+from dbformat import byte_order
+from option import ReadOption
+from status import Status
+
+# The magic number was picked by running
+#     echo http://code.google.com/p/leveldb/ | sha1sum
+# and taking the leading 64 bits.
+TABLE_MAGIC_NUMBER = 0xdb4775248b80fb57
+
+# 1-byte type + 4-byte crc
+BLOCK_TRAILER_SIZE = 5
+
+NO_COMPRESSION = 0
+
+
+class BlockHandle:
+    """
+    BlockHandle is a pointer to the extent of a file that stores a data block or a meta block.
+    |offset: 8 bytes|size: 8 bytes|
+    """
+    ENCODED_LENGTH = 16
+
+    def __init__(self, offset: int = 0, size: int = 0):
+        self.offset = offset
+        self.size = size
+
+    def encode(self) -> bytearray:
+        buf = bytearray(self.offset.to_bytes(8, byte_order))
+        buf.extend(self.size.to_bytes(8, byte_order))
+        return buf
+
+    @staticmethod
+    def decode(data: bytes) -> 'BlockHandle':
+        assert len(data) >= BlockHandle.ENCODED_LENGTH
+        offset = int.from_bytes(data[:8], byte_order)
+        size = int.from_bytes(data[8:16], byte_order)
+        return BlockHandle(offset, size)
+
+
+class Footer:
+    """
+    Footer encapsulates the fixed information stored at the tail end of every table file.
+    |metaindex_handle: 16 bytes|index_handle: 16 bytes|magic: 8 bytes|
+    """
+    ENCODED_LENGTH = 2 * BlockHandle.ENCODED_LENGTH + 8
+
+    def __init__(self, metaindex_handle: BlockHandle = None, index_handle: BlockHandle = None):
+        self.metaindex_handle = metaindex_handle if metaindex_handle is not None else BlockHandle()
+        self.index_handle = index_handle if index_handle is not None else BlockHandle()
+
+    def encode(self) -> bytearray:
+        buf = self.metaindex_handle.encode()
+        buf.extend(self.index_handle.encode())
+        buf.extend(TABLE_MAGIC_NUMBER.to_bytes(8, byte_order))
+        assert len(buf) == Footer.ENCODED_LENGTH
+        return buf
+
+    @staticmethod
+    def decode(data: bytes) -> (Status, 'Footer'):
+        if len(data) < Footer.ENCODED_LENGTH:
+            return Status.Corruption('truncated footer'), None
+        magic = int.from_bytes(data[2 * BlockHandle.ENCODED_LENGTH:Footer.ENCODED_LENGTH], byte_order)
+        if magic != TABLE_MAGIC_NUMBER:
+            return Status.Corruption('not an sstable (bad magic number)'), None
+        metaindex_handle = BlockHandle.decode(data[:BlockHandle.ENCODED_LENGTH])
+        index_handle = BlockHandle.decode(data[BlockHandle.ENCODED_LENGTH:2 * BlockHandle.ENCODED_LENGTH])
+        return Status.OK(), Footer(metaindex_handle, index_handle)
+
+
+def block_checksum(contents: bytes, block_type: int) -> int:
+    return zlib.crc32(bytes([block_type]), zlib.crc32(contents))
+
+
+def read_block(fd: int, option: ReadOption, handle: BlockHandle) -> (Status, bytes):
+    """
+    Read the block identified by handle from the file descriptor.
+    os.pread is used so that a descriptor can be shared by concurrent readers.
+    :param fd: file descriptor of the table file
+    :param option: read option, verify_checksums is honored
+    :param handle: the position of the block
+    :return: status, block contents without the trailer
+    """
+    n = handle.size
+    try:
+        data = os.pread(fd, n + BLOCK_TRAILER_SIZE, handle.offset)
+    except OSError as e:
+        return Status.IOError(str(e)), None
+    if len(data) != n + BLOCK_TRAILER_SIZE:
+        return Status.Corruption('truncated block read'), None
+
+    contents = data[:n]
+    block_type = data[n]
+    if option.verify_checksums:
+        crc = int.from_bytes(data[n + 1:n + 5], byte_order)
+        if block_checksum(contents, block_type) != crc:
+            return Status.Corruption('block checksum mismatch'), None
+
+    if block_type != NO_COMPRESSION:
+        return Status.Corruption('bad block type'), None
+    return Status.OK(), contents
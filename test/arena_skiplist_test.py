@@ -0,0 +1,106 @@
+import random
+import threading
+import unittest
+
+from arena_skiplist import ArenaSkiplist
+
+
+def random_key() -> bytes:
+    return bytes(random.randrange(256) for _ in range(random.randint(0, 8)))
+
+
+class ArenaSkiplistTest(unittest.TestCase):
+    def test_empty(self):
+        sl = ArenaSkiplist()
+        self.assertEqual(sl.size(), 0)
+        it = sl.iter()
+        self.assertFalse(it.valid())
+        it.seek_to_first()
+        self.assertFalse(it.valid())
+        it.seek(b'ab')
+        self.assertFalse(it.valid())
+        it.seek_to_last()
+        self.assertFalse(it.valid())
+
+    def test_insert_and_lookup(self):
+        sl = ArenaSkiplist()
+        keys = set()
+        for _ in range(2000):
+            key = random_key()
+            if key not in keys:
+                keys.add(key)
+                sl.insert(key, key + b'v')
+        expected = sorted(keys)
+        self.assertEqual(sl.size(), len(expected))
+
+        # Forward iteration
+        it = sl.iter()
+        it.seek_to_first()
+        for key in expected:
+            self.assertTrue(it.valid())
+            self.assertEqual(it.key(), key)
+            self.assertEqual(it.value(), key + b'v')
+            it.next()
+        self.assertFalse(it.valid())
+
+        # Backward iteration
+        it.seek_to_last()
+        for key in reversed(expected):
+            self.assertTrue(it.valid())
+            self.assertEqual(it.key(), key)
+            it.prev()
+        self.assertFalse(it.valid())
+
+        # Seek
+        for _ in range(500):
+            target = random_key()
+            it.seek(target)
+            following = [k for k in expected if k >= target]
+            if following:
+                self.assertEqual(it.key(), following[0])
+            else:
+                self.assertFalse(it.valid())
+
+    def test_memory_usage(self):
+        sl = ArenaSkiplist()
+        usage = sl.memory_usage()
+        for i in range(1000):
+            sl.insert(f'{i:08d}'.encode('utf-8'), b'x' * 100)
+            self.assertGreater(sl.memory_usage(), usage)
+            usage = sl.memory_usage()
+        # Every entry costs its key and value plus a few table slots
+        self.assertGreaterEqual(usage, 1000 * 108)
+        self.assertLess(usage, 1000 * (108 + 64))
+
+    def test_concurrent_reads(self):
+        sl = ArenaSkiplist()
+        num = 5000
+        done = threading.Event()
+        errors = []
+
+        def read():
+            it = sl.iter()
+            while not done.is_set():
+                # The keys are inserted in random order, every scan must be sorted
+                it.seek_to_first()
+                last = None
+                while it.valid():
+                    if last is not None and it.key() <= last:
+                        errors.append((last, it.key()))
+                    last = it.key()
+                    it.next()
+
+        readers = [threading.Thread(target=read) for _ in range(2)]
+        for t in readers:
+            t.start()
+        for i in random.sample(range(num), num):
+            sl.insert(f'{i:08d}'.encode('utf-8'), b'')
+        done.set()
+        for t in readers:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sl.size(), num)
+
+
+if __name__ == '__main__':
+    unittest.main()
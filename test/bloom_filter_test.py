@@ -1,5 +1,7 @@
 import unittest
-from bloom_filter import BloomFilter
+import zlib
+from bloom_filter import BloomFilter, HASH_SEED
+from filter_policy import BloomFilterPolicy
 
 
 class BloomFilterTest(unittest.TestCase):
@@ -19,3 +21,47 @@ class BloomFilterTest(unittest.TestCase):
             bf.add(key)
         for key in keys:
             self.assertTrue(bf.check(key))
+
+    def test_stable_hash(self):
+        # The hash must not depend on the per-process randomized hash().
+        bf = BloomFilter(size=1 << 20, num_item=3)
+        self.assertEqual(bf.hash('hello', 0), zlib.crc32(b'hello', HASH_SEED) % (1 << 20))
+        self.assertEqual(bf.hash('hello', 1), bf.hash(b'hello', 1))
+
+    def test_serialize(self):
+        bf = BloomFilter(size=1024, num_item=6)
+        self.assertEqual(len(bf.bit_array), 128)
+        keys = [str(i) for i in range(100)]
+        for key in keys:
+            bf.add(key)
+        data = bf.to_bytes()
+        self.assertEqual(len(data), 129)
+
+        bf2 = BloomFilter.from_bytes(data)
+        self.assertEqual(bf2.size, 1024)
+        self.assertEqual(bf2.num_item, 6)
+        for key in keys:
+            self.assertTrue(bf2.check(key))
+
+
+class BloomFilterPolicyTest(unittest.TestCase):
+    def test_empty(self):
+        policy = BloomFilterPolicy(10)
+        data = policy.create_filter([])
+        self.assertFalse(policy.key_may_match(b'hello', data))
+        self.assertFalse(policy.key_may_match(b'world', data))
+
+    def test_varying_lengths(self):
+        policy = BloomFilterPolicy(10)
+        for length in [1, 10, 100, 1000, 10000]:
+            keys = [i.to_bytes(4, 'little') for i in range(length)]
+            data = policy.create_filter(keys)
+            self.assertLessEqual(len(data), (length * 10 // 8) + 40)
+            for key in keys:
+                self.assertTrue(policy.key_may_match(key, data))
+
+            false_positives = 0
+            for i in range(10000):
+                if policy.key_may_match((i + 1000000000).to_bytes(4, 'little'), data):
+                    false_positives += 1
+            self.assertLess(false_positives / 10000, 0.02)
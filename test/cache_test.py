@@ -0,0 +1,87 @@
+import unittest
+
+from cache import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_hit_and_miss(self):
+        cache = LRUCache(100)
+        self.assertIsNone(cache.lookup(100))
+        cache.insert(100, 101, 1)
+        self.assertEqual(cache.lookup(100), 101)
+        self.assertIsNone(cache.lookup(200))
+
+        cache.insert(200, 201, 1)
+        self.assertEqual(cache.lookup(100), 101)
+        self.assertEqual(cache.lookup(200), 201)
+
+        # Insert replaces the old value
+        cache.insert(100, 102, 1)
+        self.assertEqual(cache.lookup(100), 102)
+        self.assertEqual(cache.total_charge(), 2)
+        self.assertEqual(cache.hits(), 4)
+        self.assertEqual(cache.misses(), 2)
+
+    def test_erase(self):
+        cache = LRUCache(100)
+        cache.erase(200)
+        cache.insert(100, 101, 10)
+        cache.insert(200, 201, 20)
+        cache.erase(100)
+        self.assertIsNone(cache.lookup(100))
+        self.assertEqual(cache.lookup(200), 201)
+        self.assertEqual(cache.total_charge(), 20)
+        cache.prune()
+        self.assertEqual(cache.size(), 0)
+        self.assertEqual(cache.total_charge(), 0)
+
+    def test_eviction_policy(self):
+        cache = LRUCache(10)
+        for i in range(10):
+            cache.insert(i, i, 1)
+        # Touch 0 so that 1 becomes the least recently used entry
+        self.assertEqual(cache.lookup(0), 0)
+        cache.insert(10, 10, 1)
+        self.assertEqual(cache.lookup(0), 0)
+        self.assertIsNone(cache.lookup(1))
+        self.assertEqual(cache.lookup(10), 10)
+        self.assertEqual(cache.size(), 10)
+
+    def test_heavy_entries(self):
+        cache = LRUCache(100)
+        cache.insert(1, 1, 60)
+        cache.insert(2, 2, 60)
+        self.assertIsNone(cache.lookup(1))
+        self.assertEqual(cache.lookup(2), 2)
+        self.assertLessEqual(cache.total_charge(), 100)
+
+    def test_zero_capacity(self):
+        deleted = []
+        cache = LRUCache(0, lambda k, v: deleted.append((k, v)))
+        cache.insert(1, 1, 1)
+        self.assertIsNone(cache.lookup(1))
+        self.assertEqual(cache.total_charge(), 0)
+        self.assertEqual(deleted, [(1, 1)])
+
+    def test_deleter(self):
+        deleted = []
+        cache = LRUCache(3, lambda k, v: deleted.append((k, v)))
+        for i in range(3):
+            cache.insert(i, 100 + i, 1)
+        # Replaced
+        cache.insert(0, 200, 1)
+        self.assertEqual(deleted, [(0, 100)])
+        # Evicted
+        cache.insert(3, 103, 1)
+        self.assertEqual(deleted[1:], [(1, 101)])
+        # Erased
+        cache.erase(2)
+        cache.erase(2)
+        self.assertEqual(deleted[2:], [(2, 102)])
+        # Pruned
+        cache.prune()
+        self.assertEqual(sorted(deleted[3:]), [(0, 200), (3, 103)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+
+from coding import encode_varint32, encode_varint64, get_varint32, get_varint64, put_varint32, put_varint64, \
+    varint_length, put_length_prefixed_slice, get_length_prefixed_slice
+
+
+class CodingTest(unittest.TestCase):
+    def test_varint32(self):
+        buf = bytearray()
+        values = []
+        for i in range(32 * 32):
+            v = ((i // 32) << (i % 32)) & 0xffffffff
+            values.append(v)
+            put_varint32(buf, v)
+
+        offset = 0
+        for v in values:
+            start = offset
+            actual, offset = get_varint32(buf, offset)
+            self.assertEqual(v, actual)
+            self.assertEqual(varint_length(actual), offset - start)
+        self.assertEqual(offset, len(buf))
+
+    def test_varint64(self):
+        # Construct the list of values to check
+        values = [0, 100, (1 << 64) - 1, (1 << 64) - 2]
+        for k in range(64):
+            power = 1 << k
+            values.extend([power, power - 1, power + 1])
+
+        buf = bytearray()
+        for v in values:
+            put_varint64(buf, v)
+
+        offset = 0
+        for v in values:
+            start = offset
+            actual, offset = get_varint64(buf, offset)
+            self.assertEqual(v, actual)
+            self.assertEqual(varint_length(actual), offset - start)
+        self.assertEqual(offset, len(buf))
+
+    def test_encoded_length(self):
+        self.assertEqual(encode_varint32(0), b'\x00')
+        self.assertEqual(encode_varint32(127), b'\x7f')
+        self.assertEqual(encode_varint32(128), b'\x80\x01')
+        self.assertEqual(encode_varint32(300), b'\xac\x02')
+        self.assertEqual(len(encode_varint32((1 << 32) - 1)), 5)
+        self.assertEqual(len(encode_varint64((1 << 64) - 1)), 10)
+
+    def test_varint32_overflow(self):
+        with self.assertRaises(ValueError):
+            get_varint32(b'\x81\x82\x83\x84\x85\x11')
+        with self.assertRaises(ValueError):
+            get_varint32(encode_varint64(1 << 32))
+
+    def test_varint32_truncation(self):
+        large_value = (1 << 31) + 100
+        encoded = encode_varint32(large_value)
+        for n in range(len(encoded)):
+            with self.assertRaises(ValueError):
+                get_varint32(encoded[:n])
+        self.assertEqual(get_varint32(encoded), (large_value, len(encoded)))
+
+    def test_varint64_truncation(self):
+        large_value = (1 << 63) + 100
+        encoded = encode_varint64(large_value)
+        for n in range(len(encoded)):
+            with self.assertRaises(ValueError):
+                get_varint64(encoded[:n])
+        self.assertEqual(get_varint64(encoded), (large_value, len(encoded)))
+
+    def test_length_prefixed_slice(self):
+        buf = bytearray()
+        slices = [b'', b'foo', b'bar', b'x' * 200]
+        for s in slices:
+            put_length_prefixed_slice(buf, s)
+
+        offset = 0
+        for s in slices:
+            actual, offset = get_length_prefixed_slice(buf, offset)
+            self.assertEqual(s, actual)
+        self.assertEqual(offset, len(buf))
+        with self.assertRaises(ValueError):
+            get_length_prefixed_slice(buf[:-1], len(buf) - 202)
+
+
+if __name__ == '__main__':
+    unittest.main()
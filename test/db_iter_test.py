@@ -0,0 +1,171 @@
+import random
+import unittest
+
+from db_iter import DBIter
+from dbformat import ValueType
+from memtable import MemTable
+from merger import MergingIterator
+from test.test_utils import random_user_str
+
+
+class DBIterTest(unittest.TestCase):
+    def setUp(self):
+        # Spread the entries over several memtables to exercise the merging iterator
+        self.mems = [MemTable() for _ in range(3)]
+        self.sequence = 0
+        # The expected contents of the db after each sequence number
+        self.models = [{}]
+
+    def put(self, key: str, value: str):
+        self.write(key, value, ValueType.kTypeValue)
+
+    def delete(self, key: str):
+        self.write(key, '', ValueType.kTypeDeletion)
+
+    def write(self, key: str, value: str, t: ValueType):
+        self.sequence += 1
+        random.choice(self.mems).add(self.sequence, key, value, t)
+        model = dict(self.models[-1])
+        if t == ValueType.kTypeValue:
+            model[key] = value
+        else:
+            model.pop(key, None)
+        self.models.append(model)
+
+    def new_iterator(self, sequence: int = None, lower_bound: str = None, upper_bound: str = None) -> DBIter:
+        sequence = self.sequence if sequence is None else sequence
+        return DBIter(MergingIterator([mem.new_iterator() for mem in self.mems]), sequence,
+                      lower_bound, upper_bound)
+
+    def scan(self, it: DBIter):
+        result = []
+        it.seek_to_first()
+        while it.valid():
+            result.append((it.key(), it.value()))
+            it.next()
+        self.assertTrue(it.status().ok())
+        return result
+
+    def reverse_scan(self, it: DBIter):
+        result = []
+        it.seek_to_last()
+        while it.valid():
+            result.append((it.key(), it.value()))
+            it.prev()
+        self.assertTrue(it.status().ok())
+        return result
+
+    def test_empty(self):
+        it = self.new_iterator()
+        it.seek_to_first()
+        self.assertFalse(it.valid())
+        it.seek_to_last()
+        self.assertFalse(it.valid())
+        it.seek('a')
+        self.assertFalse(it.valid())
+
+    def test_hide_deletions_and_old_versions(self):
+        self.put('a', 'va1')
+        self.put('b', 'vb1')
+        self.put('a', 'va2')
+        self.delete('b')
+        self.put('c', 'vc1')
+        self.delete('d')
+        self.assertEqual(self.scan(self.new_iterator()), [('a', 'va2'), ('c', 'vc1')])
+        self.assertEqual(self.reverse_scan(self.new_iterator()), [('c', 'vc1'), ('a', 'va2')])
+
+        # Entries newer than the sequence number are invisible
+        self.assertEqual(self.scan(self.new_iterator(sequence=2)), [('a', 'va1'), ('b', 'vb1')])
+        self.assertEqual(self.reverse_scan(self.new_iterator(sequence=3)), [('b', 'vb1'), ('a', 'va2')])
+
+    def test_seek_and_switch_direction(self):
+        for i in range(10):
+            self.put(f'{i:02d}', f'v{i}')
+        for i in range(0, 10, 3):
+            self.delete(f'{i:02d}')
+        # 01 02 04 05 07 08 remain
+        it = self.new_iterator()
+        it.seek('03')
+        self.assertEqual(it.key(), '04')
+        it.prev()
+        self.assertEqual(it.key(), '02')
+        it.prev()
+        self.assertEqual(it.key(), '01')
+        it.prev()
+        self.assertFalse(it.valid())
+
+        it.seek('05')
+        self.assertEqual((it.key(), it.value()), ('05', 'v5'))
+        it.next()
+        self.assertEqual(it.key(), '07')
+        it.prev()
+        self.assertEqual(it.key(), '05')
+        it.next()
+        self.assertEqual(it.key(), '07')
+
+        it.seek_to_last()
+        self.assertEqual(it.key(), '08')
+        it.next()
+        self.assertFalse(it.valid())
+        it.seek('99')
+        self.assertFalse(it.valid())
+
+    def test_bounds(self):
+        for i in range(10):
+            self.put(f'{i:02d}', f'v{i}')
+        self.delete('03')
+        expected = [('02', 'v2'), ('04', 'v4'), ('05', 'v5')]
+        self.assertEqual(self.scan(self.new_iterator(lower_bound='02', upper_bound='06')), expected)
+        self.assertEqual(self.reverse_scan(self.new_iterator(lower_bound='02', upper_bound='06')),
+                         list(reversed(expected)))
+
+        it = self.new_iterator(lower_bound='03', upper_bound='05')
+        it.seek('00')
+        self.assertEqual(it.key(), '04')
+        it.prev()
+        self.assertFalse(it.valid())
+        it.seek('05')
+        self.assertFalse(it.valid())
+
+    def test_random(self):
+        keys = [random_user_str(2) for _ in range(50)]
+        for _ in range(1000):
+            if random.random() < 0.3:
+                self.delete(random.choice(keys))
+            else:
+                self.put(random.choice(keys), random_user_str(5))
+
+        for sequence in [0, 1, self.sequence // 2, self.sequence]:
+            expected = sorted(self.models[sequence].items())
+            self.assertEqual(self.scan(self.new_iterator(sequence)), expected)
+            self.assertEqual(self.reverse_scan(self.new_iterator(sequence)), list(reversed(expected)))
+
+        # Random moves checked against the model
+        expected = sorted(self.models[-1].items())
+        it = self.new_iterator()
+        index = None
+        for _ in range(500):
+            op = random.randint(0, 3)
+            if op == 0 or index is None:
+                target = random_user_str(2)
+                it.seek(target)
+                index = next((i for i, (k, _) in enumerate(expected) if k >= target), len(expected))
+            elif op == 1:
+                it.next()
+                index += 1
+            elif op == 2:
+                it.prev()
+                index -= 1
+            else:
+                it.seek_to_last()
+                index = len(expected) - 1
+            if 0 <= index < len(expected):
+                self.assertTrue(it.valid())
+                self.assertEqual((it.key(), it.value()), expected[index])
+            else:
+                self.assertFalse(it.valid())
+                index = None
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,18 +1,27 @@
 import os.path
 import unittest
+from unittest import mock
 
+import config
 import utils
 from option import DBOption, WriteOption, ReadOption
-from db import DB
+from db import DB, WriteRequest
 from typing import List
 from status import Status
 from test.test_utils import random_user_str
 from typing import Dict, Set
 import random
+import threading
 from write_batch import WriteBatch
 from utils import current_file_name, manifest_file_name
 
 
+def wait_for_background_work(db: DB):
+    with db._mutex:
+        while db._background_compaction_scheduled:
+            db._background_work_finished_signal.wait()
+
+
 class DBTest(unittest.TestCase):
     def test_new(self):
         db_name = f'tmp_{random_user_str(10)}'
@@ -244,6 +253,269 @@ class DBTest(unittest.TestCase):
 
         db2.close()
 
+    def test_recover_corrupted_wal(self):
+        db_name = f'tmp_{random_user_str(10)}'
+        db_option = DBOption()
+        db_option.create_if_missing = True
+        db, s = DB.open(db_name, db_option)
+        self.assertEqual(s, Status.OK())
+        log_number = db._log_file_num
+        # The records span several blocks of the log
+        for i in range(1000):
+            db.put(WriteOption(), f'{i:06d}', 'v' * 100)
+        db.close()
+
+        # Corrupt a record in the first block
+        with open(utils.log_file_name(db_name, log_number), 'r+b') as f:
+            f.seek(100)
+            f.write(b'\xff\xff\xff')
+
+        db_option.paranoid_checks = True
+        db2, s = DB.open(db_name, db_option)
+        self.assertFalse(s.ok())
+
+        # The rest of the first block is dropped, the later blocks are recovered
+        db_option.paranoid_checks = False
+        db2, s = DB.open(db_name, db_option)
+        self.assertEqual(s, Status.OK())
+        value = []
+        self.assertEqual(db2.get(ReadOption(), '000000', value), Status.NotFound())
+        self.assertEqual(db2.get(ReadOption(), '000999', value), Status.OK())
+        self.assertEqual(value, ['v' * 100])
+        db2.close()
+
+    def test_recover_wal_in_parallel(self):
+        db_name = f'tmp_{random_user_str(10)}'
+        db_option = DBOption()
+        db_option.create_if_missing = True
+        db_option.recovery_workers = 2
+        db, s = DB.open(db_name, db_option)
+        self.assertEqual(s, Status.OK())
+        data = {}
+        for i in range(3000):
+            key = f'{random.randrange(1000):04d}'
+            if random.randrange(4) == 0:
+                db.delete(WriteOption(), key)
+                data.pop(key, None)
+            else:
+                data[key] = random_user_str(10)
+                db.put(WriteOption(), key, data[key])
+        last_sequence = db.last_sequence()
+        db.close()
+
+        min_log_size = config.PARALLEL_RECOVERY_MIN_LOG_SIZE
+        config.PARALLEL_RECOVERY_MIN_LOG_SIZE = 0
+        try:
+            db2, s = DB.open(db_name, db_option)
+        finally:
+            config.PARALLEL_RECOVERY_MIN_LOG_SIZE = min_log_size
+        self.assertEqual(s, Status.OK())
+        self.assertEqual(db2.last_sequence(), last_sequence)
+        for i in range(1000):
+            key = f'{i:04d}'
+            value = []
+            s = db2.get(ReadOption(), key, value)
+            if key in data:
+                self.assertEqual(s, Status.OK())
+                self.assertEqual(value, [data[key]])
+            else:
+                self.assertEqual(s, Status.NotFound())
+        db2.close()
+
+    def test_recover_flushes_memtable(self):
+        db_name = f'tmp_{random_user_str(10)}'
+        db_option = DBOption()
+        db_option.create_if_missing = True
+        db_option.write_buffer_size = 1024 * 1024 * 1024
+        db, s = DB.open(db_name, db_option)
+        self.assertEqual(s, Status.OK())
+        old_log_number = db.log_number()
+        for i in range(2000):
+            db.put(WriteOption(), f'{i:06d}', 'v' * 100)
+        last_sequence = db.last_sequence()
+        db.close()
+        self.assertEqual(db.versions.num_level_files(0), 0)
+
+        # The replayed memtable is flushed whenever it exceeds the write buffer
+        db_option.write_buffer_size = 64 * 1024
+        db2, s = DB.open(db_name, db_option)
+        self.assertEqual(s, Status.OK())
+        wait_for_background_work(db2)
+        num_files = sum(db2.versions.num_level_files(level) for level in range(7))
+        self.assertGreater(num_files, 1)
+        self.assertLess(db2._mem.approximate_memory_usage(), db_option.write_buffer_size)
+        self.assertEqual(db2.last_sequence(), last_sequence)
+        # The replayed log is deleted
+        self.assertFalse(os.path.exists(utils.log_file_name(db_name, old_log_number)))
+        for i in range(0, 2000, 7):
+            value = []
+            self.assertEqual(db2.get(ReadOption(), f'{i:06d}', value), Status.OK())
+            self.assertEqual(value, ['v' * 100])
+        db2.close()
+
+        # Nothing is left to replay on the next open
+        db3, s = DB.open(db_name, db_option)
+        self.assertEqual(s, Status.OK())
+        self.assertEqual(sum(db3.versions.num_level_files(level) for level in range(7)), num_files)
+        self.assertEqual(db3.last_sequence(), last_sequence)
+        db3.close()
+
+    def test_delete_obsolete_manifests(self):
+        db_name = f'tmp_{random_user_str(10)}'
+        db_option = DBOption()
+        db_option.create_if_missing = True
+        db_option.write_buffer_size = 16 * 1024
+        db_option.max_manifest_file_size = 2048
+        for _ in range(2):
+            db, s = DB.open(db_name, db_option)
+            self.assertEqual(s, Status.OK())
+            for i in range(2000):
+                db.put(WriteOption(), f'{i:06d}', 'v' * 100)
+            wait_for_background_work(db)
+            # Only the manifest named by the current file is left
+            manifests = [name for name in os.listdir(db_name) if name.endswith('.manifest')]
+            self.assertEqual(manifests, [f'{db.versions.live_manifest_file_number()}.manifest'])
+            db.close()
+
+        db, s = DB.open(db_name, db_option)
+        self.assertEqual(s, Status.OK())
+        for i in range(0, 2000, 7):
+            value = []
+            self.assertEqual(db.get(ReadOption(), f'{i:06d}', value), Status.OK())
+            self.assertEqual(value, ['v' * 100])
+        db.close()
+
+    def test_seek_compaction(self):
+        db_name = f'tmp_{random_user_str(10)}'
+        db_option = DBOption()
+        db_option.create_if_missing = True
+        # Every reopen writes the entries of the log to a new level-0 table
+        for keys in [[f'{i:03d}' for i in range(100)], ['000', '099']]:
+            db, s = DB.open(db_name, db_option)
+            self.assertTrue(s.ok())
+            for key in keys:
+                self.assertTrue(db.put(WriteOption(), key, 'v' + key).ok())
+            db.close()
+
+        db, s = DB.open(db_name, db_option)
+        self.assertTrue(s.ok())
+        self.assertEqual(db.versions.num_level_files(0), 2)
+        newest = db.versions.current().files[0][0]
+        self.assertEqual(newest.allow_seek, config.MIN_ALLOWED_SEEKS)
+        # The keys in the middle miss the newest table before they are found in the oldest
+        for i in range(config.MIN_ALLOWED_SEEKS):
+            value = []
+            self.assertEqual(db.get(ReadOption(), f'{i % 98 + 1:03d}', value), Status.OK())
+            self.assertEqual(value, [f'v{i % 98 + 1:03d}'])
+        wait_for_background_work(db)
+        self.assertEqual(db.versions.num_level_files(0), 0)
+        self.assertEqual(db.versions.num_level_files(1), 1)
+        self.assertIsNone(db.versions.current().file_to_compact)
+        for i in range(100):
+            value = []
+            self.assertEqual(db.get(ReadOption(), f'{i:03d}', value), Status.OK())
+            self.assertEqual(value, [f'v{i:03d}'])
+        db.close()
+
+    def test_compaction_aborted_on_shutdown(self):
+        db_name = f'tmp_{random_user_str(10)}'
+        db_option = DBOption()
+        db_option.create_if_missing = True
+        for keys in [[f'{i:03d}' for i in range(100)], ['000', '099']]:
+            db, s = DB.open(db_name, db_option)
+            self.assertTrue(s.ok())
+            for key in keys:
+                self.assertTrue(db.put(WriteOption(), key, 'v' + key).ok())
+            db.close()
+
+        db, s = DB.open(db_name, db_option)
+        self.assertTrue(s.ok())
+        open_output = db.open_compaction_output_file
+
+        def open_output_and_shut_down(compact):
+            # The db is closed while the compaction writes its first output
+            s = open_output(compact)
+            with db._mutex:
+                db._shutting_down = True
+            return s
+
+        with mock.patch.object(db, 'open_compaction_output_file', side_effect=open_output_and_shut_down):
+            with db._mutex:
+                current = db.versions.current()
+                current.file_to_compact = current.files[0][0]
+                current.file_to_compact_level = 0
+                db.maybe_schedule_compaction()
+            wait_for_background_work(db)
+        self.assertFalse(db._bg_error.ok())
+        db.close()
+        # The output of the aborted compaction is deleted
+        live_tables = set()
+        db.versions.add_live_files(live_tables)
+        self.assertEqual(set(int(name[:-4]) for name in os.listdir(db_name) if name.endswith('.sst')), live_tables)
+
+        db, s = DB.open(db_name, db_option)
+        self.assertTrue(s.ok())
+        for i in range(100):
+            value = []
+            self.assertEqual(db.get(ReadOption(), f'{i:03d}', value), Status.OK())
+            self.assertEqual(value, [f'v{i:03d}'])
+        db.close()
+
+    def test_sync_write(self):
+        db_name = f'tmp_{random_user_str(10)}'
+        db_option = DBOption()
+        db_option.create_if_missing = True
+        db_option.wal_bytes_per_sync = 4096
+        db, s = DB.open(db_name, db_option)
+        self.assertEqual(s, Status.OK())
+        write_option = WriteOption()
+        for i in range(200):
+            write_option.sync = i % 50 == 0
+            self.assertEqual(db.put(write_option, f'{i:06d}', 'v' * 100), Status.OK())
+        self.assertIn('Count: 4 ', db.get_property('spadgerdb.wal-sync-micros'))
+        db.close()
+        self.assertNotIn('Count: 0 ', db.get_property('spadgerdb.wal-background-sync-micros'))
+
+        db2, s = DB.open(db_name, db_option)
+        self.assertEqual(s, Status.OK())
+        value = []
+        self.assertEqual(db2.get(ReadOption(), f'{199:06d}', value), Status.OK())
+        self.assertEqual(value, ['v' * 100])
+        db2.close()
+
+    def test_recycle_log_files(self):
+        db_name = f'tmp_{random_user_str(10)}'
+        db_option = DBOption()
+        db_option.create_if_missing = True
+        db_option.write_buffer_size = 32 * 1024
+        db_option.recycle_log_file_num = 2
+        db_option.log_preallocate_size = 16 * 1024
+        db, s = DB.open(db_name, db_option)
+        self.assertEqual(s, Status.OK())
+        log_numbers = set()
+        inodes = set()
+        for i in range(3000):
+            db.put(WriteOption(), f'{i:06d}', 'v' * 100)
+            if db.log_number() not in log_numbers:
+                log_numbers.add(db.log_number())
+                inodes.add(os.stat(utils.log_file_name(db_name, db.log_number())).st_ino)
+        wait_for_background_work(db)
+        # The files of the obsolete logs are reused by the new logs
+        self.assertGreater(len(log_numbers), 4)
+        self.assertLess(len(inodes), len(log_numbers))
+        self.assertLessEqual(len([name for name in os.listdir(db_name) if name.endswith('.log')]), 4)
+        last_sequence = db.last_sequence()
+        db.close()
+
+        db2, s = DB.open(db_name, db_option)
+        self.assertEqual(s, Status.OK())
+        self.assertEqual(db2.last_sequence(), last_sequence)
+        for i in range(0, 3000, 7):
+            value = []
+            self.assertEqual(db2.get(ReadOption(), f'{i:06d}', value), Status.OK())
+            self.assertEqual(value, ['v' * 100])
+        db2.close()
+
     def test_recover_wal_many_times(self):
         db_name = f'tmp_{random_user_str(10)}'
         db_option = DBOption()
@@ -375,8 +647,8 @@ class DBTest(unittest.TestCase):
             if len_sum >= 1200:
                 break
 
-        self.assertTrue(db._has_imm)
-        self.assertIsNotNone(db._imm)
+        # The immutable memtable is flushed in background, so it may have become a table.
+        self.assertTrue(db._has_imm or db.versions.num_level_files(0) > 0)
 
         for (k, v) in data.items():
             value = []
@@ -386,3 +658,398 @@ class DBTest(unittest.TestCase):
             self.assertEqual(value[0], v)
 
         db.close()
+
+    def test_flush_to_table(self):
+        db_name = f'tmp_{random_user_str(10)}'
+        db_option = DBOption()
+        db_option.create_if_missing = True
+        db_option.write_buffer_size = 4 * 1024
+        db_option.block_size = 256
+        db, s = DB.open(db_name, db_option)
+        self.assertTrue(s.ok())
+
+        data = {}
+        for i in range(500):
+            key = random_user_str(16)
+            value = random_user_str(32)
+            s = db.put(WriteOption(), key, value)
+            self.assertTrue(s.ok())
+            data[key] = value
+        deleted = random.sample(list(data.keys()), 50)
+        for key in deleted:
+            s = db.delete(WriteOption(), key)
+            self.assertTrue(s.ok())
+            del data[key]
+
+        self.assertGreater(db.versions.num_level_files(0), 0)
+        self.assertTrue(any(name.endswith('.sst') for name in os.listdir(db_name)))
+
+        def check(d: DB):
+            for (k, v) in data.items():
+                value = []
+                s = d.get(ReadOption(), k, value)
+                self.assertTrue(s.ok())
+                self.assertEqual(value, [v])
+            for k in deleted:
+                value = []
+                s = d.get(ReadOption(), k, value)
+                self.assertEqual(s, Status.NotFound())
+            value = []
+            self.assertEqual(d.get(ReadOption(), 'not_exist_key', value), Status.NotFound())
+
+        check(db)
+        self.assertGreater(int(db.get_property('spadgerdb.block-cache-misses')), 0)
+        hits = int(db.get_property('spadgerdb.block-cache-hits'))
+        check(db)
+        self.assertGreater(int(db.get_property('spadgerdb.block-cache-hits')), hits)
+        self.assertGreater(int(db.get_property('spadgerdb.block-cache-usage')), 0)
+        self.assertIsNone(db.get_property('spadgerdb.unknown'))
+        db.close()
+        num_files = db.versions.num_level_files(0)
+        self.assertEqual(db.get_property('spadgerdb.num-files-at-level0'), str(num_files))
+
+        db2, s = DB.open(db_name, db_option)
+        self.assertTrue(s.ok())
+        # The entries replayed from the log are written to a new level-0 table
+        self.assertEqual(db2.versions.num_level_files(0), num_files + 1)
+        self.assertEqual([name for name in os.listdir(db_name) if name.endswith('.log')], [f'{db2.log_number()}.log'])
+        check(db2)
+        db2.close()
+
+    def test_write_while_flushing(self):
+        db_name = f'tmp_{random_user_str(10)}'
+        db_option = DBOption()
+        db_option.create_if_missing = True
+        db_option.write_buffer_size = 2 * 1024
+        db, s = DB.open(db_name, db_option)
+        self.assertTrue(s.ok())
+
+        # Writers fill memtables much faster than they are flushed,
+        # so they have to wait for the background flush.
+        thread_num = 4
+        data: List[Dict[str, str]] = [{} for _ in range(thread_num)]
+        errors = []
+
+        def write(index: int):
+            for i in range(200):
+                key = f'{index}_{random_user_str(16)}'
+                value = random_user_str(32)
+                s = db.put(WriteOption(), key, value)
+                if not s.ok():
+                    errors.append(s)
+                data[index][key] = value
+
+        threads = [threading.Thread(target=write, args=(i,)) for i in range(thread_num)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertGreater(db.versions.num_level_files(0), 0)
+
+        for d in data:
+            for (k, v) in d.items():
+                value = []
+                s = db.get(ReadOption(), k, value)
+                self.assertTrue(s.ok())
+                self.assertEqual(value, [v])
+        db.close()
+
+        db2, s = DB.open(db_name, db_option)
+        self.assertTrue(s.ok())
+        for d in data:
+            for (k, v) in d.items():
+                value = []
+                s = db2.get(ReadOption(), k, value)
+                self.assertTrue(s.ok())
+                self.assertEqual(value, [v])
+        db2.close()
+
+    def test_build_batch_group(self):
+        db_name = f'tmp_{random_user_str(10)}'
+        db_option = DBOption()
+        db_option.create_if_missing = True
+        db, s = DB.open(db_name, db_option)
+        self.assertTrue(s.ok())
+
+        def request(n: int, sync: bool = False) -> WriteRequest:
+            batch = WriteBatch()
+            for i in range(n):
+                batch.put(random_user_str(8), random_user_str(8))
+            return WriteRequest(batch, sync, db._mutex)
+
+        with db._mutex:
+            writers = [request(1), request(2), request(3), request(1, sync=True), request(1)]
+            db._writers.extend(writers)
+            batch, last_writer = db.build_batch_group()
+            # A sync write is not grouped with the writes of a non-sync leader
+            self.assertIs(last_writer, writers[2])
+            self.assertEqual(batch.count(), 6)
+            self.assertEqual(writers[0].batch.count(), 1)
+            db._tmp_batch.clear()
+
+            db._writers.clear()
+            db._writers.extend(writers[3:])
+            batch, last_writer = db.build_batch_group()
+            # A sync leader takes the non-sync writes along
+            self.assertIs(last_writer, writers[4])
+            self.assertEqual(batch.count(), 2)
+            db._tmp_batch.clear()
+            db._writers.clear()
+        db.close()
+
+    def test_group_commit(self):
+        db_name = f'tmp_{random_user_str(10)}'
+        db_option = DBOption()
+        db_option.create_if_missing = True
+        db, s = DB.open(db_name, db_option)
+        self.assertTrue(s.ok())
+
+        thread_num = 8
+        num_writes = 200
+        errors = []
+
+        def write(index: int):
+            option = WriteOption()
+            option.sync = index % 2 == 0
+            for i in range(num_writes):
+                batch = WriteBatch()
+                batch.put(f'{index}_{i}', f'{i}')
+                batch.delete(f'{index}_{i}_deleted')
+                s = db.write(option, batch)
+                if not s.ok():
+                    errors.append(s)
+
+        threads = [threading.Thread(target=write, args=(i,)) for i in range(thread_num)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(db._writers), 0)
+        self.assertEqual(db.last_sequence(), thread_num * num_writes * 2)
+        db.close()
+
+        db2, s = DB.open(db_name, db_option)
+        self.assertTrue(s.ok())
+        self.assertEqual(db2.last_sequence(), thread_num * num_writes * 2)
+        for index in range(thread_num):
+            for i in range(num_writes):
+                value = []
+                s = db2.get(ReadOption(), f'{index}_{i}', value)
+                self.assertTrue(s.ok())
+                self.assertEqual(value, [f'{i}'])
+        db2.close()
+
+    def test_concurrent_read_write(self):
+        db_name = f'tmp_{random_user_str(10)}'
+        db_option = DBOption()
+        db_option.create_if_missing = True
+        db_option.write_buffer_size = 4 * 1024
+        db_option.block_size = 256
+        db, s = DB.open(db_name, db_option)
+        self.assertTrue(s.ok())
+
+        num_keys = 50
+        for i in range(num_keys):
+            self.assertTrue(db.put(WriteOption(), f'key{i}', '0').ok())
+
+        done = threading.Event()
+        errors = []
+
+        def write(index: int):
+            # Every round increases the values of all the keys
+            for r in range(1, 20):
+                for i in range(index, num_keys, 2):
+                    s = db.put(WriteOption(), f'key{i}', str(r))
+                    if not s.ok():
+                        errors.append(s)
+
+        def read():
+            last = [0] * num_keys
+            while not done.is_set():
+                for i in range(num_keys):
+                    value = []
+                    s = db.get(ReadOption(), f'key{i}', value)
+                    if not s.ok():
+                        errors.append(s)
+                        continue
+                    # A reader never observes a value older than one it has seen
+                    if int(value[0]) < last[i]:
+                        errors.append(f'key{i}: {value[0]} < {last[i]}')
+                    last[i] = int(value[0])
+
+        writers = [threading.Thread(target=write, args=(i,)) for i in range(2)]
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for t in readers + writers:
+            t.start()
+        for t in writers:
+            t.join()
+        done.set()
+        for t in readers:
+            t.join()
+        self.assertEqual(errors, [])
+
+        for i in range(num_keys):
+            value = []
+            self.assertTrue(db.get(ReadOption(), f'key{i}', value).ok())
+            self.assertEqual(value, ['19'])
+        # Reads release the versions they reference
+        wait_for_background_work(db)
+        with db._mutex:
+            self.assertEqual(db.versions.current().get_ref(), 1)
+        db.close()
+
+    def test_compaction(self):
+        db_name = f'tmp_{random_user_str(10)}'
+        db_option = DBOption()
+        db_option.create_if_missing = True
+        db_option.write_buffer_size = 4 * 1024
+        db_option.block_size = 256
+        db_option.max_file_size = 8 * 1024
+        db_option.max_bytes_for_level_base = 32 * 1024
+        db, s = DB.open(db_name, db_option)
+        self.assertTrue(s.ok())
+
+        keys = [random_user_str(16) for _ in range(300)]
+        data = {}
+        for i in range(3000):
+            key = random.choice(keys)
+            if random.random() < 0.1:
+                s = db.delete(WriteOption(), key)
+                data.pop(key, None)
+            else:
+                value = random_user_str(32)
+                s = db.put(WriteOption(), key, value)
+                data[key] = value
+            self.assertTrue(s.ok())
+        wait_for_background_work(db)
+
+        self.assertLess(db.versions.num_level_files(0), 4)
+        self.assertGreater(sum(db.versions.num_level_files(level) for level in range(1, 7)), 0)
+        # Overwritten entries are dropped, so the tables are much smaller than everything written.
+        total_bytes = sum(db.versions.num_level_bytes(level) for level in range(7))
+        self.assertLess(total_bytes, 3000 * (16 + 32))
+
+        def check(d: DB):
+            for k in keys:
+                value = []
+                s = d.get(ReadOption(), k, value)
+                if k in data:
+                    self.assertTrue(s.ok())
+                    self.assertEqual(value, [data[k]])
+                else:
+                    self.assertEqual(s, Status.NotFound())
+
+        check(db)
+        # The reads may have scheduled a seek compaction
+        wait_for_background_work(db)
+        db.close()
+        live_tables = set()
+        db.versions.add_live_files(live_tables)
+        self.assertEqual(set(int(name[:-4]) for name in os.listdir(db_name) if name.endswith('.sst')), live_tables)
+
+        db2, s = DB.open(db_name, db_option)
+        self.assertTrue(s.ok())
+        check(db2)
+        db2.close()
+
+    def test_iterator(self):
+        db_name = f'tmp_{random_user_str(10)}'
+        db_option = DBOption()
+        db_option.create_if_missing = True
+        db_option.write_buffer_size = 4 * 1024
+        db_option.block_size = 256
+        db_option.max_file_size = 8 * 1024
+        db_option.max_bytes_for_level_base = 32 * 1024
+        db, s = DB.open(db_name, db_option)
+        self.assertTrue(s.ok())
+
+        it = db.new_iterator(ReadOption())
+        it.seek_to_first()
+        self.assertFalse(it.valid())
+        it.close()
+
+        keys = [random_user_str(8) for _ in range(300)]
+        data = {}
+        for i in range(2000):
+            key = random.choice(keys)
+            if random.random() < 0.1:
+                s = db.delete(WriteOption(), key)
+                data.pop(key, None)
+            else:
+                value = random_user_str(32)
+                s = db.put(WriteOption(), key, value)
+                data[key] = value
+            self.assertTrue(s.ok())
+        # Data is spread over the memtables and the tables
+        self.assertGreater(sum(db.versions.num_level_files(level) for level in range(7)), 0)
+
+        snapshot = db.get_snapshot()
+        expected = sorted(data.items())
+        for key in keys[:50]:
+            db.put(WriteOption(), key, 'new')
+
+        option = ReadOption()
+        option.snapshot = snapshot
+        with db.new_iterator(option) as it:
+            entries = []
+            it.seek_to_first()
+            while it.valid():
+                entries.append((it.key(), it.value()))
+                it.next()
+            self.assertTrue(it.status().ok())
+            self.assertEqual(entries, expected)
+
+            entries = []
+            it.seek_to_last()
+            while it.valid():
+                entries.append((it.key(), it.value()))
+                it.prev()
+            self.assertEqual(entries, list(reversed(expected)))
+
+        option.lower_bound = expected[10][0]
+        option.upper_bound = expected[20][0]
+        with db.new_iterator(option) as it:
+            entries = []
+            it.seek_to_first()
+            while it.valid():
+                entries.append((it.key(), it.value()))
+                it.next()
+            self.assertEqual(entries, expected[10:20])
+        db.release_snapshot(snapshot)
+
+        # The iterators release the versions they reference
+        wait_for_background_work(db)
+        with db._mutex:
+            self.assertEqual(db.versions.current().get_ref(), 1)
+        db.close()
+
+    def test_compaction_keeps_snapshot(self):
+        db_name = f'tmp_{random_user_str(10)}'
+        db_option = DBOption()
+        db_option.create_if_missing = True
+        db_option.write_buffer_size = 2 * 1024
+        db_option.max_file_size = 4 * 1024
+        db, s = DB.open(db_name, db_option)
+        self.assertTrue(s.ok())
+
+        db.put(WriteOption(), 'foo', 'v1')
+        snapshot = db.get_snapshot()
+        db.put(WriteOption(), 'foo', 'v2')
+        db.delete(WriteOption(), 'bar')
+        for i in range(1000):
+            db.put(WriteOption(), random_user_str(16), random_user_str(32))
+        wait_for_background_work(db)
+        self.assertGreater(sum(db.versions.num_level_files(level) for level in range(1, 7)), 0)
+
+        option = ReadOption()
+        option.snapshot = snapshot
+        value = []
+        self.assertTrue(db.get(option, 'foo', value).ok())
+        self.assertEqual(value, ['v1'])
+        value = []
+        self.assertTrue(db.get(ReadOption(), 'foo', value).ok())
+        self.assertEqual(value, ['v2'])
+        db.release_snapshot(snapshot)
+        db.close()
@@ -26,7 +26,7 @@ class LookupKeyTest(TestCase):
         user_key = 'hello'
         sequence = 1
         lookup_key = LookupKey(user_key, sequence)
-        self.assertEqual(len(lookup_key.memtable_key()), len(user_key) + 8 + 4)
+        self.assertEqual(len(lookup_key.memtable_key()), len(user_key) + 8 + 1)
 
     def test_value_type_and_sequence_number(self):
         internal_key_bytes = Encoder.encode_user_key_sequence_type(
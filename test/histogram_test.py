@@ -0,0 +1,59 @@
+import unittest
+
+from histogram import Histogram
+
+
+class HistogramTest(unittest.TestCase):
+    def test_empty(self):
+        h = Histogram()
+        self.assertEqual(h.num(), 0)
+        self.assertEqual(h.average(), 0.0)
+        self.assertEqual(h.median(), 0.0)
+        self.assertIn('Count: 0', str(h))
+
+    def test_percentiles(self):
+        h = Histogram()
+        for v in range(1, 1001):
+            h.add(v)
+        self.assertEqual(h.num(), 1000)
+        self.assertAlmostEqual(h.average(), 500.5)
+        self.assertAlmostEqual(h.standard_deviation(), 288.67, places=2)
+        # The percentiles are interpolated within the buckets
+        self.assertAlmostEqual(h.median(), 500, delta=25)
+        self.assertAlmostEqual(h.percentile(99), 990, delta=50)
+        self.assertEqual(h.percentile(100), 1000)
+        self.assertIn('Min: 1.0000', str(h))
+        self.assertIn('Max: 1000.0000', str(h))
+
+    def test_single_value(self):
+        h = Histogram()
+        h.add(123.5)
+        # The interpolation is clamped to the values added
+        self.assertEqual(h.median(), 123.5)
+        self.assertEqual(h.percentile(1), 123.5)
+        self.assertEqual(h.standard_deviation(), 0.0)
+
+    def test_large_value(self):
+        h = Histogram()
+        h.add(1e300)
+        # The values past the bucket limits are counted in the last bucket
+        self.assertEqual(h.num(), 1)
+        self.assertEqual(h.average(), 1e300)
+        self.assertEqual(h.percentile(0), 1e300)
+
+    def test_merge(self):
+        h1 = Histogram()
+        h2 = Histogram()
+        for v in range(100):
+            h1.add(v)
+            h2.add(v + 100)
+        h1.merge(h2)
+        self.assertEqual(h1.num(), 200)
+        self.assertAlmostEqual(h1.average(), 99.5)
+        self.assertEqual(h1.percentile(100), 199)
+        h1.clear()
+        self.assertEqual(h1.num(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,11 @@
 import unittest
+import zlib
+
+import log_format
+from histogram import Histogram
 from log_writer import Writer
-from log_reader import Reader
+from log_reader import Reader, Reporter
+from status import Status
 import os
 from test.test_utils import random_user_str
 
@@ -54,6 +59,248 @@ class LogTest(unittest.TestCase):
             if os.path.exists(log_name):
                 os.remove(log_name)
 
+    def test_legacy_format(self):
+        try:
+            log_name = f'tmp_{random_user_str(10)}'
+            # A log written before the format header, with 4 bytes lengths
+            keys = [random_user_str(100) for _ in range(10)]
+            with open(log_name, 'wb') as f:
+                for key in keys:
+                    record = bytearray(len(key).to_bytes(4, 'little'))
+                    record.extend(key.encode('utf-8'))
+                    record.extend(zlib.crc32(record).to_bytes(4, 'little'))
+                    f.write(record)
+
+            # Appending keeps the format of the existing file
+            writer = Writer(log_name)
+            keys.append(random_user_str(100))
+            writer.write_record(bytearray(keys[-1].encode('utf-8')))
+            writer.close()
+
+            reader = Reader(log_name)
+            self.assertEqual(reader.version(), log_format.LEGACY_VERSION)
+            for key in keys:
+                self.assertEqual(key, reader.read_record().decode('utf-8'))
+            self.assertIsNone(reader.read_record())
+        finally:
+            if os.path.exists(log_name):
+                os.remove(log_name)
+
+    def test_varint_format(self):
+        try:
+            log_name = f'tmp_{random_user_str(10)}'
+            with open(log_name, 'wb') as f:
+                f.write(log_format.encode_header(log_format.VARINT_VERSION))
+            writer = Writer(log_name)
+            records = [b'', b'x' * 127, b'y' * 128, b'z' * 100000]
+            for record in records:
+                writer.write_record(bytearray(record))
+            writer.close()
+            # header + (1 + 0) + (1 + 127) + (2 + 128) + (3 + 100000) + 4 checksums
+            self.assertEqual(os.path.getsize(log_name), log_format.HEADER_SIZE + 100262 + 4 * 4)
+
+            reader = Reader(log_name)
+            self.assertEqual(reader.version(), log_format.VARINT_VERSION)
+            for record in records:
+                self.assertEqual(record, reader.read_record())
+            self.assertIsNone(reader.read_record())
+        finally:
+            if os.path.exists(log_name):
+                os.remove(log_name)
+
+
+class RecordingReporter(Reporter):
+    def __init__(self):
+        self.dropped_bytes = 0
+        self.messages = []
+
+    def corruption(self, nbytes: int, status: Status):
+        self.dropped_bytes += nbytes
+        self.messages.append(status.msg)
+
+
+class BlockLogTest(unittest.TestCase):
+    def setUp(self):
+        self._log_name = f'tmp_{random_user_str(10)}'
+        self._reporter = RecordingReporter()
+
+    def tearDown(self):
+        if os.path.exists(self._log_name):
+            os.remove(self._log_name)
+
+    def write(self, *records: bytes):
+        writer = Writer(self._log_name)
+        for record in records:
+            writer.write_record(bytearray(record))
+        writer.close()
+
+    def read_all(self) -> list:
+        reader = Reader(self._log_name, self._reporter)
+        self.assertEqual(reader.version(), log_format.BLOCK_VERSION)
+        records = []
+        while True:
+            record = reader.read_record()
+            if record is None:
+                return records
+            records.append(bytes(record))
+
+    def corrupt(self, offset: int, delta: int = 0x80):
+        with open(self._log_name, 'r+b') as f:
+            f.seek(offset)
+            byte = f.read(1)
+            f.seek(offset)
+            f.write(bytes([(byte[0] + delta) & 0xff]))
+
+    def test_empty(self):
+        self.write()
+        self.assertEqual(self.read_all(), [])
+
+    def test_fragmentation(self):
+        records = [b'small', b'', b'm' * 50000, b'l' * (3 * log_format.BLOCK_SIZE + 100)]
+        self.write(*records)
+        self.assertEqual(self.read_all(), records)
+        self.assertEqual(self._reporter.dropped_bytes, 0)
+
+    def test_marginal_trailer(self):
+        # Make the first record leave less than a record header in the first block
+        n = log_format.BLOCK_SIZE - log_format.HEADER_SIZE - log_format.RECORD_HEADER_SIZE - 3
+        records = [b'f' * n, b'', b'bar']
+        self.write(*records)
+        self.assertEqual(os.path.getsize(self._log_name), log_format.BLOCK_SIZE + 2 * log_format.RECORD_HEADER_SIZE + 3)
+        self.assertEqual(self.read_all(), records)
+        self.assertEqual(self._reporter.dropped_bytes, 0)
+
+    def test_append_to_existing_file(self):
+        self.write(b'x' * (log_format.BLOCK_SIZE - 100))
+        # A second writer continues at the offset in the current block
+        self.write(b'y' * 1000, b'z')
+        self.assertEqual(self.read_all(), [b'x' * (log_format.BLOCK_SIZE - 100), b'y' * 1000, b'z'])
+
+    def test_truncated_tail(self):
+        self.write(b'foo', b'bar' * 1000)
+        for size in [1, log_format.RECORD_HEADER_SIZE + 1]:
+            with open(self._log_name, 'r+b') as f:
+                f.truncate(os.path.getsize(self._log_name) - size)
+            # A record torn by a crash is not a corruption
+            self.assertEqual(self.read_all(), [b'foo'])
+            self.assertEqual(self._reporter.dropped_bytes, 0)
+
+    def test_checksum_mismatch_resync(self):
+        first = b'a' * 100
+        spanning = b'b' * log_format.BLOCK_SIZE
+        last = b'c' * 100
+        self.write(first, spanning, last)
+        self.corrupt(log_format.HEADER_SIZE + log_format.RECORD_HEADER_SIZE + 10)
+        # The rest of the first block is dropped, the reader resyncs at the next block
+        self.assertEqual(self.read_all(), [last])
+        self.assertGreaterEqual(self._reporter.dropped_bytes, log_format.BLOCK_SIZE - log_format.HEADER_SIZE)
+        self.assertIn('checksum mismatch', self._reporter.messages)
+
+    def test_checksum_not_verified(self):
+        self.write(b'foo', b'bar')
+        self.corrupt(log_format.HEADER_SIZE + log_format.RECORD_HEADER_SIZE)
+        reader = Reader(self._log_name, self._reporter, checksum=False)
+        self.assertEqual(bytes(reader.read_record()), bytes([ord('f') ^ 0x80]) + b'oo')
+        self.assertEqual(bytes(reader.read_record()), b'bar')
+
+    def test_bad_record_length(self):
+        payload_size = log_format.BLOCK_SIZE - log_format.HEADER_SIZE - log_format.RECORD_HEADER_SIZE
+        self.write(b'x' * payload_size, b'foo')
+        # Least significant size byte is stored in header[4]
+        self.corrupt(log_format.HEADER_SIZE + 4, 1)
+        self.assertEqual(self.read_all(), [b'foo'])
+        self.assertIn('bad record length', self._reporter.messages)
+
+    def test_preallocated_zeroes(self):
+        self.write(b'foo', b'bar')
+        with open(self._log_name, 'ab') as f:
+            f.write(bytes(2 * log_format.BLOCK_SIZE))
+        self.assertEqual(self.read_all(), [b'foo', b'bar'])
+        self.assertEqual(self._reporter.dropped_bytes, 0)
+
+    def test_preallocate(self):
+        writer = Writer(self._log_name, preallocate_size=4096)
+        for record in (b'foo', b'bar'):
+            writer.write_record(bytearray(record))
+        writer.flush()
+        if hasattr(os, 'posix_fallocate'):
+            self.assertEqual(os.path.getsize(self._log_name), 4096)
+        writer.close()
+        # The unused space is released on close
+        self.assertEqual(os.path.getsize(self._log_name), writer.write_size())
+        self.write(b'x' * 5000)
+        self.assertEqual(self.read_all(), [b'foo', b'bar', b'x' * 5000])
+        self.assertEqual(self._reporter.dropped_bytes, 0)
+
+    def test_sync(self):
+        sync_histogram = Histogram()
+        background_sync_histogram = Histogram()
+        writer = Writer(self._log_name, bytes_per_sync=4096, sync_histogram=sync_histogram,
+                        background_sync_histogram=background_sync_histogram)
+        for i in range(100):
+            writer.write_record(bytearray(b'x' * 1000))
+            writer.flush()
+        writer.write_record(bytearray(b'foo'))
+        writer.sync()
+        writer.close()
+        self.assertEqual(sync_histogram.num(), 1)
+        # The background syncs are merged while one is running
+        self.assertGreater(background_sync_histogram.num(), 0)
+        self.assertLessEqual(background_sync_histogram.num(), 100 * 1000 // 4096)
+        self.assertEqual(self.read_all(), [b'x' * 1000] * 100 + [b'foo'])
+
+
+class RecyclableLogTest(unittest.TestCase):
+    def setUp(self):
+        self._log_name = f'tmp_{random_user_str(10)}'
+        self._reporter = RecordingReporter()
+
+    def tearDown(self):
+        if os.path.exists(self._log_name):
+            os.remove(self._log_name)
+
+    def write(self, log_number: int, *records: bytes, reuse: bool = False):
+        writer = Writer(self._log_name, log_number, reuse)
+        for record in records:
+            writer.write_record(bytearray(record))
+        writer.close()
+
+    def read_all(self, log_number: int) -> list:
+        reader = Reader(self._log_name, self._reporter, log_number=log_number)
+        self.assertEqual(reader.version(), log_format.RECYCLABLE_VERSION)
+        records = []
+        while True:
+            record = reader.read_record()
+            if record is None:
+                return records
+            records.append(bytes(record))
+
+    def test_round_trip(self):
+        records = [b'foo', b'', b'x' * 100000, b'bar']
+        self.write(7, *records)
+        self.assertEqual(self.read_all(7), records)
+        self.assertEqual(self._reporter.dropped_bytes, 0)
+
+    def test_reuse(self):
+        self.write(7, *[random_user_str(1000).encode() for _ in range(100)])
+        self.write(8, b'foo', b'bar', reuse=True)
+        self.assertEqual(self.read_all(8), [b'foo', b'bar'])
+        self.assertEqual(self._reporter.dropped_bytes, 0)
+
+    def test_other_log_number(self):
+        self.write(7, b'foo', b'bar')
+        self.assertEqual(self.read_all(8), [])
+
+    def test_torn_tail(self):
+        self.write(7, b'x' * 1000, b'y' * 1000)
+        self.write(8, b'foo', reuse=True)
+        # A torn write of the second record over the leftovers of log 7
+        with open(self._log_name, 'r+b') as f:
+            f.seek(log_format.HEADER_SIZE + log_format.RECYCLABLE_RECORD_HEADER_SIZE + 3)
+            f.write(bytes((0, 0, 0, 0, 100)))
+        self.assertEqual(self.read_all(8), [b'foo'])
+        self.assertEqual(self._reporter.dropped_bytes, 0)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,8 @@
-from memtable import MemTable
+import random
+
+from memtable import MemTable, encode_comparable_key, decode_comparable_key
 from unittest import TestCase
-from dbformat import ValueType, LookupKey
+from dbformat import ValueType, LookupKey, InternalKey
 from status import Status
 from test.test_utils import random_user_str
 
@@ -105,3 +107,55 @@ class MemtableTest(TestCase):
                 self.assertTrue(mem.get(lkey, value, s))
                 self.assertEqual(s, Status.NotFound())
                 self.assertEqual(len(value), 0)
+
+    def test_iterator_order(self):
+        mem = MemTable()
+        entries = [('b', 1), ('a', 2), ('b', 3), ('中文', 4), ('ab', 5), ('a', 6)]
+        for key, seq in entries:
+            mem.add(seq, key, f'{key}{seq}', ValueType.kTypeValue)
+
+        # Increasing user key as utf-8 bytes, decreasing sequence number
+        it = mem.new_iterator()
+        it.seek_to_first()
+        found = []
+        while it.valid():
+            found.append((InternalKey.extract_user_key(it.key()).decode('utf-8'),
+                          InternalKey.extract_sequence(it.key()), it.value().decode('utf-8')))
+            it.next()
+        self.assertEqual(found, [('a', 6, 'a6'), ('a', 2, 'a2'), ('ab', 5, 'ab5'), ('b', 3, 'b3'),
+                                 ('b', 1, 'b1'), ('中文', 4, '中文4')])
+
+        it.seek(InternalKey.make('b'.encode('utf-8'), 2, ValueType.kTypeValue))
+        self.assertEqual(InternalKey.extract_sequence(it.key()), 1)
+
+        value = []
+        s = Status.OK()
+        self.assertTrue(mem.get(LookupKey('中文', 4), value, s))
+        self.assertEqual(value, ['中文4'])
+        self.assertFalse(mem.get(LookupKey('中文', 3), [], s))
+
+    def test_comparable_key(self):
+        user_keys = [b'', b'\x00', b'\x00\x00', b'\x00\xff', b'a', b'a\x00', b'a\x00b', b'a\xff', b'ab', b'b']
+        internal_keys = []
+        for user_key in user_keys:
+            for seq in [0, 1, 255, 256, 1 << 40]:
+                for t in ValueType:
+                    internal_keys.append(InternalKey.make(user_key, seq, t))
+        random.shuffle(internal_keys)
+
+        for internal_key in internal_keys:
+            self.assertEqual(decode_comparable_key(encode_comparable_key(
+                InternalKey.extract_user_key(internal_key), InternalKey.extract_sequence(internal_key),
+                internal_key[-1])), internal_key)
+        # The comparable keys are ordered like the internal keys
+        by_comparable = sorted(internal_keys, key=lambda k: encode_comparable_key(
+            InternalKey.extract_user_key(k), InternalKey.extract_sequence(k), k[-1]))
+        self.assertEqual(by_comparable, sorted(internal_keys, key=InternalKey.sort_key))
+
+    def test_memory_usage(self):
+        mem = MemTable()
+        for i in range(1000):
+            mem.add(i + 1, f'{i:016d}', 'x' * 100, ValueType.kTypeValue)
+        # The usage counts the entries and the skiplist, without a large per-entry overhead
+        self.assertGreater(mem.approximate_memory_usage(), 1000 * 116)
+        self.assertLess(mem.approximate_memory_usage(), 1000 * (116 + 100))
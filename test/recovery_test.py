@@ -0,0 +1,95 @@
+import os
+import unittest
+
+import recovery
+from log_reader import Reader
+from log_writer import Writer
+from memtable import encode_comparable_key
+from option import DBOption
+from test.test_utils import random_user_str
+from write_batch import WriteBatch
+
+
+class RecoveryTest(unittest.TestCase):
+    def setUp(self):
+        self._log_name = f'tmp_{random_user_str(10)}'
+        writer = Writer(self._log_name)
+        sequence = 1
+        for i in range(2000):
+            batch = WriteBatch()
+            batch.put(f'key{i}', f'value{i}' * 100)
+            if i % 3 == 0:
+                batch.delete(f'key{i - 1}')
+            batch.set_sequence_number(sequence)
+            sequence += batch.count()
+            record = batch.serialize()
+            if i == 1000:
+                # A batch with a wrong count
+                record = bytearray(record)
+                record[4] += 1
+            writer.write_record(record)
+        # A record too small to be a batch
+        writer.write_record(bytearray(b'abc'))
+        writer.close()
+
+    def tearDown(self):
+        if os.path.exists(self._log_name):
+            os.remove(self._log_name)
+
+    def decode_all(self, executor=None) -> list:
+        reader = Reader(self._log_name)
+        result = list(recovery.read_decoded_records(reader, executor, 2))
+        reader.close()
+        return result
+
+    def test_decode_record(self):
+        batch = WriteBatch()
+        batch.put('a', 'va')
+        batch.delete('b')
+        batch.set_sequence_number(10)
+        s, last_sequence, entries = recovery.decode_record(batch.serialize())
+        self.assertTrue(s.ok())
+        self.assertEqual(last_sequence, 11)
+        self.assertEqual(entries, [(encode_comparable_key(b'a', 10, 1), b'va'), (encode_comparable_key(b'b', 11, 0), b'')])
+
+        s, _, entries = recovery.decode_record(b'abc')
+        self.assertFalse(s.ok())
+        self.assertEqual(entries, [])
+
+    def test_sequential(self):
+        result = self.decode_all()
+        self.assertEqual(len(result), 2001)
+        self.assertEqual([i for i, r in enumerate(result) if not r[0].ok()], [1000, 2000])
+        last_sequences = [r[1] for r in result if r[0].ok()]
+        self.assertEqual(last_sequences, sorted(last_sequences))
+
+    def test_workers_are_opt_in(self):
+        # Forking the workers is unsafe in a process running other threads
+        self.assertIsNone(recovery.new_executor(DBOption().recovery_workers))
+
+    def test_parallel_matches_sequential(self):
+        executor = recovery.new_executor(2)
+        if executor is None:
+            self.skipTest('worker processes are not supported')
+        with executor:
+            parallel = self.decode_all(executor)
+        sequential = self.decode_all()
+        self.assertEqual(len(parallel), len(sequential))
+        for p, s in zip(parallel, sequential):
+            self.assertEqual(p[0].ok(), s[0].ok())
+            self.assertEqual(p[1:], s[1:])
+
+    def test_stop_early(self):
+        executor = recovery.new_executor(2)
+        if executor is None:
+            self.skipTest('worker processes are not supported')
+        with executor:
+            reader = Reader(self._log_name)
+            records = recovery.read_decoded_records(reader, executor, 2)
+            self.assertTrue(next(records)[0].ok())
+            records.close()
+            reader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -149,6 +149,26 @@ class IteratorTest(TestCase):
         it.seek(1000)
         self.assertIsNone(it.current())
 
+    def test_reverse_iterator(self):
+        # A comparator in reverse order makes sure the comparator is honored
+        sl = Skiplist(comparator=lambda x, y: 0 if x == y else -1 if x > y else 1)
+        it = sl.iter()
+        it.seek_to_last()
+        self.assertFalse(it.valid())
+
+        for i in range(1000):
+            sl.insert(i, None)
+        it.seek_to_last()
+        for i in range(1000):
+            self.assertTrue(it.valid())
+            self.assertEqual(it.key(), i)
+            it.prev()
+        self.assertFalse(it.valid())
+
+        it.seek(500)
+        it.prev()
+        self.assertEqual(it.key(), 501)
+
     def test_iterator_while_modify(self):
         sl = Skiplist()
         for i in range(1000):
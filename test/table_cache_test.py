@@ -0,0 +1,124 @@
+import os
+import shutil
+import unittest
+
+from cache import LRUCache
+from dbformat import Encoder, ValueType
+from option import DBOption, ReadOption
+from status import Status
+from table_builder import TableBuilder
+from table_cache import TableCache
+from test.test_utils import random_user_str
+from utils import table_file_name
+
+
+def internal_key(user_key: str, seq: int) -> bytes:
+    return bytes(Encoder.encode_user_key_sequence_type(user_key, seq, ValueType.kTypeValue))
+
+
+class TableCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.db_name = f'tmp_{random_user_str(10)}'
+        os.mkdir(self.db_name)
+        self.option = DBOption()
+        self.option.block_size = 256
+
+    def tearDown(self):
+        shutil.rmtree(self.db_name, ignore_errors=True)
+
+    def build_table(self, number: int, entries) -> int:
+        with open(table_file_name(self.db_name, number), 'wb') as f:
+            builder = TableBuilder(self.option, f)
+            for k, v in entries:
+                builder.add(k, v)
+            s = builder.finish()
+            self.assertEqual(s, Status.OK())
+            return builder.file_size()
+
+    def test_find_table(self):
+        entries = [(internal_key(f'{i:04d}', i + 1), random_user_str(20).encode('utf-8')) for i in range(100)]
+        sizes = {number: self.build_table(number, entries) for number in range(1, 4)}
+        cache = TableCache(self.db_name, self.option, 2)
+
+        s, t1 = cache.find_table(1, sizes[1])
+        self.assertEqual(s, Status.OK())
+        t1.unref()
+        s, t = cache.find_table(1, sizes[1])
+        self.assertIs(t, t1)
+        t.unref()
+
+        # Opening two more tables evicts and closes the least recently used one
+        for number in (2, 3):
+            s, t = cache.find_table(number, sizes[number])
+            t.unref()
+        self.assertTrue(t1.closed())
+        s, t = cache.find_table(1, sizes[1])
+        self.assertEqual(s, Status.OK())
+        self.assertIsNot(t, t1)
+        t.unref()
+
+        # An evicted table remains usable by its iterators, and is closed with the last one
+        it = cache.new_iterator(ReadOption(), 1, sizes[1])
+        cache.evict(1)
+        self.assertFalse(t.closed())
+        it.seek_to_first()
+        count = 0
+        while it.valid():
+            count += 1
+            it.next()
+        self.assertEqual(count, len(entries))
+        del it
+        self.assertTrue(t.closed())
+
+    def test_close(self):
+        entries = [(internal_key('a', 1), b'v')]
+        sizes = {number: self.build_table(number, entries) for number in range(1, 3)}
+        cache = TableCache(self.db_name, self.option, 10)
+        tables = []
+        for number in (1, 2):
+            s, t = cache.find_table(number, sizes[number])
+            t.unref()
+            tables.append(t)
+        it = cache.new_iterator(ReadOption(), 2, sizes[2])
+
+        cache.close()
+        self.assertTrue(tables[0].closed())
+        self.assertFalse(tables[1].closed())
+        it.seek_to_first()
+        self.assertEqual(it.value(), b'v')
+        del it
+        self.assertTrue(tables[1].closed())
+
+    def test_get(self):
+        entries = [(internal_key(f'{i:04d}', i + 1), random_user_str(20).encode('utf-8')) for i in range(100)]
+        file_size = self.build_table(7, entries)
+        cache = TableCache(self.db_name, self.option, 10, LRUCache(1 << 20))
+
+        for k, v in entries:
+            found = []
+            s = cache.get(ReadOption(), 7, file_size, k, lambda fk, fv: found.append(fv))
+            self.assertEqual(s, Status.OK())
+            self.assertEqual(found, [v])
+
+        it = cache.new_iterator(ReadOption(), 7, file_size)
+        it.seek_to_first()
+        self.assertEqual(it.key(), entries[0][0])
+
+    def test_missing_file(self):
+        cache = TableCache(self.db_name, self.option, 10)
+        s, table = cache.find_table(9, 100)
+        self.assertFalse(s.ok())
+        self.assertIsNone(table)
+        it = cache.new_iterator(ReadOption(), 9, 100)
+        self.assertFalse(it.status().ok())
+
+        # Errors are not cached
+        entries = [(internal_key('a', 1), b'v')]
+        file_size = self.build_table(9, entries)
+        s, table = cache.find_table(9, file_size)
+        self.assertEqual(s, Status.OK())
+        table.unref()
+
+
+if __name__ == '__main__':
+    unittest.main()
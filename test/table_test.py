@@ -0,0 +1,273 @@
+import os
+import unittest
+
+from block import Block
+from block_builder import BlockBuilder
+from cache import LRUCache
+from dbformat import Encoder, ValueType
+from memtable import MemTable
+from option import DBOption, ReadOption
+from status import Status
+from table import Table
+from table_builder import TableBuilder
+from test.test_utils import random_user_str
+from utils import user_key_comparator, raw_internal_key_comparator
+
+
+def internal_key(user_key: str, seq: int, t: ValueType = ValueType.kTypeValue) -> bytes:
+    return bytes(Encoder.encode_user_key_sequence_type(user_key, seq, t))
+
+
+class BlockTest(unittest.TestCase):
+    def build_block(self, keys, restart_interval=16) -> Block:
+        builder = BlockBuilder(restart_interval)
+        for key in keys:
+            builder.add(key, key + b'_value')
+        return Block(bytes(builder.finish()))
+
+    def test_empty(self):
+        block = self.build_block([])
+        it = block.new_iterator(user_key_comparator)
+        it.seek_to_first()
+        self.assertFalse(it.valid())
+        it.seek(b'a')
+        self.assertFalse(it.valid())
+
+    def test_iterate(self):
+        for interval in [1, 2, 16]:
+            keys = sorted(set(random_user_str(10).encode('utf-8') for _ in range(500)))
+            block = self.build_block(keys, interval)
+            it = block.new_iterator(user_key_comparator)
+
+            it.seek_to_first()
+            for key in keys:
+                self.assertTrue(it.valid())
+                self.assertEqual(it.key(), key)
+                self.assertEqual(it.value(), key + b'_value')
+                it.next()
+            self.assertFalse(it.valid())
+
+            it.seek_to_last()
+            for key in reversed(keys):
+                self.assertTrue(it.valid())
+                self.assertEqual(it.key(), key)
+                it.prev()
+            self.assertFalse(it.valid())
+
+            for i, key in enumerate(keys):
+                it.seek(key)
+                self.assertTrue(it.valid())
+                self.assertEqual(it.key(), key)
+                # A target right after key should land on the next key
+                it.seek(key + b'\x00')
+                if i + 1 < len(keys):
+                    self.assertEqual(it.key(), keys[i + 1])
+                else:
+                    self.assertFalse(it.valid())
+            self.assertEqual(it.status(), Status.OK())
+
+
+class TableTest(unittest.TestCase):
+    def setUp(self):
+        self.file_name = f'tmp_{random_user_str(10)}'
+
+    def tearDown(self):
+        if os.path.exists(self.file_name):
+            os.remove(self.file_name)
+
+    def build_table(self, entries, block_size=256, block_cache: LRUCache = None) -> Table:
+        option = DBOption()
+        option.block_size = block_size
+        with open(self.file_name, 'wb') as f:
+            builder = TableBuilder(option, f)
+            for k, v in entries:
+                builder.add(k, v)
+            s = builder.finish()
+            self.assertEqual(s, Status.OK())
+            self.assertEqual(builder.num_entries(), len(entries))
+            file_size = builder.file_size()
+        self.assertEqual(os.path.getsize(self.file_name), file_size)
+
+        s, table = Table.open(option, open(self.file_name, 'rb'), file_size, 1, block_cache)
+        self.assertEqual(s, Status.OK())
+        return table
+
+    def test_iterate(self):
+        user_keys = sorted(set(random_user_str(16) for _ in range(1000)))
+        entries = [(internal_key(k, i + 1), random_user_str(20).encode('utf-8')) for i, k in enumerate(user_keys)]
+        table = self.build_table(entries)
+
+        it = table.new_iterator(ReadOption())
+        it.seek_to_first()
+        for k, v in entries:
+            self.assertTrue(it.valid())
+            self.assertEqual(it.key(), k)
+            self.assertEqual(it.value(), v)
+            it.next()
+        self.assertFalse(it.valid())
+
+        it.seek_to_last()
+        for k, v in reversed(entries):
+            self.assertTrue(it.valid())
+            self.assertEqual(it.key(), k)
+            it.prev()
+        self.assertFalse(it.valid())
+        self.assertEqual(it.status(), Status.OK())
+        table.close()
+
+    def test_internal_get(self):
+        user_keys = sorted(set(random_user_str(16) for _ in range(1000)))
+        entries = [(internal_key(k, i + 1), random_user_str(20).encode('utf-8')) for i, k in enumerate(user_keys)]
+        table = self.build_table(entries)
+
+        for k, v in entries:
+            found = []
+            s = table.internal_get(ReadOption(), k, lambda fk, fv: found.append((fk, fv)))
+            self.assertEqual(s, Status.OK())
+            self.assertEqual(found, [(k, v)])
+
+        found = []
+        greatest = internal_key(user_keys[-1] + 'z', 1)
+        s = table.internal_get(ReadOption(), greatest, lambda fk, fv: found.append((fk, fv)))
+        self.assertEqual(s, Status.OK())
+        self.assertEqual(found, [])
+        table.close()
+
+    def test_block_cache(self):
+        user_keys = sorted(set(random_user_str(16) for _ in range(1000)))
+        entries = [(internal_key(k, i + 1), random_user_str(20).encode('utf-8')) for i, k in enumerate(user_keys)]
+        cache = LRUCache(1 << 20)
+        table = self.build_table(entries, block_cache=cache)
+
+        # A scan without fill_cache leaves the cache untouched
+        option = ReadOption()
+        option.fill_cache = False
+        it = table.new_iterator(option)
+        it.seek_to_first()
+        while it.valid():
+            it.next()
+        self.assertEqual(cache.size(), 0)
+        self.assertEqual(cache.hits(), 0)
+        num_blocks = cache.misses()
+        self.assertGreater(num_blocks, 1)
+
+        # The first scan with fill_cache reads every block, the second one hits the cache
+        for _ in range(2):
+            it = table.new_iterator(ReadOption())
+            it.seek_to_first()
+            count = 0
+            while it.valid():
+                count += 1
+                it.next()
+            self.assertEqual(count, len(entries))
+        self.assertEqual(cache.size(), num_blocks)
+        self.assertEqual(cache.misses(), 2 * num_blocks)
+        self.assertEqual(cache.hits(), num_blocks)
+
+        # Cached blocks are also used by reads without fill_cache
+        found = []
+        s = table.internal_get(option, entries[0][0], lambda fk, fv: found.append(fv))
+        self.assertEqual(s, Status.OK())
+        self.assertEqual(found, [entries[0][1]])
+        self.assertEqual(cache.hits(), num_blocks + 1)
+        table.close()
+
+    def test_from_memtable(self):
+        mem = MemTable()
+        mem.add(1, 'a', 'va1', ValueType.kTypeValue)
+        mem.add(2, 'b', 'vb2', ValueType.kTypeValue)
+        mem.add(3, 'a', '', ValueType.kTypeDeletion)
+        mem.add(4, 'b', 'vb4', ValueType.kTypeValue)
+
+        it = mem.new_iterator()
+        it.seek_to_first()
+        entries = []
+        while it.valid():
+            entries.append((it.key(), it.value()))
+            it.next()
+        self.assertEqual([k for k, _ in entries], [internal_key('a', 3, ValueType.kTypeDeletion),
+                                                   internal_key('a', 1),
+                                                   internal_key('b', 4),
+                                                   internal_key('b', 2)])
+        for i in range(1, len(entries)):
+            self.assertLess(raw_internal_key_comparator(entries[i - 1][0], entries[i][0]), 0)
+
+        table = self.build_table(entries)
+        it = table.new_iterator(ReadOption())
+        it.seek(internal_key('b', 3))
+        self.assertTrue(it.valid())
+        self.assertEqual(it.key(), internal_key('b', 2))
+        self.assertEqual(it.value(), b'vb2')
+        table.close()
+
+    def test_corruption(self):
+        entries = [(internal_key(str(i), 1), b'value') for i in range(10)]
+        self.build_table(entries).close()
+        file_size = os.path.getsize(self.file_name)
+        with open(self.file_name, 'r+b') as f:
+            f.seek(0)
+            f.write(b'\xff')
+
+        option = DBOption()
+        s, table = Table.open(option, open(self.file_name, 'rb'), file_size)
+        self.assertEqual(s, Status.OK())
+        s = table.internal_get(ReadOption(), entries[0][0], lambda fk, fv: None)
+        self.assertEqual(s.code, Status.Corruption().code)
+        table.close()
+
+        with open(self.file_name, 'rb') as f:
+            s, _ = Table.open(option, f, file_size - 1)
+            self.assertEqual(s.code, Status.Corruption().code)
+
+    def test_filter_skips_data_blocks(self):
+        entries = [(internal_key(str(i), 1), b'value') for i in range(100, 200)]
+        # All the entries are in one data block
+        table = self.build_table(entries, block_size=64 * 1024)
+        self.assertIsNotNone(table._filter_data)
+        table.close()
+
+        # Corrupt the data block, so any data block read fails.
+        file_size = os.path.getsize(self.file_name)
+        with open(self.file_name, 'r+b') as f:
+            f.seek(0)
+            f.write(b'\xff' * 16)
+
+        option = DBOption()
+        with open(self.file_name, 'rb') as f:
+            s, table = Table.open(option, f, file_size)
+            self.assertEqual(s, Status.OK())
+            found = []
+            s = table.internal_get(ReadOption(), entries[0][0], lambda fk, fv: found.append(fk))
+            self.assertEqual(s.code, Status.Corruption().code)
+
+            # Missing keys are rejected by the filter without reading the data blocks
+            missing = 0
+            for i in range(1000, 2000):
+                s = table.internal_get(ReadOption(), internal_key(str(i), 1), lambda fk, fv: found.append(fk))
+                if s.ok():
+                    missing += 1
+            self.assertGreater(missing, 950)
+            self.assertEqual(found, [])
+
+    def test_no_filter(self):
+        option = DBOption()
+        option.bits_per_key = 0
+        entries = [(internal_key(f'{i:03d}', 1), b'value') for i in range(100)]
+        with open(self.file_name, 'wb') as f:
+            builder = TableBuilder(option, f)
+            for k, v in entries:
+                builder.add(k, v)
+            self.assertEqual(builder.finish(), Status.OK())
+            file_size = builder.file_size()
+        with open(self.file_name, 'rb') as f:
+            s, table = Table.open(option, f, file_size)
+            self.assertEqual(s, Status.OK())
+            self.assertIsNone(table._filter_data)
+            found = []
+            self.assertEqual(table.internal_get(ReadOption(), entries[5][0], lambda fk, fv: found.append(fv)),
+                             Status.OK())
+            self.assertEqual(found, [b'value'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import json
 import unittest
 from version_edit import VersionEdit, FileMetaData
 
@@ -24,6 +25,69 @@ class VersionEditTest(unittest.TestCase):
         self.assertTrue((1, 1) in edit2.deleted_files)
         self.assertTrue((1, bytearray('far'.encode('utf-8'))) in edit2.compact_pointers)
 
+    def test_encode_decode(self):
+        big = 1 << 50
+        edit = VersionEdit()
+        for i in range(4):
+            edit.add_file(3, big + 300 + i, big + 400 + i, b'foo\x00\xff' + bytes(8), b'zoo\x80' + b'\x01' * 8)
+            edit.remove_file(4, big + 700 + i)
+            edit.set_compact_pointer(i, b'x\xfe' + bytes(8))
+        edit.set_comparator('foo')
+        edit.set_log_number(big + 100)
+        edit.set_next_file_number(big + 200)
+        edit.set_last_sequence(big + 1000)
+
+        data = edit.serialize()
+        edit2 = VersionEdit.deserialize(data)
+        self.assertEqual(edit2.serialize(), data)
+        self.assertFalse(edit2.has_prev_log_number)
+        self.assertEqual(edit2.last_sequence, big + 1000)
+        self.assertEqual(edit2.deleted_files, {(4, big + 700 + i) for i in range(4)})
+        level, f = edit2.new_files[0]
+        self.assertEqual(level, 3)
+        self.assertEqual((f.number, f.file_size), (big + 300, big + 400))
+        self.assertEqual(f.smallest_key, b'foo\x00\xff' + bytes(8))
+        self.assertEqual(f.greatest_key, b'zoo\x80' + b'\x01' * 8)
+
+    def test_empty(self):
+        edit = VersionEdit.deserialize(VersionEdit().serialize())
+        self.assertFalse(edit.has_log_number)
+        self.assertEqual(edit.new_files, [])
+
+    def test_malformed(self):
+        edit = VersionEdit()
+        edit.set_log_number(1 << 40)
+        log_number_size = len(edit.serialize())
+        edit.add_file(1, 5, 100, b'a' * 8, b'b' * 8)
+        data = edit.serialize()
+        for size in range(1, len(data)):
+            if size == log_number_size:
+                # The edit holding only the log number
+                continue
+            with self.assertRaises(ValueError):
+                VersionEdit.deserialize(data[:size])
+        with self.assertRaises(ValueError):
+            VersionEdit.deserialize(bytearray([8]))
+
+    def test_json(self):
+        # An edit written before the tagged encoding
+        data = json.dumps({
+            'comparator': '', 'log_number': 12, 'prev_log_number': 0, 'next_file_number': 14,
+            'last_sequence': 100, 'has_comparator': False, 'has_log_number': True,
+            'has_prev_log_number': False, 'has_next_file_number': True, 'has_last_sequence': True,
+            'compact_pointers': [[1, b'k\x01'.hex()]],
+            'deleted_files': [[0, 7]],
+            'new_files': [[1, json.dumps({'allow_seek': 1 << 30, 'file_size': 300, 'smallest_key': b'a\x01'.hex(),
+                                          'greatest_key': b'z\x01'.hex(), 'number': 13})]]}).encode('utf-8')
+        edit = VersionEdit.deserialize(bytearray(data))
+        self.assertFalse(edit.has_comparator)
+        self.assertEqual((edit.log_number, edit.next_file_number, edit.last_sequence), (12, 14, 100))
+        self.assertEqual(edit.compact_pointers, [(1, b'k\x01')])
+        self.assertEqual(edit.deleted_files, {(0, 7)})
+        level, f = edit.new_files[0]
+        self.assertEqual((level, f.number, f.file_size), (1, 13, 300))
+        self.assertEqual((f.smallest_key, f.greatest_key), (b'a\x01', b'z\x01'))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,13 +1,28 @@
+import json
 import os.path
 import shutil
+import threading
 import unittest
+from unittest import mock
 
+import utils
+from utils import USER_KEY_COMPARATOR
+
+from config import MAX_NUM_LEVEL, L0_COMPACTION_TRIGGER, BYTES_PER_SEEK, MIN_ALLOWED_SEEKS
+from dbformat import InternalKey, ValueType
 from option import DBOption
+from status import Status
 from version_edit import VersionEdit
-from version_set import VersionSet
+from log_reader import Reader
+from log_writer import Writer
+from version_set import VersionSet, Version, VersionBuilder, GetStats, find_file, some_file_overlaps_range
 from test.test_utils import random_user_str
 
 
+def ikey(user_key: str, seq: int = 100) -> bytes:
+    return InternalKey.make(user_key.encode('utf-8'), seq, ValueType.kTypeValue)
+
+
 class VersionSetTest(unittest.TestCase):
     def test_basic(self):
         db_name = 'tmp_' + random_user_str(10)
@@ -37,6 +52,342 @@ class VersionSetTest(unittest.TestCase):
         self.assertEqual(vs2.prev_log_number(), 0)
         self.assertEqual(vs2.next_file_number(), 5)
 
+    def test_recover_closes_manifest(self):
+        db_name = 'tmp_' + random_user_str(10)
+        os.mkdir(db_name)
+        vs = VersionSet(db_name, DBOption())
+        vs.set_manifest_file_number(vs.new_file_number())
+        for comparator in ('other', USER_KEY_COMPARATOR):
+            edit = VersionEdit()
+            edit.set_comparator(comparator)
+            self.assertTrue(vs.log_and_apply(edit).ok())
+        vs.close()
+
+        readers = []
+        init = Reader.__init__
+
+        def track(reader, *args, **kwargs):
+            init(reader, *args, **kwargs)
+            readers.append(reader)
+
+        # The manifest is closed although the recovery stops before its end
+        with mock.patch.object(Reader, '__init__', track):
+            s, _ = VersionSet(db_name, DBOption()).recover()
+        self.assertEqual(s.code, Status.InvalidArgument().code)
+        self.assertEqual(len(readers), 1)
+        self.assertTrue(readers[0].closed())
+        shutil.rmtree(db_name)
+
+    def test_recover_json_manifest(self):
+        db_name = 'tmp_' + random_user_str(10)
+        os.mkdir(db_name)
+        # A manifest whose edits are json, as written before the tagged encoding
+        writer = Writer(utils.manifest_file_name(db_name, 2))
+        for edit in [
+            {'comparator': utils.USER_KEY_COMPARATOR, 'has_comparator': True, 'compact_pointers': [],
+             'deleted_files': [], 'new_files': [
+                [1, json.dumps({'file_size': 100, 'number': 5, 'smallest_key': ikey('a').hex(),
+                                'greatest_key': ikey('c').hex(), 'allow_seek': 1 << 30})]]},
+            {'log_number': 6, 'has_log_number': True, 'next_file_number': 8, 'has_next_file_number': True,
+             'last_sequence': 200, 'has_last_sequence': True, 'compact_pointers': [], 'deleted_files': [],
+             'new_files': [[0, json.dumps({'file_size': 100, 'number': 7, 'smallest_key': ikey('d').hex(),
+                                           'greatest_key': ikey('f').hex(), 'allow_seek': 1 << 30})]]}]:
+            writer.write_record(bytearray(json.dumps(edit).encode('utf-8')))
+        writer.close()
+        utils.save_current_file(db_name, 2)
+
+        vs = VersionSet(db_name, DBOption())
+        s, _ = vs.recover()
+        self.assertTrue(s.ok())
+        self.assertEqual((vs.log_number(), vs.last_sequence(), vs.next_file_number()), (6, 200, 9))
+        self.assertEqual([f.number for f in vs.current().files[0]], [7])
+        self.assertEqual(vs.current().files[1][0].smallest_key, ikey('a'))
+
+        # The next manifest is written with the tagged encoding
+        edit = VersionEdit()
+        edit.remove_file(0, 7)
+        self.assertTrue(vs.log_and_apply(edit).ok())
+        vs2 = VersionSet(db_name, DBOption())
+        s, _ = vs2.recover()
+        self.assertTrue(s.ok())
+        self.assertEqual(vs2.num_level_files(0), 0)
+        self.assertEqual(vs2.num_level_files(1), 1)
+        shutil.rmtree(db_name)
+
+    def test_manifest_rollover(self):
+        db_name = 'tmp_' + random_user_str(10)
+        os.mkdir(db_name)
+        option = DBOption()
+        option.max_manifest_file_size = 4096
+        vs = VersionSet(db_name, option)
+        vs.set_manifest_file_number(vs.new_file_number())
+
+        manifest_numbers = set()
+        number = 0
+        for i in range(200):
+            edit = VersionEdit()
+            if i % 2 == 1:
+                edit.remove_file(1, number)
+            number = vs.new_file_number()
+            edit.add_file(1, number, 100, ikey(f'{i:04d}a'), ikey(f'{i:04d}b'))
+            vs.set_last_sequence(i)
+            self.assertTrue(vs.log_and_apply(edit).ok())
+            manifest_numbers.add(vs.manifest_file_number())
+            self.assertEqual(vs.live_manifest_file_number(), vs.manifest_file_number())
+            manifest_size = os.path.getsize(utils.manifest_file_name(db_name, vs.manifest_file_number()))
+            # A new manifest holds the snapshot and the edits since the rollover
+            self.assertLess(manifest_size, option.max_manifest_file_size + 1024)
+        self.assertGreater(len(manifest_numbers), 2)
+        vs.close()
+
+        vs2 = VersionSet(db_name, option)
+        s, _ = vs2.recover()
+        self.assertTrue(s.ok())
+        self.assertEqual(vs2.live_manifest_file_number(), vs.manifest_file_number())
+        self.assertEqual(vs2.last_sequence(), 199)
+        self.assertEqual([f.number for f in vs2.current().files[1]], [f.number for f in vs.current().files[1]])
+        self.assertEqual(vs2.num_level_files(1), 100)
+        vs2.close()
+
+        # A manifest larger than max_manifest_file_size is replaced on open
+        manifest_size = os.path.getsize(utils.manifest_file_name(db_name, vs.manifest_file_number()))
+        for max_size, should_save in [(manifest_size, False), (manifest_size - 1, True)]:
+            option.max_manifest_file_size = max_size
+            vs3 = VersionSet(db_name, option)
+            self.assertEqual(vs3.recover(), (Status.OK(), should_save))
+            vs3.close()
+        shutil.rmtree(db_name)
+
+    def test_current_file(self):
+        db_name = 'tmp_' + random_user_str(10)
+        os.mkdir(db_name)
+        vs = VersionSet(db_name, DBOption())
+        vs.set_manifest_file_number(vs.new_file_number())
+        self.assertTrue(vs.log_and_apply(VersionEdit()).ok())
+        current = utils.current_file_name(db_name)
+        with open(current) as f:
+            self.assertEqual(f.read(), f'{vs.manifest_file_number()}.manifest\n')
+        inode = os.stat(current).st_ino
+
+        # The current file is only rewritten when a new manifest is created
+        for i in range(10):
+            edit = VersionEdit()
+            edit.add_file(1, vs.new_file_number(), 100, ikey(f'{i:04d}a'), ikey(f'{i:04d}b'))
+            self.assertTrue(vs.log_and_apply(edit).ok())
+        self.assertEqual(os.stat(current).st_ino, inode)
+        self.assertEqual([name for name in os.listdir(db_name) if name.endswith('.dbtmp')], [])
+        vs.close()
+
+        # A current file written before the trailing newline
+        with open(current, 'w') as f:
+            f.write(f'{vs.manifest_file_number()}.manifest')
+        vs2 = VersionSet(db_name, DBOption())
+        s, _ = vs2.recover()
+        self.assertTrue(s.ok())
+        self.assertEqual(vs2.num_level_files(1), 10)
+        shutil.rmtree(db_name)
+
+    def test_log_and_apply_unlocks(self):
+        db_name = 'tmp_' + random_user_str(10)
+        os.mkdir(db_name)
+        vs = VersionSet(db_name, DBOption())
+        vs.set_manifest_file_number(vs.new_file_number())
+        mutex = threading.Lock()
+        sync = Writer.sync
+        locked = []
+
+        def check_sync(writer):
+            locked.append(mutex.locked())
+            sync(writer)
+
+        with mock.patch.object(Writer, 'sync', check_sync):
+            for i in range(3):
+                edit = VersionEdit()
+                with mutex:
+                    edit.add_file(1, vs.new_file_number(), 100, ikey(f'{i:04d}a'), ikey(f'{i:04d}b'))
+                    self.assertTrue(vs.log_and_apply(edit, mutex).ok())
+                    # The mutex is held again on return
+                    self.assertTrue(mutex.locked())
+        # The manifest is synced without holding the mutex
+        self.assertEqual(locked, [False] * 3)
+        self.assertEqual(vs.num_level_files(1), 3)
+        vs.close()
+
+        vs2 = VersionSet(db_name, DBOption())
+        s, _ = vs2.recover()
+        self.assertTrue(s.ok())
+        self.assertEqual(vs2.num_level_files(1), 3)
+        vs2.close()
+        shutil.rmtree(db_name)
+
+    def test_builder(self):
+        vs = VersionSet('tmp_' + random_user_str(10), DBOption())
+        base = vs.current()
+
+        edit = VersionEdit()
+        edit.add_file(0, 10, 100, ikey('a'), ikey('m'))
+        edit.add_file(0, 11, 100, ikey('c'), ikey('z'))
+        edit.add_file(1, 12, 100, ikey('n'), ikey('p'))
+        edit.add_file(1, 13, 100, ikey('a'), ikey('c'))
+        edit.set_compact_pointer(1, ikey('c'))
+        builder = VersionBuilder(vs, base)
+        builder.apply(edit)
+        v = Version(vs)
+        builder.build(v)
+        # Level-0 files are ordered from the newest to the oldest
+        self.assertEqual([f.number for f in v.files[0]], [11, 10])
+        self.assertEqual([f.number for f in v.files[1]], [13, 12])
+        self.assertEqual(vs._compact_pointer[1], ikey('c'))
+
+        # The levels do not share a list
+        for level in range(2, MAX_NUM_LEVEL):
+            self.assertEqual(v.files[level], [])
+        v.files[2].append(v.files[0][0])
+        self.assertEqual(v.files[3], [])
+        v.files[2].clear()
+        self.assertIsNone(v.file_to_compact)
+
+        edit = VersionEdit()
+        edit.remove_file(0, 10)
+        edit.remove_file(1, 13)
+        edit.add_file(2, 14, 100, ikey('a'), ikey('m'))
+        builder = VersionBuilder(vs, v)
+        builder.apply(edit)
+        v2 = Version(vs)
+        builder.build(v2)
+        self.assertEqual([f.number for f in v2.files[0]], [11])
+        self.assertEqual([f.number for f in v2.files[1]], [12])
+        self.assertEqual([f.number for f in v2.files[2]], [14])
+
+    def test_finalize(self):
+        vs = VersionSet('tmp_' + random_user_str(10), DBOption())
+        edit = VersionEdit()
+        for i in range(L0_COMPACTION_TRIGGER):
+            edit.add_file(0, 10 + i, 100, ikey('a'), ikey('z'))
+        builder = VersionBuilder(vs, vs.current())
+        builder.apply(edit)
+        v = Version(vs)
+        builder.build(v)
+        vs.finalize(v)
+        self.assertEqual(v.compaction_level, 0)
+        self.assertGreaterEqual(v.compaction_score, 1)
+
+        edit = VersionEdit()
+        edit.add_file(2, 20, int(vs.max_bytes_for_level(2) * 3), ikey('a'), ikey('z'))
+        builder = VersionBuilder(vs, v)
+        builder.apply(edit)
+        v2 = Version(vs)
+        builder.build(v2)
+        vs.finalize(v2)
+        self.assertEqual(v2.compaction_level, 2)
+        self.assertAlmostEqual(v2.compaction_score, 3)
+
+    def test_overlapping_inputs(self):
+        vs = VersionSet('tmp_' + random_user_str(10), DBOption())
+        edit = VersionEdit()
+        edit.add_file(0, 10, 100, ikey('a'), ikey('c'))
+        edit.add_file(0, 11, 100, ikey('b'), ikey('f'))
+        edit.add_file(0, 12, 100, ikey('x'), ikey('z'))
+        edit.add_file(1, 13, 100, ikey('a'), ikey('c'))
+        edit.add_file(1, 14, 100, ikey('e'), ikey('g'))
+        edit.add_file(1, 15, 100, ikey('k'), ikey('p'))
+        builder = VersionBuilder(vs, vs.current())
+        builder.apply(edit)
+        v = Version(vs)
+        builder.build(v)
+
+        # Level-0 ranges are expanded by the overlapping files
+        inputs = v.get_overlapping_inputs(0, ikey('e'), ikey('e'))
+        self.assertEqual(sorted(f.number for f in inputs), [10, 11])
+        inputs = v.get_overlapping_inputs(1, ikey('d'), ikey('l'))
+        self.assertEqual([f.number for f in inputs], [14, 15])
+        inputs = v.get_overlapping_inputs(1, None, None)
+        self.assertEqual(len(inputs), 3)
+
+        files = v.files[1]
+        self.assertEqual(find_file(files, ikey('0')), 0)
+        self.assertEqual(find_file(files, ikey('d')), 1)
+        self.assertEqual(find_file(files, ikey('q')), 3)
+        self.assertTrue(some_file_overlaps_range(files, True, b'h', b'k'))
+        self.assertFalse(some_file_overlaps_range(files, True, b'h', b'j'))
+        self.assertTrue(v.overlap_in_level(0, b'y', None))
+        self.assertFalse(v.overlap_in_level(0, b'g', b'w'))
+        self.assertTrue(v.overlap_in_level(1, b'h', b'k'))
+        self.assertFalse(v.overlap_in_level(1, b'h', b'j'))
+
+    def test_file_index(self):
+        vs = VersionSet('tmp_' + random_user_str(10), DBOption())
+        edit = VersionEdit()
+        # Binary user keys, and files split between the versions of a user key
+        bounds = [b'', b'a', b'a\x00', b'a\x00\x01', b'a\x01', b'b\xff', b'c', b'c\x00\x00', b'd']
+        number = 10
+        for i in range(len(bounds) - 1):
+            edit.add_file(2, number, 100, InternalKey.make(bounds[i], 49, ValueType.kTypeValue),
+                          InternalKey.make(bounds[i + 1], 100, ValueType.kTypeValue))
+            edit.add_file(2, number + 1, 100, InternalKey.make(bounds[i + 1], 99, ValueType.kTypeValue),
+                          InternalKey.make(bounds[i + 1], 50, ValueType.kTypeDeletion))
+            number += 2
+        builder = VersionBuilder(vs, vs.current())
+        builder.apply(edit)
+        v = Version(vs)
+        builder.build(v)
+
+        files = v.files[2]
+        self.assertEqual([f.number for f in files], list(range(10, number)))
+        self.assertEqual(len(v.greatest_keys[2]), len(files))
+        for user_key in bounds + [b'a\x00\x00', b'b', b'e']:
+            for seq in (200, 100, 99, 75, 50, 1):
+                for t in (ValueType.kTypeValue, ValueType.kTypeDeletion):
+                    target = InternalKey.make(user_key, seq, t)
+                    self.assertEqual(find_file(files, target, v.greatest_keys[2]), find_file(files, target))
+
+    def test_seek_compaction(self):
+        db_name = 'tmp_' + random_user_str(10)
+        os.mkdir(db_name)
+        vs = VersionSet(db_name, DBOption())
+        vs.set_next_file_number(2)
+        edit = VersionEdit()
+        edit.add_file(1, 10, 100, ikey('a'), ikey('c'))
+        edit.add_file(1, 11, 300 * BYTES_PER_SEEK, ikey('d'), ikey('f'))
+        edit.add_file(2, 12, 100, ikey('a'), ikey('b'))
+        self.assertTrue(vs.log_and_apply(edit).ok())
+        v = vs.current()
+        self.assertEqual([f.allow_seek for f in v.files[1]], [MIN_ALLOWED_SEEKS, 300])
+        self.assertFalse(vs.needs_compaction())
+        self.assertIsNone(vs.pick_compaction())
+
+        # A read served by a single file is not charged
+        self.assertFalse(v.update_stats(GetStats()))
+        stats = GetStats()
+        stats.seek_file = v.files[1][0]
+        stats.seek_file_level = 1
+        for _ in range(MIN_ALLOWED_SEEKS - 1):
+            self.assertFalse(v.update_stats(stats))
+        self.assertTrue(v.update_stats(stats))
+        self.assertIs(v.file_to_compact, v.files[1][0])
+        self.assertEqual(v.file_to_compact_level, 1)
+        # The file to compact is kept until a new version is installed
+        self.assertFalse(v.update_stats(stats))
+        self.assertTrue(vs.needs_compaction())
+
+        c = vs.pick_compaction()
+        self.assertEqual(c.level(), 1)
+        self.assertEqual([f.number for f in c.inputs[0]], [10])
+        self.assertEqual([f.number for f in c.inputs[1]], [12])
+        c.release_inputs()
+
+        # A size compaction is preferred over a seek compaction
+        edit = VersionEdit()
+        for i in range(L0_COMPACTION_TRIGGER):
+            edit.add_file(0, 20 + i, 100, ikey('x'), ikey('z'))
+        self.assertTrue(vs.log_and_apply(edit).ok())
+        v = vs.current()
+        self.assertIsNone(v.file_to_compact)
+        self.assertTrue(v.update_stats(stats))
+        c = vs.pick_compaction()
+        self.assertEqual(c.level(), 0)
+        c.release_inputs()
+
 
 if __name__ == '__main__':
     unittest.main()
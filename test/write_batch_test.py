@@ -1,6 +1,8 @@
 import random
 import unittest
 
+from dbformat import ValueType
+from memtable import MemTable
 from write_batch import WriteBatch
 
 
@@ -19,3 +21,79 @@ class WriteBatchTest(unittest.TestCase):
         batch2 = WriteBatch.deserialize(buffer)
 
         self.assertEqual(batch, batch2)
+
+    def test_serde_utf8(self):
+        batch = WriteBatch()
+        batch.put('键', '值' * 10)
+        batch.delete('ключ')
+        batch.put('', '')
+        batch.set_sequence_number(1 << 20)
+        batch2 = WriteBatch.deserialize(batch.serialize())
+        self.assertEqual(batch, batch2)
+        self.assertEqual(list(batch2), list(batch))
+
+    def test_deserialize_large_batch(self):
+        batch = WriteBatch()
+        for i in range(100000):
+            batch.put(f'{i:08d}', 'v' * (i % 10))
+        batch.set_sequence_number(1)
+        data = batch.serialize()
+        batch2 = WriteBatch.deserialize(data)
+        self.assertEqual(batch, batch2)
+        self.assertEqual(batch2.size(), batch.size())
+
+    def test_deserialize_corrupted(self):
+        batch = WriteBatch()
+        batch.put('key', 'value')
+        batch.delete('deleted')
+        batch.set_sequence_number(1)
+        data = batch.serialize()
+        for n in [0, 4]:
+            with self.assertRaises(Exception):
+                WriteBatch.deserialize(data[:n])
+        # Truncated records are detected when the batch is applied
+        for n in [len(data) - 1, 12, 20]:
+            s = WriteBatch.deserialize(data[:n]).apply(MemTable())
+            self.assertFalse(s.ok())
+
+    def test_append(self):
+        b1 = WriteBatch()
+        b1.put('a', 'va')
+        b2 = WriteBatch()
+        b2.delete('b')
+        b2.put('c', 'vc')
+        b1.append(b2)
+        self.assertEqual(b1.count(), 3)
+        self.assertEqual(b1.size(), b2.size() + 6)
+        self.assertEqual(list(b1), [('a', 'va', ValueType.kTypeValue), ('b', '', ValueType.kTypeDeletion),
+                                    ('c', 'vc', ValueType.kTypeValue)])
+        self.assertEqual(b2.count(), 2)
+
+        b1.clear()
+        self.assertEqual(b1.count(), 0)
+        self.assertEqual(b1.size(), 8)
+        self.assertEqual(list(b1), [])
+
+    def test_legacy_records(self):
+        # Records of older logs have a plain ValueType tag and 4 bytes sizes
+        data = bytearray((7).to_bytes(4, 'little') + (2).to_bytes(4, 'little'))
+        data += bytes([ValueType.kTypeValue.value]) + (1).to_bytes(4, 'little') + b'a'
+        data += (2).to_bytes(4, 'little') + b'va'
+        data += bytes([ValueType.kTypeDeletion.value]) + (1).to_bytes(4, 'little') + b'b'
+        batch = WriteBatch.deserialize(data)
+        # New records are appended in the varint format
+        batch.put('c', 'vc')
+        self.assertEqual(batch.count(), 3)
+        self.assertEqual(batch.sequence_number(), 7)
+        self.assertEqual(list(batch), [('a', 'va', ValueType.kTypeValue), ('b', '', ValueType.kTypeDeletion),
+                                       ('c', 'vc', ValueType.kTypeValue)])
+        mem = MemTable()
+        self.assertTrue(batch.apply(mem).ok())
+
+    def test_varint_sizes(self):
+        batch = WriteBatch()
+        batch.put('k' * 16, 'v' * 100)
+        # tag + 1 byte key size + key + 1 byte value size + value
+        self.assertEqual(batch.size(), 8 + 1 + 1 + 16 + 1 + 100)
+        batch.put('k' * 200, 'v' * 20000)
+        self.assertEqual(list(batch)[1], ('k' * 200, 'v' * 20000, ValueType.kTypeValue))
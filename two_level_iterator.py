@@ -0,0 +1,109 @@
+from status import Status
+
+
+class TwoLevelIterator:
+    """
+    TwoLevelIterator iterates over the entries pointed by an index iterator.
+
+    The index iterator yields values which are passed to block_function,
+    and block_function returns an iterator over the contents of the
+    corresponding block.
+    """
+
+    def __init__(self, index_iter, block_function, option):
+        self._index_iter = index_iter
+        self._block_function = block_function
+        self._option = option
+        self._data_iter = None
+        self._status = Status.OK()
+        # The index value of the current data iterator
+        self._data_block_handle = None
+
+    def valid(self) -> bool:
+        return self._data_iter is not None and self._data_iter.valid()
+
+    def key(self):
+        assert self.valid()
+        return self._data_iter.key()
+
+    def value(self):
+        assert self.valid()
+        return self._data_iter.value()
+
+    def status(self) -> Status:
+        if not self._index_iter.status().ok():
+            return self._index_iter.status()
+        elif self._data_iter is not None and not self._data_iter.status().ok():
+            return self._data_iter.status()
+        return self._status
+
+    def seek(self, target):
+        self._index_iter.seek(target)
+        self._init_data_block()
+        if self._data_iter is not None:
+            self._data_iter.seek(target)
+        self._skip_empty_data_blocks_forward()
+
+    def seek_to_first(self):
+        self._index_iter.seek_to_first()
+        self._init_data_block()
+        if self._data_iter is not None:
+            self._data_iter.seek_to_first()
+        self._skip_empty_data_blocks_forward()
+
+    def seek_to_last(self):
+        self._index_iter.seek_to_last()
+        self._init_data_block()
+        if self._data_iter is not None:
+            self._data_iter.seek_to_last()
+        self._skip_empty_data_blocks_backward()
+
+    def next(self):
+        assert self.valid()
+        self._data_iter.next()
+        self._skip_empty_data_blocks_forward()
+
+    def prev(self):
+        assert self.valid()
+        self._data_iter.prev()
+        self._skip_empty_data_blocks_backward()
+
+    def _skip_empty_data_blocks_forward(self):
+        while self._data_iter is None or not self._data_iter.valid():
+            # Move to next block
+            if not self._index_iter.valid():
+                self._set_data_iterator(None)
+                return
+            self._index_iter.next()
+            self._init_data_block()
+            if self._data_iter is not None:
+                self._data_iter.seek_to_first()
+
+    def _skip_empty_data_blocks_backward(self):
+        while self._data_iter is None or not self._data_iter.valid():
+            # Move to previous block
+            if not self._index_iter.valid():
+                self._set_data_iterator(None)
+                return
+            self._index_iter.prev()
+            self._init_data_block()
+            if self._data_iter is not None:
+                self._data_iter.seek_to_last()
+
+    def _set_data_iterator(self, data_iter):
+        if self._data_iter is not None and not self._data_iter.status().ok() and self._status.ok():
+            # Save the error of the data iterator before dropping it
+            self._status = self._data_iter.status()
+        self._data_iter = data_iter
+
+    def _init_data_block(self):
+        if not self._index_iter.valid():
+            self._set_data_iterator(None)
+            return
+        handle = self._index_iter.value()
+        if self._data_iter is not None and handle == self._data_block_handle:
+            # data_iter is already constructed with this iterator, so
+            # no need to change anything
+            return
+        self._data_block_handle = handle
+        self._set_data_iterator(self._block_function(self._option, handle))
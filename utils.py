@@ -62,6 +62,37 @@ def internal_key_comparator(key_x, key_y) -> int:
     return 0
 
 
+def raw_internal_key_comparator(key_x, key_y) -> int:
+    """compare internal keys without the length prefix of memtable keys
+
+    The order is the same as internal_key_comparator, but user keys are compared
+    as utf-8 bytes, which keeps the order of the decoded strings.
+
+    Args:
+        key_x (internal_key):
+        key_y (internal_key):
+
+    Returns:
+        int: result
+    """
+    r = user_key_comparator(key_x[:-8], key_y[:-8])
+    if r != 0:
+        return r
+    seq_x = int.from_bytes(key_x[-8:-1], byte_order)
+    seq_y = int.from_bytes(key_y[-8:-1], byte_order)
+    if seq_x < seq_y:
+        return 1
+    elif seq_x > seq_y:
+        return -1
+
+    if key_x[-1] < key_y[-1]:
+        return 1
+    elif key_x[-1] > key_y[-1]:
+        return -1
+
+    return 0
+
+
 def current_file_name(db_name) -> str:
     return os.path.join(db_name, 'CURRENT')
 
@@ -70,21 +101,66 @@ def log_file_name(db_name, log_number: int) -> str:
     return os.path.join(db_name, f'{log_number}.log')
 
 
+def table_file_name(db_name: str, file_number: int) -> str:
+    return os.path.join(db_name, f'{file_number}.sst')
+
+
 def manifest_file_name(db_name: str, file_number: int) -> str:
     return os.path.join(db_name, f'{file_number}.manifest')
 
 
+def parse_manifest_file_number(name: str) -> int:
+    """
+    Return the number of the manifest file name, or None if it is not a manifest.
+    """
+    name = os.path.basename(name.strip())
+    if not name.endswith('.manifest') or not name[:-len('.manifest')].isdigit():
+        return None
+    return int(name[:-len('.manifest')])
+
+
+def temp_file_name(db_name: str, file_number: int) -> str:
+    return os.path.join(db_name, f'{file_number}.dbtmp')
+
+
 def save_current_file(db_name: str, file_number: int) -> Status:
-    current_file = current_file_name(db_name)
+    """
+    Make the current file name the manifest of file_number. The content is written to
+    a temp file which is renamed to the current file, so that a crash leaves either
+    the old or the new current file, never an empty or partial one.
+    """
+    tmp = temp_file_name(db_name, file_number)
     try:
-        with open(current_file, 'w') as f:
-            f.write(f'{file_number}.manifest')
-            f.close()
+        with open(tmp, 'w') as f:
+            f.write(f'{file_number}.manifest\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, current_file_name(db_name))
+        sync_dir(db_name)
         return Status.OK()
-    except Exception as e:
+    except OSError as e:
+        if os.path.exists(tmp):
+            os.remove(tmp)
         return Status.IOError(f'{e}')
 
 
+def sync_dir(path: str):
+    """
+    Sync the directory entries of path, e.g. a renamed file, where the platform supports it.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        # Directories cannot be synced on some platforms
+        pass
+    finally:
+        os.close(fd)
+
+
 def read_logging_level_from_env() -> int:
     env_level = os.getenv('LOG_LEVEL')
     if env_level is None:
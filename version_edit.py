@@ -1,7 +1,37 @@
+"""
+A VersionEdit is serialized as a sequence of tagged fields, the same as leveldb's
+version_edit:
+    comparator:      |1: varint32|name: length prefixed slice|
+    log_number:      |2: varint32|number: varint64|
+    next_file:       |3: varint32|number: varint64|
+    last_sequence:   |4: varint32|sequence: varint64|
+    compact_pointer: |5: varint32|level: varint32|internal key: length prefixed slice|
+    deleted_file:    |6: varint32|level: varint32|number: varint64|
+    new_file:        |7: varint32|level: varint32|number: varint64|file_size: varint64|
+                     |smallest: length prefixed slice|largest: length prefixed slice|
+    prev_log_number: |9: varint32|number: varint64|
+Edits written before this encoding are utf-8 encoded json objects, which never start
+with a valid tag, and are still read.
+"""
 import json
 
 from typing import List, Tuple, Set
 
+from coding import put_varint32, put_varint64, put_length_prefixed_slice, get_varint32, get_varint64, \
+    get_length_prefixed_slice
+from config import MAX_NUM_LEVEL
+
+# Tag numbers for serialized VersionEdit. These numbers are written to disk and should not be changed.
+COMPARATOR = 1
+LOG_NUMBER = 2
+NEXT_FILE_NUMBER = 3
+LAST_SEQUENCE = 4
+COMPACT_POINTER = 5
+DELETED_FILE = 6
+NEW_FILE = 7
+# 8 was used for large value refs in leveldb
+PREV_LOG_NUMBER = 9
+
 
 class FileMetaData:
     def __init__(self):
@@ -11,23 +41,6 @@ class FileMetaData:
         self.greatest_key: bytearray = bytearray()
         self.number = 0
 
-    def serialize(self) -> bytearray:
-        # bytearray Object is not JSON serializable, so we need to convert it to a string.
-        json_map = self.__dict__.copy()
-        json_map['smallest_key'] = json_map['smallest_key'].decode('utf-8')
-        json_map['greatest_key'] = json_map['greatest_key'].decode('utf-8')
-        return bytearray(json.dumps(json_map).encode('utf-8'))
-
-    @staticmethod
-    def deserialize(data: bytearray) -> 'FileMetaData':
-        json_map = json.loads(data.decode('utf-8'))
-        meta_data = FileMetaData()
-        meta_data.__dict__ = json_map
-        meta_data.smallest_key = bytearray(meta_data.smallest_key.encode('utf-8'))
-        meta_data.greatest_key = bytearray(meta_data.greatest_key.encode('utf-8'))
-
-        return meta_data
-
 
 class VersionEdit:
     def __init__(self):
@@ -59,29 +72,130 @@ class VersionEdit:
         self.has_prev_log_number = False
         self.has_next_file_number = False
         self.has_last_sequence = False
-        self.deleted_files = []
+        self.compact_pointers = []
+        self.deleted_files = set()
         self.new_files = []
 
     def serialize(self) -> bytearray:
-        # For simplicity, we use json to serialize the edit. The result is a byte array of utf-8 encoded json.
-        # Because some fields are not serialized, we need to manually add them.
-        json_map = self.__dict__.copy()
-        json_map['compact_pointers'] = list(map(lambda x: (x[0], x[1].decode('utf-8')), json_map['compact_pointers']))
-        json_map['deleted_files'] = list(map(lambda x: (x[0], x[1]), json_map['deleted_files']))
-        json_map['new_files'] = list(map(lambda x: (x[0], x[1].serialize().decode('utf-8')), json_map['new_files']))
-        json_str = json.dumps(json_map)
-        return bytearray(json_str.encode('utf-8'))
+        dst = bytearray()
+        if self.has_comparator:
+            put_varint32(dst, COMPARATOR)
+            put_length_prefixed_slice(dst, self.comparator.encode('utf-8'))
+        if self.has_log_number:
+            put_varint32(dst, LOG_NUMBER)
+            put_varint64(dst, self.log_number)
+        if self.has_prev_log_number:
+            put_varint32(dst, PREV_LOG_NUMBER)
+            put_varint64(dst, self.prev_log_number)
+        if self.has_next_file_number:
+            put_varint32(dst, NEXT_FILE_NUMBER)
+            put_varint64(dst, self.next_file_number)
+        if self.has_last_sequence:
+            put_varint32(dst, LAST_SEQUENCE)
+            put_varint64(dst, self.last_sequence)
+
+        for level, key in self.compact_pointers:
+            put_varint32(dst, COMPACT_POINTER)
+            put_varint32(dst, level)
+            put_length_prefixed_slice(dst, key)
+
+        for level, number in sorted(self.deleted_files):
+            put_varint32(dst, DELETED_FILE)
+            put_varint32(dst, level)
+            put_varint64(dst, number)
+
+        for level, f in self.new_files:
+            put_varint32(dst, NEW_FILE)
+            put_varint32(dst, level)
+            put_varint64(dst, f.number)
+            put_varint64(dst, f.file_size)
+            put_length_prefixed_slice(dst, f.smallest_key)
+            put_length_prefixed_slice(dst, f.greatest_key)
+        return dst
 
     @staticmethod
     def deserialize(data: bytearray) -> 'VersionEdit':
-        json_str = data.decode('utf-8')
+        """
+        Decode a serialized edit, raise ValueError if the data is malformed.
+        """
+        if data[:1] == b'{':
+            return VersionEdit._deserialize_json(data)
+
         edit = VersionEdit()
-        edit.__dict__ = json.loads(json_str)
-        edit.compact_pointers = list(map(lambda x: (x[0], bytearray(x[1].encode('utf-8'))), edit.compact_pointers))
-        edit.deleted_files = set(map(lambda x: (x[0], x[1]), edit.deleted_files))
-        edit.new_files = list(
-            map(lambda x: (x[0], FileMetaData.deserialize(bytearray(x[1].encode('utf-8')))), edit.new_files))
+        with memoryview(data) as view:
+            offset = 0
+            while offset < len(view):
+                tag, offset = get_varint32(view, offset)
+                if tag == COMPARATOR:
+                    name, offset = get_length_prefixed_slice(view, offset)
+                    edit.set_comparator(name.decode('utf-8'))
+                elif tag == LOG_NUMBER:
+                    number, offset = get_varint64(view, offset)
+                    edit.set_log_number(number)
+                elif tag == PREV_LOG_NUMBER:
+                    number, offset = get_varint64(view, offset)
+                    edit.set_prev_log_number(number)
+                elif tag == NEXT_FILE_NUMBER:
+                    number, offset = get_varint64(view, offset)
+                    edit.set_next_file_number(number)
+                elif tag == LAST_SEQUENCE:
+                    sequence, offset = get_varint64(view, offset)
+                    edit.set_last_sequence(sequence)
+                elif tag == COMPACT_POINTER:
+                    level, offset = VersionEdit._get_level(view, offset)
+                    key, offset = get_length_prefixed_slice(view, offset)
+                    edit.set_compact_pointer(level, key)
+                elif tag == DELETED_FILE:
+                    level, offset = VersionEdit._get_level(view, offset)
+                    number, offset = get_varint64(view, offset)
+                    edit.remove_file(level, number)
+                elif tag == NEW_FILE:
+                    level, offset = VersionEdit._get_level(view, offset)
+                    number, offset = get_varint64(view, offset)
+                    file_size, offset = get_varint64(view, offset)
+                    smallest_key, offset = get_length_prefixed_slice(view, offset)
+                    greatest_key, offset = get_length_prefixed_slice(view, offset)
+                    edit.add_file(level, number, file_size, smallest_key, greatest_key)
+                else:
+                    raise ValueError(f'unknown VersionEdit tag {tag}')
+        return edit
+
+    @staticmethod
+    def _get_level(data, offset: int) -> (int, int):
+        level, offset = get_varint32(data, offset)
+        if level >= MAX_NUM_LEVEL:
+            raise ValueError('VersionEdit level too large')
+        return level, offset
 
+    @staticmethod
+    def _deserialize_json(data: bytearray) -> 'VersionEdit':
+        """
+        Decode an edit of the json encoding used before the tagged fields.
+        The keys of the files and the compact pointers are hex strings.
+        """
+        try:
+            json_map = json.loads(bytes(data).decode('utf-8'))
+        except ValueError as e:
+            raise ValueError(f'malformed VersionEdit: {e}')
+        edit = VersionEdit()
+        if json_map.get('has_comparator'):
+            edit.set_comparator(json_map['comparator'])
+        if json_map.get('has_log_number'):
+            edit.set_log_number(json_map['log_number'])
+        if json_map.get('has_prev_log_number'):
+            edit.set_prev_log_number(json_map['prev_log_number'])
+        if json_map.get('has_next_file_number'):
+            edit.set_next_file_number(json_map['next_file_number'])
+        if json_map.get('has_last_sequence'):
+            edit.set_last_sequence(json_map['last_sequence'])
+        for level, key in json_map.get('compact_pointers', []):
+            edit.set_compact_pointer(level, bytes.fromhex(key))
+        for level, number in json_map.get('deleted_files', []):
+            edit.remove_file(level, number)
+        for level, f in json_map.get('new_files', []):
+            f = json.loads(f)
+            edit.add_file(level, f['number'], f['file_size'], bytes.fromhex(f['smallest_key']),
+                          bytes.fromhex(f['greatest_key']))
         return edit
 
     def set_log_number(self, log_number: int):
@@ -103,3 +217,24 @@ class VersionEdit:
     def set_comparator(self, comparator: str):
         self.comparator = comparator
         self.has_comparator = True
+
+    def set_compact_pointer(self, level: int, key: bytes):
+        self.compact_pointers.append((level, bytearray(key)))
+
+    def add_file(self, level: int, number: int, file_size: int, smallest_key: bytes, greatest_key: bytes):
+        """
+        Add the specified file at the specified level.
+        smallest_key and greatest_key are the smallest and greatest internal keys in the file.
+        """
+        f = FileMetaData()
+        f.number = number
+        f.file_size = file_size
+        f.smallest_key = bytearray(smallest_key)
+        f.greatest_key = bytearray(greatest_key)
+        self.new_files.append((level, f))
+
+    def remove_file(self, level: int, number: int):
+        """
+        Delete the specified file from the specified level.
+        """
+        self.deleted_files.add((level, number))
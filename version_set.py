@@ -1,18 +1,153 @@
 import logging
 import os.path
+import threading
+from bisect import bisect_left
 
-import config
 import utils
 from log_writer import Writer
 from version_edit import VersionEdit
-from option import DBOption
+from option import DBOption, ReadOption
 from db_types import SequenceNumber
 from status import Status
-from typing import List
+from typing import List, Set
 from version_edit import FileMetaData
-from config import MAX_NUM_LEVEL
-from utils import current_file_name, USER_KEY_COMPARATOR
-from log_reader import Reader
+from config import MAX_NUM_LEVEL, L0_COMPACTION_TRIGGER, NUM_NON_TABLE_CACHE_FILES, BYTES_PER_SEEK, MIN_ALLOWED_SEEKS
+from utils import current_file_name, USER_KEY_COMPARATOR, raw_internal_key_comparator, user_key_comparator
+from log_reader import Reader, LoggingReporter
+from dbformat import LookupKey, InternalKey, ValueType, MAX_SEQUENCE_NUMBER, byte_order
+from memtable import encode_comparable_key
+from table_cache import TableCache
+from iterator import EmptyIterator
+from merger import MergingIterator
+from two_level_iterator import TwoLevelIterator
+
+
+def comparable_internal_key(internal_key: bytes) -> bytes:
+    """
+    Encode an internal key into bytes ordered as the internal keys, so that the keys
+    can be compared natively and searched with bisect. See memtable.encode_comparable_key.
+    """
+    return encode_comparable_key(bytes(internal_key[:-8]), int.from_bytes(internal_key[-8:-1], byte_order),
+                                 internal_key[-1])
+
+
+def find_file(files: List[FileMetaData], internal_key: bytes, greatest_keys: List[bytes] = None) -> int:
+    """
+    Return the smallest index i such that files[i].greatest_key >= internal_key.
+    Return len(files) if there is no such file.
+    If greatest_keys is not None, it is the index of files, see Version.greatest_keys.
+    REQUIRES: files contains a sorted list of non-overlapping files.
+    """
+    if greatest_keys is not None:
+        return bisect_left(greatest_keys, comparable_internal_key(internal_key))
+
+    left = 0
+    right = len(files)
+    while left < right:
+        mid = (left + right) // 2
+        if raw_internal_key_comparator(files[mid].greatest_key, internal_key) < 0:
+            # Key at "mid.greatest" is < "target". Therefore all
+            # files at or before "mid" are uninteresting.
+            left = mid + 1
+        else:
+            # Key at "mid.greatest" is >= "target". Therefore all files
+            # after "mid" are uninteresting.
+            right = mid
+    return right
+
+
+def total_file_size(files: List[FileMetaData]) -> int:
+    return sum(f.file_size for f in files)
+
+
+def after_file(user_key: bytes, f: FileMetaData) -> bool:
+    # None user_key occurs before all keys and is therefore never after f
+    return user_key is not None and \
+        user_key_comparator(user_key, InternalKey.extract_user_key(f.greatest_key)) > 0
+
+
+def before_file(user_key: bytes, f: FileMetaData) -> bool:
+    # None user_key occurs after all keys and is therefore never before f
+    return user_key is not None and \
+        user_key_comparator(user_key, InternalKey.extract_user_key(f.smallest_key)) < 0
+
+
+def some_file_overlaps_range(files: List[FileMetaData], disjoint_sorted_files: bool,
+                             smallest_user_key: bytes, largest_user_key: bytes,
+                             greatest_keys: List[bytes] = None) -> bool:
+    """
+    Returns true iff some file in files overlaps the user key range [smallest_user_key, largest_user_key].
+    smallest_user_key == None represents a key smaller than all the keys in the DB.
+    largest_user_key == None represents a key larger than all the keys in the DB.
+    greatest_keys is the optional index of files, see find_file.
+    REQUIRES: If disjoint_sorted_files, files contains disjoint ranges in sorted order.
+    """
+    if not disjoint_sorted_files:
+        # Need to check against all files
+        for f in files:
+            if after_file(smallest_user_key, f) or before_file(largest_user_key, f):
+                # No overlap
+                pass
+            else:
+                return True
+        return False
+
+    # Binary search over file list
+    index = 0
+    if smallest_user_key is not None:
+        # Find the earliest possible internal key for smallest_user_key
+        small_key = InternalKey.make(smallest_user_key, MAX_SEQUENCE_NUMBER, ValueType.kTypeValue)
+        index = find_file(files, small_key, greatest_keys)
+
+    if index >= len(files):
+        # Beginning of range is after all files, so no overlap.
+        return False
+
+    return not before_file(largest_user_key, files[index])
+
+
+class Saver:
+    """
+    Saver receives the first entry >= the lookup key from a table, and records
+    whether the user key is found, deleted or absent in that table.
+    """
+    NOT_FOUND = 0
+    FOUND = 1
+    DELETED = 2
+    CORRUPT = 3
+
+    def __init__(self, user_key: bytes):
+        self.state = Saver.NOT_FOUND
+        self.user_key = user_key
+        self.value: bytes = None
+
+    def save_value(self, internal_key: bytes, value: bytes):
+        if len(internal_key) < 8:
+            self.state = Saver.CORRUPT
+            return
+        if user_key_comparator(InternalKey.extract_user_key(internal_key), self.user_key) != 0:
+            return
+        try:
+            value_type = InternalKey.extract_value_type(internal_key)
+        except ValueError:
+            self.state = Saver.CORRUPT
+            return
+        if value_type == ValueType.kTypeValue:
+            self.state = Saver.FOUND
+            self.value = value
+        else:
+            self.state = Saver.DELETED
+
+
+class GetStats:
+    """
+    GetStats records the file charged with a seek by a Version.get, which is the
+    first file probed when the lookup had to probe more than one file.
+    """
+
+    def __init__(self):
+        self.seek_file: FileMetaData = None
+        self.seek_file_level: int = -1
 
 
 class Version:
@@ -20,10 +155,179 @@ class Version:
         self.version_set = vs
         self.next = self
         self.prev = self
-        self.file_to_compact: List[List[FileMetaData]] = [[]] * MAX_NUM_LEVEL
+        # List of files per level. Level-0 files are ordered from the newest to the oldest,
+        # the files of the other levels are disjoint and sorted by key.
+        self.files: List[List[FileMetaData]] = [[] for _ in range(MAX_NUM_LEVEL)]
+        # The comparable_internal_key of the greatest key of every file of the levels > 0,
+        # in the order of files, so that the file of a key is found with bisect.
+        self.greatest_keys: List[List[bytes]] = [[] for _ in range(MAX_NUM_LEVEL)]
+        # Next file to compact based on seek stats, see update_stats
+        self.file_to_compact: FileMetaData = None
         self.file_to_compact_level: int = -1
+
+        # Level that should be compacted next and its compaction score.
+        # Score < 1 means compaction is not strictly needed. These fields
+        # are initialized by VersionSet.finalize().
+        self.compaction_score: float = -1
+        self.compaction_level: int = -1
         self._ref = 0
 
+    def set_files(self, level: int, files: List[FileMetaData]):
+        """
+        Set the files of level, which are in the order of the level.
+        """
+        self.files[level] = files
+        if level > 0:
+            self.greatest_keys[level] = [comparable_internal_key(f.greatest_key) for f in files]
+
+    def add_iterators(self, option: ReadOption, iters: List):
+        """
+        Append to iters a sequence of iterators that will yield the contents
+        of this version when merged together.
+        """
+        table_cache = self.version_set.table_cache()
+        # Merge all level zero files together since they may overlap
+        for f in self.files[0]:
+            iters.append(table_cache.new_iterator(option, f.number, f.file_size))
+
+        # For levels > 0, we can use a concatenating iterator that sequentially
+        # walks through the non-overlapping files in the level, opening them
+        # lazily.
+        for level in range(1, MAX_NUM_LEVEL):
+            if len(self.files[level]) > 0:
+                level_iter = LevelFileNumIterator(self.files[level], self.greatest_keys[level])
+                iters.append(TwoLevelIterator(level_iter,
+                                              self.version_set.get_file_iterator, option))
+
+    def get(self, option: ReadOption, lkey: LookupKey, value: List[str], stats: GetStats = None) -> Status:
+        """
+        Lookup the value for key in the tables of this version.
+        If found, append the value to value and return OK. Else return a non-OK status.
+        If stats is given, the file to charge with a seek is recorded in it.
+        """
+        ikey = bytes(lkey.internal_key())
+        user_key = InternalKey.extract_user_key(ikey)
+        comparable_key = None
+        last_file_read = None
+        last_file_read_level = -1
+
+        for level in range(MAX_NUM_LEVEL):
+            files = self.files[level]
+            if len(files) == 0:
+                continue
+
+            if level == 0:
+                # Level-0 files may overlap each other. Find all files that
+                # overlap user_key, they are ordered from newest to oldest.
+                candidates = []
+                for f in files:
+                    if user_key_comparator(user_key, InternalKey.extract_user_key(f.smallest_key)) >= 0 and \
+                            user_key_comparator(user_key, InternalKey.extract_user_key(f.greatest_key)) <= 0:
+                        candidates.append(f)
+            else:
+                # Binary search to find earliest index whose greatest key >= ikey.
+                if comparable_key is None:
+                    comparable_key = comparable_internal_key(ikey)
+                index = bisect_left(self.greatest_keys[level], comparable_key)
+                if index >= len(files):
+                    continue
+                f = files[index]
+                if user_key_comparator(user_key, InternalKey.extract_user_key(f.smallest_key)) < 0:
+                    # All of f is past any data for user_key
+                    continue
+                candidates = [f]
+
+            for f in candidates:
+                if last_file_read is not None and stats is not None and stats.seek_file is None:
+                    # We have had more than one seek for this read. Charge the 1st file.
+                    stats.seek_file = last_file_read
+                    stats.seek_file_level = last_file_read_level
+                last_file_read = f
+                last_file_read_level = level
+
+                saver = Saver(user_key)
+                s = self.version_set.table_cache().get(option, f.number, f.file_size, ikey, saver.save_value)
+                if not s.ok():
+                    return s
+
+                if saver.state == Saver.NOT_FOUND:
+                    # Keep searching in other files
+                    continue
+                elif saver.state == Saver.FOUND:
+                    value.append(saver.value.decode('utf-8'))
+                    return Status.OK()
+                elif saver.state == Saver.DELETED:
+                    return Status.NotFound()
+                else:
+                    return Status.Corruption(f'corrupted key for {user_key}')
+
+        return Status.NotFound()
+
+    def update_stats(self, stats: GetStats) -> bool:
+        """
+        Charge a seek to the file recorded in stats. Returns true if a new
+        compaction may need to be triggered, false otherwise.
+        REQUIRES: the db mutex is held
+        """
+        f = stats.seek_file
+        if f is not None:
+            f.allow_seek -= 1
+            if f.allow_seek <= 0 and self.file_to_compact is None:
+                self.file_to_compact = f
+                self.file_to_compact_level = stats.seek_file_level
+                return True
+        return False
+
+    def num_files(self, level: int) -> int:
+        return len(self.files[level])
+
+    def overlap_in_level(self, level: int, smallest_user_key: bytes, largest_user_key: bytes) -> bool:
+        """
+        Returns true iff some file in the specified level overlaps
+        some part of [smallest_user_key, largest_user_key].
+        """
+        if level == 0:
+            return some_file_overlaps_range(self.files[level], False, smallest_user_key, largest_user_key)
+        return some_file_overlaps_range(self.files[level], True, smallest_user_key, largest_user_key,
+                                        self.greatest_keys[level])
+
+    def get_overlapping_inputs(self, level: int, begin: bytes, end: bytes) -> List[FileMetaData]:
+        """
+        Return all files in level that overlap [begin, end].
+        begin == None means before all keys, end == None means after all keys.
+        """
+        assert 0 <= level < MAX_NUM_LEVEL
+        inputs = []
+        user_begin = InternalKey.extract_user_key(begin) if begin is not None else None
+        user_end = InternalKey.extract_user_key(end) if end is not None else None
+        files = self.files[level]
+        i = 0
+        while i < len(files):
+            f = files[i]
+            i += 1
+            file_start = InternalKey.extract_user_key(f.smallest_key)
+            file_limit = InternalKey.extract_user_key(f.greatest_key)
+            if user_begin is not None and user_key_comparator(file_limit, user_begin) < 0:
+                # f is completely before specified range; skip it
+                pass
+            elif user_end is not None and user_key_comparator(file_start, user_end) > 0:
+                # f is completely after specified range; skip it
+                pass
+            else:
+                inputs.append(f)
+                if level == 0:
+                    # Level-0 files may overlap each other. So check if the newly
+                    # added file has expanded the range. If so, restart search.
+                    if user_begin is not None and user_key_comparator(file_start, user_begin) < 0:
+                        user_begin = file_start
+                        inputs = []
+                        i = 0
+                    elif user_end is not None and user_key_comparator(file_limit, user_end) > 0:
+                        user_end = file_limit
+                        inputs = []
+                        i = 0
+        return inputs
+
     def ref(self):
         self._ref += 1
 
@@ -39,27 +343,129 @@ class Version:
 
 
 class VersionBuilder:
+    """
+    A helper class so we can efficiently apply a whole sequence
+    of edits to a particular version without creating intermediate
+    versions that contain full copies of the intermediate state.
+    """
+
     def __init__(self, vs: 'VersionSet', base: Version):
         self._version_set = vs
         self._base = base
-        # TODO: more status about metadata of files
+        self._deleted_files: List[Set[int]] = [set() for _ in range(MAX_NUM_LEVEL)]
+        self._added_files: List[dict] = [{} for _ in range(MAX_NUM_LEVEL)]
 
     def apply(self, edit: VersionEdit):
-        pass
+        """
+        Apply all the file changes in edit to the current state.
+        """
+        # Update compaction pointers
+        for level, key in edit.compact_pointers:
+            self._version_set._compact_pointer[level] = bytes(key)
+
+        for level, number in edit.deleted_files:
+            self._deleted_files[level].add(number)
+            self._added_files[level].pop(number, None)
+
+        for level, f in edit.new_files:
+            # We arrange to automatically compact this file after
+            # a certain number of seeks. Let's assume:
+            #   (1) One seek costs 10ms
+            #   (2) Writing or reading 1MB costs 10ms (100MB/s)
+            #   (3) A compaction of 1MB does 25MB of IO:
+            #         1MB read from this level
+            #         10-12MB read from next level (boundaries may be misaligned)
+            #         10-12MB written to next level
+            # This implies that 25 seeks cost the same as the compaction
+            # of 1MB of data. I.e., one seek costs approximately the
+            # same as the compaction of 40KB of data. We are a little
+            # conservative and allow approximately one seek for every 16KB
+            # of data before triggering a compaction.
+            f.allow_seek = max(MIN_ALLOWED_SEEKS, f.file_size // BYTES_PER_SEEK)
+            self._deleted_files[level].discard(f.number)
+            self._added_files[level][f.number] = f
 
     def build(self, v: Version):
-        # TODO: do something like adding files to version
-        pass
+        """
+        Save the current state in v.
+        """
+        for level in range(MAX_NUM_LEVEL):
+            files = [f for f in self._base.files[level] if f.number not in self._deleted_files[level]]
+            files.extend(self._added_files[level].values())
+            if level == 0:
+                # Level-0 files are ordered from the newest to the oldest flush, which is
+                # the order they are searched in.
+                files.sort(key=lambda f: f.number, reverse=True)
+            else:
+                files.sort(key=lambda f: comparable_internal_key(f.smallest_key))
+            v.set_files(level, files)
+
+
+class LevelFileNumIterator:
+    """
+    An internal iterator over the files of a level. For a given entry, key()
+    is the greatest key in the file and value() is a 16-byte value containing
+    the file number and the file size, both encoded with 8 bytes.
+    REQUIRES: files contains disjoint ranges in sorted order.
+    """
+
+    def __init__(self, files: List[FileMetaData], greatest_keys: List[bytes] = None):
+        self._files = files
+        # The optional index of files, see find_file
+        self._greatest_keys = greatest_keys
+        # Marks as invalid
+        self._index = len(files)
+
+    def valid(self) -> bool:
+        return self._index < len(self._files)
+
+    def status(self) -> Status:
+        return Status.OK()
+
+    def seek(self, target: bytes):
+        self._index = find_file(self._files, target, self._greatest_keys)
+
+    def seek_to_first(self):
+        self._index = 0
+
+    def seek_to_last(self):
+        self._index = len(self._files) - 1 if len(self._files) > 0 else 0
+
+    def next(self):
+        assert self.valid()
+        self._index += 1
+
+    def prev(self):
+        assert self.valid()
+        if self._index == 0:
+            # Marks as invalid
+            self._index = len(self._files)
+        else:
+            self._index -= 1
+
+    def key(self) -> bytes:
+        assert self.valid()
+        return self._files[self._index].greatest_key
+
+    def value(self) -> bytes:
+        assert self.valid()
+        f = self._files[self._index]
+        return f.number.to_bytes(8, byte_order) + f.file_size.to_bytes(8, byte_order)
 
 
 class VersionSet:
-    def __init__(self, db_name: str, option: DBOption):
+    def __init__(self, db_name: str, option: DBOption, table_cache: TableCache = None):
         self._db_name = db_name
         self._option = option
+        if table_cache is None:
+            table_cache = TableCache(db_name, option, option.max_open_files - NUM_NON_TABLE_CACHE_FILES)
+        self._table_cache = table_cache
         self._next_file_number = 2
         self._prev_log_number = 0
         self._last_sequence: SequenceNumber = 0
         self._manifest_file_number = 0
+        # The number of the manifest named by the current file
+        self._live_manifest_file_number = 0
         self._log_number = 0
         self._logger = utils.get_logger_from_db_option(db_name, option.log_level)
 
@@ -75,6 +481,10 @@ class VersionSet:
         self._dummy: Version = Version(self)
         self.append(Version(self))
 
+        # Per-level key at which the next compaction at that level should start.
+        # Either an empty bytes, or a valid internal key.
+        self._compact_pointer: List[bytes] = [b'' for _ in range(MAX_NUM_LEVEL)]
+
     def next_file_number(self) -> int:
         return self._next_file_number
 
@@ -103,12 +513,42 @@ class VersionSet:
     def set_log_number(self, number: int):
         self._log_number = number
 
+    def live_manifest_file_number(self) -> int:
+        """
+        The number of the manifest named by the current file. The manifests of smaller
+        numbers are obsolete, the manifest of manifest_file_number() may not be written yet.
+        """
+        return self._live_manifest_file_number
+
     def set_manifest_file_number(self, number: int):
         self._manifest_file_number = number
 
     def current(self) -> Version:
         return self._current
 
+    def db_name(self) -> str:
+        return self._db_name
+
+    def table_cache(self) -> TableCache:
+        return self._table_cache
+
+    def option(self) -> DBOption:
+        return self._option
+
+    def num_level_files(self, level: int) -> int:
+        return self._current.num_files(level)
+
+    def add_live_files(self, live: Set[int]):
+        """
+        Add all files listed in any live version to live.
+        """
+        v = self._dummy.next
+        while v != self._dummy:
+            for level in range(MAX_NUM_LEVEL):
+                for f in v.files[level]:
+                    live.add(f.number)
+            v = v.next
+
     def recover(self) -> (Status, bool):
         """
         recover from persistent storage
@@ -131,7 +571,9 @@ class VersionSet:
 
         current = ''
         with open(current_path, 'r') as current_fd:
-            current = current_fd.readline()
+            # The name of the manifest, followed by a newline since the current file is
+            # written atomically. The newline is missing from older current files.
+            current = current_fd.readline().rstrip('\n')
             if current == '':
                 s = Status.Corruption('current file is empty')
                 return s, should_save_manifest
@@ -152,36 +594,46 @@ class VersionSet:
         reads_records = 0
         builder = VersionBuilder(self, self._current)
 
-        reader = Reader(manifest_path)
-        while True:
-            record = reader.read_record()
-            if record is None:
-                break
-            edit = VersionEdit.deserialize(record)
+        # Any corruption of the manifest fails the recovery
+        s = Status.OK()
+        reader = Reader(manifest_path, LoggingReporter(self._logger, manifest_path, s))
+        try:
+            while s.ok():
+                record = reader.read_record()
+                if record is None:
+                    break
+                try:
+                    edit = VersionEdit.deserialize(record)
+                except ValueError as e:
+                    s = Status.Corruption(f'{manifest_path}: {e}')
+                    break
 
-            if edit.has_comparator:
-                if edit.comparator != USER_KEY_COMPARATOR:
-                    s = Status.InvalidArgument(f'{edit.comparator} is not match {USER_KEY_COMPARATOR}')
-                    return s, should_save_manifest
+                if edit.has_comparator:
+                    if edit.comparator != USER_KEY_COMPARATOR:
+                        s = Status.InvalidArgument(f'{edit.comparator} is not match {USER_KEY_COMPARATOR}')
+                        return s, should_save_manifest
 
-            builder.apply(edit)
+                builder.apply(edit)
 
-            if edit.has_log_number:
-                has_log_number = True
-                log_number = edit.log_number
+                if edit.has_log_number:
+                    has_log_number = True
+                    log_number = edit.log_number
 
-            if edit.has_prev_log_number:
-                has_prev_log_number = True
-                prev_log_number = edit.prev_log_number
+                if edit.has_prev_log_number:
+                    has_prev_log_number = True
+                    prev_log_number = edit.prev_log_number
 
-            if edit.has_last_sequence:
-                has_last_sequence_number = True
-                last_sequence_number = edit.last_sequence
+                if edit.has_last_sequence:
+                    has_last_sequence_number = True
+                    last_sequence_number = edit.last_sequence
 
-            if edit.has_next_file_number:
-                has_next_file_number = True
-                next_file_number = edit.next_file_number
-        del reader
+                if edit.has_next_file_number:
+                    has_next_file_number = True
+                    next_file_number = edit.next_file_number
+        finally:
+            reader.close()
+        if not s.ok():
+            return s, should_save_manifest
 
         if not has_log_number:
             s = Status.Corruption('log number not found')
@@ -201,14 +653,18 @@ class VersionSet:
 
         version = Version(self)
         builder.build(version)
+        # Install recovered version
+        self.finalize(version)
         self.append(version)
         self._manifest_file_number = next_file_number
         self._next_file_number = next_file_number + 1
+        self._live_manifest_file_number = utils.parse_manifest_file_number(current) or 0
         self._last_sequence = last_sequence_number
         self._log_number = log_number
         self._prev_log_number = prev_log_number
 
-        if os.path.getsize(manifest_path) > config.MAX_REUSED_MANIFEST_SIZE:
+        # A manifest that outgrew the limit of log_and_apply is replaced by a snapshot on open
+        if os.path.getsize(manifest_path) > self._option.max_manifest_file_size:
             should_save_manifest = True
 
         return Status.OK(), should_save_manifest
@@ -232,22 +688,33 @@ class VersionSet:
         if self._next_file_number <= log_number:
             self._next_file_number = log_number + 1
 
-    def log_and_apply(self, edit: VersionEdit) -> Status:
+    def log_and_apply(self, edit: VersionEdit, mutex: threading.Lock = None) -> Status:
         """
-        save version edit to log file and apply it to current version set
+        Save the edit to the manifest and apply it to the current version.
 
-        :param edit:
-        :return:
+        If mutex is given, it must be held by the caller, and it is released while the
+        manifest is written and synced.
+        REQUIRES: no other log_and_apply is running. The db only calls it while opening
+        and from its single background thread, which flushes the memtable and compacts.
         """
-        # We can not apply to the current version if it is not the last version
+        if self._descriptor_log is not None and \
+                self._descriptor_log.file_size() >= self._option.max_manifest_file_size:
+            # Roll over to a new manifest starting with a snapshot of the current version,
+            # the old manifest is deleted once the current file names the new one
+            self._logger.info('roll over manifest %s of %s bytes' % (
+                self._manifest_file_number, self._descriptor_log.file_size()))
+            self._descriptor_log.close()
+            self._descriptor_log = None
+            self._manifest_file_number = self.new_file_number()
+
         if edit.has_log_number:
             assert edit.log_number >= self._log_number
             assert edit.log_number < self._next_file_number
         else:
-            edit.set_log_number(self.log_number())
+            edit.set_log_number(self._log_number)
 
         if not edit.has_prev_log_number:
-            edit.set_prev_log_number(self.prev_log_number())
+            edit.set_prev_log_number(self._prev_log_number)
 
         edit.set_next_file_number(self._next_file_number)
         edit.set_last_sequence(self._last_sequence)
@@ -257,45 +724,74 @@ class VersionSet:
         builder = VersionBuilder(self, self.current())
         builder.apply(edit)
         builder.build(v)
+        self.finalize(v)
 
-        if self._descriptor_log is None:
-            # The descriptor_log does not exist, create it.
-            # And we need to write the snapshot to the descriptor_log
-            manifest = utils.manifest_file_name(self._db_name, self._manifest_file_number)
-            self._descriptor_log = Writer(manifest)
+        new_manifest = self._descriptor_log is None
+        manifest = utils.manifest_file_name(self._db_name, self._manifest_file_number)
+        snapshot = None
+        if new_manifest:
+            # The manifest is created with a snapshot of the current version
             s, snapshot = self.build_snapshot()
             if not s.ok():
                 return s
-            self
-            self._descriptor_log.write_record(snapshot)
-
-        # Write the version edit to the descriptor_log
-        record = edit.serialize()
-        self._descriptor_log.write_record(record)
-        self._descriptor_log.flush()
-        s = utils.save_current_file(self._db_name, self._manifest_file_number)
-        self._logger.info('save current file in log_and_apply')
+
+        # Unlock during the expensive manifest write. Only the caller of log_and_apply
+        # installs versions, so the current version does not change.
+        if mutex is not None:
+            mutex.release()
+        s = Status.OK()
+        try:
+            if new_manifest:
+                self._descriptor_log = Writer(manifest)
+                self._descriptor_log.write_record(snapshot)
+            self._descriptor_log.write_record(edit.serialize())
+            self._descriptor_log.sync()
+            # The current file only changes when a new manifest is created
+            if new_manifest:
+                s = utils.save_current_file(self._db_name, self._manifest_file_number)
+                self._logger.info('save current file %s' % self._manifest_file_number)
+        except OSError as e:
+            s = Status.IOError(f'{manifest}: {e}')
+        finally:
+            if mutex is not None:
+                mutex.acquire()
+
         if not s.ok():
-            manifest = utils.manifest_file_name(self._db_name, self._manifest_file_number)
-            if os.path.exists(manifest):
-                os.remove(manifest)
-            self._descriptor_log.close()
+            if new_manifest:
+                if self._descriptor_log is not None:
+                    self._descriptor_log.close()
+                    self._descriptor_log = None
+                if os.path.exists(manifest):
+                    os.remove(manifest)
             return s
+        self._live_manifest_file_number = self._manifest_file_number
 
         # Accept the new version
         self.append(v)
         self._log_number = edit.log_number
         self._prev_log_number = edit.prev_log_number
-        self._logger.info(
-            'install new version. log_number: {}, prev_log_number: {}'.format(self._log_number, self._prev_log_number))
+        self._logger.info('install new version. log_number: %s, prev_log_number: %s' % (
+            self._log_number, self._prev_log_number))
 
         return Status.OK()
 
     def build_snapshot(self) -> (Status, bytearray):
         edit = VersionEdit()
         edit.set_comparator(USER_KEY_COMPARATOR)
+        edit.set_log_number(self._log_number)
+        edit.set_prev_log_number(self._prev_log_number)
+        edit.set_next_file_number(self._next_file_number)
+        edit.set_last_sequence(self._last_sequence)
+
+        # Save compaction pointers
+        for level in range(MAX_NUM_LEVEL):
+            if len(self._compact_pointer[level]) > 0:
+                edit.set_compact_pointer(level, self._compact_pointer[level])
 
-        # TODO: Save compact pointers and files
+        # Save files
+        for level in range(MAX_NUM_LEVEL):
+            for f in self._current.files[level]:
+                edit.add_file(level, f.number, f.file_size, f.smallest_key, f.greatest_key)
         return Status.OK(), edit.serialize()
 
     def new_file_number(self) -> int:
@@ -311,3 +807,382 @@ class VersionSet:
         if self._descriptor_log is not None:
             self._descriptor_log.close()
             self._descriptor_log = None
+
+    def max_bytes_for_level(self, level: int) -> float:
+        # Note: the result for level zero is not really used since we set
+        # the level-0 compaction threshold based on number of files.
+        result = self._option.max_bytes_for_level_base
+        while level > 1:
+            result *= 10
+            level -= 1
+        return result
+
+    def finalize(self, v: Version):
+        """
+        Precompute the best level for the next compaction.
+        """
+        best_level = -1
+        best_score = -1
+
+        for level in range(MAX_NUM_LEVEL - 1):
+            if level == 0:
+                # We treat level-0 specially by bounding the number of files
+                # instead of number of bytes for two reasons:
+                #
+                # (1) With larger write-buffer sizes, it is nice not to do too
+                # many level-0 compactions.
+                #
+                # (2) The files in level-0 are merged on every read and
+                # therefore we wish to avoid too many files when the individual
+                # file size is small (perhaps because of a small write-buffer
+                # setting, or very high compression ratios, or lots of
+                # overwrites/deletions).
+                score = len(v.files[level]) / L0_COMPACTION_TRIGGER
+            else:
+                # Compute the ratio of current size to size limit.
+                score = total_file_size(v.files[level]) / self.max_bytes_for_level(level)
+
+            if score > best_score:
+                best_level = level
+                best_score = score
+
+        v.compaction_level = best_level
+        v.compaction_score = best_score
+
+    def needs_compaction(self) -> bool:
+        """
+        Returns true iff some level needs a compaction.
+        """
+        return self._current.compaction_score >= 1 or self._current.file_to_compact is not None
+
+    def num_level_bytes(self, level: int) -> int:
+        return total_file_size(self._current.files[level])
+
+    def level_summary(self) -> str:
+        return 'files[ %s ]' % ' '.join(str(len(files)) for files in self._current.files)
+
+    def get_range(self, inputs: List[FileMetaData]) -> (bytes, bytes):
+        """
+        Return the smallest and the greatest internal keys of all entries in inputs.
+        REQUIRES: inputs is not empty
+        """
+        assert len(inputs) > 0
+        smallest = inputs[0].smallest_key
+        greatest = inputs[0].greatest_key
+        for f in inputs[1:]:
+            if raw_internal_key_comparator(f.smallest_key, smallest) < 0:
+                smallest = f.smallest_key
+            if raw_internal_key_comparator(f.greatest_key, greatest) > 0:
+                greatest = f.greatest_key
+        return bytes(smallest), bytes(greatest)
+
+    def get_range2(self, inputs1: List[FileMetaData], inputs2: List[FileMetaData]) -> (bytes, bytes):
+        return self.get_range(inputs1 + inputs2)
+
+    def get_file_iterator(self, option: ReadOption, file_value: bytes):
+        if len(file_value) != 16:
+            return EmptyIterator(Status.Corruption('FileReader invoked with unexpected value'))
+        number = int.from_bytes(file_value[:8], byte_order)
+        file_size = int.from_bytes(file_value[8:], byte_order)
+        return self._table_cache.new_iterator(option, number, file_size)
+
+    def make_input_iterator(self, c: 'Compaction') -> MergingIterator:
+        """
+        Create an iterator that reads over the compaction inputs for c.
+        """
+        option = ReadOption()
+        option.verify_checksums = True
+        option.fill_cache = False
+
+        # Level-0 files have to be merged together. For other levels,
+        # we will make a concatenating iterator per level.
+        children = []
+        for which in range(2):
+            if len(c.inputs[which]) == 0:
+                continue
+            if c.level() + which == 0:
+                for f in c.inputs[which]:
+                    children.append(self._table_cache.new_iterator(option, f.number, f.file_size))
+            else:
+                # Create concatenating iterator for the files from this level
+                children.append(TwoLevelIterator(LevelFileNumIterator(c.inputs[which]),
+                                                 self.get_file_iterator, option))
+        return MergingIterator(children)
+
+    def pick_compaction(self) -> 'Compaction':
+        """
+        Pick level and inputs for a new compaction.
+        Returns None if there is no compaction to be done.
+        """
+        # We prefer compactions triggered by too much data in a level over
+        # the compactions triggered by seeks.
+        size_compaction = self._current.compaction_score >= 1
+        seek_compaction = self._current.file_to_compact is not None
+        if size_compaction:
+            level = self._current.compaction_level
+            assert 0 <= level and level + 1 < MAX_NUM_LEVEL
+            c = Compaction(self._option, level)
+
+            # Pick the first file that comes after compact_pointer[level]
+            for f in self._current.files[level]:
+                if len(self._compact_pointer[level]) == 0 or \
+                        raw_internal_key_comparator(f.greatest_key, self._compact_pointer[level]) > 0:
+                    c.inputs[0].append(f)
+                    break
+            if len(c.inputs[0]) == 0:
+                # Wrap-around to the beginning of the key space
+                c.inputs[0].append(self._current.files[level][0])
+        elif seek_compaction:
+            level = self._current.file_to_compact_level
+            # A file charged with a seek was probed before a file of a deeper level
+            assert 0 <= level and level + 1 < MAX_NUM_LEVEL
+            c = Compaction(self._option, level)
+            c.inputs[0].append(self._current.file_to_compact)
+        else:
+            return None
+
+        c.input_version = self._current
+        c.input_version.ref()
+
+        # Files in level 0 may overlap each other, so pick up all overlapping ones
+        if level == 0:
+            smallest, greatest = self.get_range(c.inputs[0])
+            # Note that the next call will discard the file we placed in
+            # c.inputs[0] earlier and replace it with an overlapping set
+            # which will include the picked file.
+            c.inputs[0] = self._current.get_overlapping_inputs(0, smallest, greatest)
+            assert len(c.inputs[0]) > 0
+
+        self.setup_other_inputs(c)
+        return c
+
+    def setup_other_inputs(self, c: 'Compaction'):
+        level = c.level()
+        current = self._current
+
+        add_boundary_inputs(current.files[level], c.inputs[0])
+        smallest, greatest = self.get_range(c.inputs[0])
+
+        c.inputs[1] = current.get_overlapping_inputs(level + 1, smallest, greatest)
+        add_boundary_inputs(current.files[level + 1], c.inputs[1])
+
+        # Get entire range covered by compaction
+        all_start, all_limit = self.get_range2(c.inputs[0], c.inputs[1])
+
+        # See if we can grow the number of inputs in "level" without
+        # changing the number of "level+1" files we pick up.
+        if len(c.inputs[1]) > 0:
+            expanded0 = current.get_overlapping_inputs(level, all_start, all_limit)
+            add_boundary_inputs(current.files[level], expanded0)
+            inputs0_size = total_file_size(c.inputs[0])
+            inputs1_size = total_file_size(c.inputs[1])
+            expanded0_size = total_file_size(expanded0)
+            if len(expanded0) > len(c.inputs[0]) and \
+                    inputs1_size + expanded0_size < expanded_compaction_byte_size_limit(self._option):
+                new_start, new_limit = self.get_range(expanded0)
+                expanded1 = current.get_overlapping_inputs(level + 1, new_start, new_limit)
+                add_boundary_inputs(current.files[level + 1], expanded1)
+                if len(expanded1) == len(c.inputs[1]):
+                    self._logger.info('expanding@%d %d+%d (%d+%d bytes) to %d+%d (%d+%d bytes)' % (
+                        level, len(c.inputs[0]), len(c.inputs[1]), inputs0_size, inputs1_size,
+                        len(expanded0), len(expanded1), expanded0_size, inputs1_size))
+                    smallest, greatest = new_start, new_limit
+                    c.inputs[0] = expanded0
+                    c.inputs[1] = expanded1
+                    all_start, all_limit = self.get_range2(c.inputs[0], c.inputs[1])
+
+        # Compute the set of grandparent files that overlap this compaction
+        # (parent == level+1; grandparent == level+2)
+        if level + 2 < MAX_NUM_LEVEL:
+            c.grandparents = current.get_overlapping_inputs(level + 2, all_start, all_limit)
+
+        # Update the place where we will do the next compaction for this level.
+        # We update this immediately instead of waiting for the VersionEdit
+        # to be applied so that if the compaction fails, we will try a different
+        # key range next time.
+        self._compact_pointer[level] = greatest
+        c.edit.set_compact_pointer(level, greatest)
+
+
+def max_grand_parent_overlap_bytes(option: DBOption) -> int:
+    # Maximum bytes of overlaps in grandparent (i.e., level+2) before we
+    # stop building a single file in a level->level+1 compaction.
+    return 10 * option.max_file_size
+
+
+def expanded_compaction_byte_size_limit(option: DBOption) -> int:
+    # Maximum number of bytes in all compacted files. We avoid expanding
+    # the lower level file set of a compaction if it would make the
+    # total compaction cover more than this many bytes.
+    return 25 * option.max_file_size
+
+
+def find_largest_key(files: List[FileMetaData]) -> bytes:
+    """
+    Finds the largest key in a vector of files. Returns None if files is empty.
+    """
+    largest = None
+    for f in files:
+        if largest is None or raw_internal_key_comparator(f.greatest_key, largest) > 0:
+            largest = f.greatest_key
+    return largest
+
+
+def find_smallest_boundary_file(level_files: List[FileMetaData], largest_key: bytes) -> FileMetaData:
+    """
+    Finds minimum file b in level_files where
+    b.smallest_key > largest_key and user_key(b.smallest_key) == user_key(largest_key).
+    Returns None if there is no such file.
+    """
+    smallest_boundary_file = None
+    for f in level_files:
+        if raw_internal_key_comparator(f.smallest_key, largest_key) > 0 and \
+                user_key_comparator(InternalKey.extract_user_key(f.smallest_key),
+                                    InternalKey.extract_user_key(largest_key)) == 0:
+            if smallest_boundary_file is None or \
+                    raw_internal_key_comparator(f.smallest_key, smallest_boundary_file.smallest_key) < 0:
+                smallest_boundary_file = f
+    return smallest_boundary_file
+
+
+def add_boundary_inputs(level_files: List[FileMetaData], compaction_files: List[FileMetaData]):
+    """
+    Extracts the largest file b1 from compaction_files and then searches for a
+    b2 in level_files for which user_key(u1) = user_key(l2). If it finds such a
+    file b2 (known as a boundary file) it adds it to compaction_files and then
+    searches again using this new upper bound.
+
+    If there are two blocks, b1=(l1, u1) and b2=(l2, u2) and
+    user_key(u1) = user_key(l2), and if we compact b1 but not b2 then a
+    subsequent get operation will yield an incorrect result because it will
+    return the record from b2 in level i rather than from b1 because it
+    searches level by level for records matching the supplied user key.
+    """
+    largest_key = find_largest_key(compaction_files)
+    if largest_key is None:
+        return
+
+    while True:
+        smallest_boundary_file = find_smallest_boundary_file(level_files, largest_key)
+        # If a boundary file was found advance largest_key, otherwise we're done.
+        if smallest_boundary_file is None:
+            break
+        compaction_files.append(smallest_boundary_file)
+        largest_key = smallest_boundary_file.greatest_key
+
+
+class Compaction:
+    """
+    A Compaction encapsulates information about a compaction.
+    """
+
+    def __init__(self, option: DBOption, level: int):
+        self._level = level
+        self._max_output_file_size = option.max_file_size
+        self._max_grand_parent_overlap_bytes = max_grand_parent_overlap_bytes(option)
+        self.input_version: Version = None
+        self.edit = VersionEdit()
+
+        # Each compaction reads inputs from "level" and "level+1"
+        self.inputs: List[List[FileMetaData]] = [[], []]
+
+        # State used to check for number of overlapping grandparent files
+        # (parent == level + 1, grandparent == level + 2)
+        self.grandparents: List[FileMetaData] = []
+        # Index in grandparents
+        self._grandparent_index = 0
+        # Some output key has been seen
+        self._seen_key = False
+        # Bytes of overlap between current output and grandparent files
+        self._overlapped_bytes = 0
+
+        # State for implementing is_base_level_for_key
+
+        # _level_ptrs holds indices into input_version.files: our state
+        # is that we are positioned at one of the file ranges for each
+        # higher level than the ones involved in this compaction (i.e. for
+        # all L >= level + 2).
+        self._level_ptrs = [0] * MAX_NUM_LEVEL
+
+    def level(self) -> int:
+        """
+        Return the level that is being compacted. Inputs from "level"
+        and "level+1" will be merged to produce a set of "level+1" files.
+        """
+        return self._level
+
+    def num_input_files(self, which: int) -> int:
+        return len(self.inputs[which])
+
+    def input(self, which: int, i: int) -> FileMetaData:
+        return self.inputs[which][i]
+
+    def max_output_file_size(self) -> int:
+        return self._max_output_file_size
+
+    def is_trivial_move(self) -> bool:
+        """
+        Is this a trivial compaction that can be implemented by just
+        moving a single input file to the next level (no merging or splitting)
+        """
+        # Avoid a move if there is lots of overlapping grandparent data.
+        # Otherwise, the move could create a parent file that will require
+        # a very expensive merge later on.
+        return self.num_input_files(0) == 1 and self.num_input_files(1) == 0 and \
+            total_file_size(self.grandparents) <= self._max_grand_parent_overlap_bytes
+
+    def add_input_deletions(self, edit: VersionEdit):
+        """
+        Add all inputs to this compaction as delete operations to edit.
+        """
+        for which in range(2):
+            for f in self.inputs[which]:
+                edit.remove_file(self._level + which, f.number)
+
+    def is_base_level_for_key(self, user_key: bytes) -> bool:
+        """
+        Returns true if the information we have available guarantees that
+        the compaction is producing data in "level+1" for which no data exists
+        in levels greater than "level+1".
+        """
+        # Maybe use binary search to find right entry instead of linear search?
+        for lvl in range(self._level + 2, MAX_NUM_LEVEL):
+            files = self.input_version.files[lvl]
+            while self._level_ptrs[lvl] < len(files):
+                f = files[self._level_ptrs[lvl]]
+                if user_key_comparator(user_key, InternalKey.extract_user_key(f.greatest_key)) <= 0:
+                    # We've advanced far enough
+                    if user_key_comparator(user_key, InternalKey.extract_user_key(f.smallest_key)) >= 0:
+                        # Key falls in this file's range, so definitely not base level
+                        return False
+                    break
+                self._level_ptrs[lvl] += 1
+        return True
+
+    def should_stop_before(self, internal_key: bytes) -> bool:
+        """
+        Returns true iff we should stop building the current output
+        before processing internal_key.
+        """
+        # Scan to find the earliest grandparent file that contains key.
+        while self._grandparent_index < len(self.grandparents) and \
+                raw_internal_key_comparator(internal_key,
+                                            self.grandparents[self._grandparent_index].greatest_key) > 0:
+            if self._seen_key:
+                self._overlapped_bytes += self.grandparents[self._grandparent_index].file_size
+            self._grandparent_index += 1
+        self._seen_key = True
+
+        if self._overlapped_bytes > self._max_grand_parent_overlap_bytes:
+            # Too much overlap for current output; start new output
+            self._overlapped_bytes = 0
+            return True
+        return False
+
+    def release_inputs(self):
+        """
+        Release the input version for the compaction, once the compaction is successful.
+        """
+        if self.input_version is not None:
+            self.input_version.unref()
+            self.input_version = None
@@ -1,155 +1,196 @@
+from coding import encode_varint32, get_varint32
 from db_types import SequenceNumber
 from memtable import MemTable
-from dbformat import ValueType, byte_order
+from dbformat import ValueType
 from status import Status
-from typing import Tuple
+import struct
 
+# The fields are little endian, the same as dbformat.byte_order.
+# |sequence_number: 4 bytes|count: 4 bytes|
+_HEADER = struct.Struct('<II')
+HEADER_SIZE = _HEADER.size
+# |type: 1 byte|key_size: 4 bytes| of the fixed size records
+_TAG_AND_SIZE = struct.Struct('<BI')
+_SIZE = struct.Struct('<I')
 
-class WriteBatch:
-    def __init__(self):
-        self._batch = []
-        self._count = 0
-        self._size = 0
-        self._sequence_number: SequenceNumber = None
+_TYPE_VALUE = ValueType.kTypeValue.value
+_TYPE_DELETION = ValueType.kTypeDeletion.value
+# The tag of a record whose sizes are varint32 has this bit set. Records written
+# before varint sizes were introduced have a plain ValueType tag and fixed sizes.
+VARINT_RECORD = 0x80
 
-    def put(self, key, value):
-        self._batch.append((key, value, ValueType.kTypeValue))
-        self._size += len(key) + len(value)
-        self._count += 1
 
-    def delete(self, key):
-        self._batch.append((key, '', ValueType.kTypeDeletion))
-        self._size += len(key)
-        self._count += 1
+class WriteBatch:
+    """
+    WriteBatch holds a collection of updates to apply atomically to a DB.
 
-    def count(self):
-        return self._count
+    The updates are appended to a byte buffer rep, which is the serialized form
+    written to the log as-is:
+        sequence_number: 4 Bytes
+        count: 4 Bytes
+        content: records[count]
+        records = match tag {
+            case kTypeValue | VARINT_RECORD:    tag|key_size: varint32|key_content|value_size: varint32|value_content
+            case kTypeDeletion | VARINT_RECORD: tag|key_size: varint32|key_content
+            case kTypeValue:                    tag|key_size: 4 bytes|key_content|value_size: 4 bytes|value_content
+            case kTypeDeletion:                 tag|key_size: 4 bytes|key_content
+        }
+    The sizes are the lengths of the utf-8 encoded contents. New records are always
+    written with varint sizes, the fixed size records of older logs are still read.
+    """
 
-    def size(self):
-        return self._size
+    def __init__(self):
+        self._rep = bytearray(HEADER_SIZE)
+
+    def put(self, key: str, value: str):
+        key = key.encode('utf-8')
+        value = value.encode('utf-8')
+        self._set_count(self.count() + 1)
+        rep = self._rep
+        rep.append(_TYPE_VALUE | VARINT_RECORD)
+        rep += encode_varint32(len(key))
+        rep += key
+        rep += encode_varint32(len(value))
+        rep += value
+
+    def delete(self, key: str):
+        key = key.encode('utf-8')
+        self._set_count(self.count() + 1)
+        rep = self._rep
+        rep.append(_TYPE_DELETION | VARINT_RECORD)
+        rep += encode_varint32(len(key))
+        rep += key
+
+    def count(self) -> int:
+        return _SIZE.unpack_from(self._rep, 4)[0]
+
+    def _set_count(self, count: int):
+        _SIZE.pack_into(self._rep, 4, count)
+
+    def clear(self):
+        self._rep = bytearray(HEADER_SIZE)
+
+    def append(self, other: 'WriteBatch'):
+        """
+        Append the operations of other to this batch.
+        """
+        self._set_count(self.count() + other.count())
+        self._rep += memoryview(other._rep)[HEADER_SIZE:]
 
-    def __iter__(self):
-        for k, v, t in self._batch:
-            yield k, v, t
+    def size(self) -> int:
+        """
+        The size of the serialized batch in bytes.
+        """
+        return len(self._rep)
 
-    def set_sequence_number(self, sequence_number):
-        self._sequence_number = sequence_number
+    def __iter__(self):
+        """
+        Yield the (key, value, type) of the records, the key and value decoded as str.
+        """
+        for t, k, v in self._records():
+            yield k.decode('utf-8'), v.decode('utf-8'), ValueType(t)
 
-    def sequence_number(self):
-        return self._sequence_number
+    def _records(self):
+        """
+        Yield the (type, key, value) of the records, the key and value as bytes.
+        Raise ValueError if the rep is malformed.
+        """
+        with memoryview(self._rep) as view:
+            offset = HEADER_SIZE
+            end = len(view)
+            while offset < end:
+                tag = view[offset]
+                t = tag & ~VARINT_RECORD
+                if t != _TYPE_VALUE and t != _TYPE_DELETION:
+                    raise ValueError('unknown WriteBatch tag')
+                if tag & VARINT_RECORD:
+                    key_size, offset = get_varint32(view, offset + 1)
+                else:
+                    if offset + 5 > end:
+                        raise ValueError('bad WriteBatch record')
+                    _, key_size = _TAG_AND_SIZE.unpack_from(view, offset)
+                    offset += 5
+                if offset + key_size > end:
+                    raise ValueError('bad WriteBatch record')
+                key = bytes(view[offset:offset + key_size])
+                offset += key_size
+                if t == _TYPE_VALUE:
+                    if tag & VARINT_RECORD:
+                        value_size, offset = get_varint32(view, offset)
+                    else:
+                        if offset + 4 > end:
+                            raise ValueError('bad WriteBatch Put')
+                        value_size, = _SIZE.unpack_from(view, offset)
+                        offset += 4
+                    if offset + value_size > end:
+                        raise ValueError('bad WriteBatch Put')
+                    value = bytes(view[offset:offset + value_size])
+                    offset += value_size
+                else:
+                    value = b''
+                yield t, key, value
+
+    def set_sequence_number(self, sequence_number: SequenceNumber):
+        _SIZE.pack_into(self._rep, 0, sequence_number)
+
+    def sequence_number(self) -> SequenceNumber:
+        return _SIZE.unpack_from(self._rep, 0)[0]
 
     class Handler:
         def __init__(self, mem_table: MemTable, sequence_number: SequenceNumber):
             self._mem_table = mem_table
             self._sequence_number = sequence_number
 
-        def put(self, key, value):
+        def put(self, key: bytes, value: bytes):
             self._mem_table.add(self._sequence_number, key,
                                 value, ValueType.kTypeValue)
             self._sequence_number += 1
 
-        def delete(self, key):
+        def delete(self, key: bytes):
             self._mem_table.add(self._sequence_number, key,
-                                '', ValueType.kTypeDeletion)
+                                b'', ValueType.kTypeDeletion)
             self._sequence_number += 1
 
-    def apply(self, mem_table: MemTable) -> Status:
-        assert self._sequence_number is not None
-        handler = WriteBatch.Handler(mem_table, self._sequence_number)
+    def iterate(self, handler) -> Status:
+        """
+        Call handler.put(key, value) or handler.delete(key) for every record in order,
+        with the key and value as bytes.
+        """
         found = 0
-        for k, v, t in self:
-            found += 1
-            if t == ValueType.kTypeValue:
-                handler.put(k, v)
-            elif t == ValueType.kTypeDeletion:
-                handler.delete(k)
-            else:
-                return Status.Corruption("unknown WriteBatch tag")
+        try:
+            for t, k, v in self._records():
+                found += 1
+                if t == _TYPE_VALUE:
+                    handler.put(k, v)
+                else:
+                    handler.delete(k)
+        except ValueError as e:
+            return Status.Corruption(str(e))
 
         if found != self.count():
             return Status.Corruption("WriteBatch has wrong count")
         return Status.OK()
 
+    def apply(self, mem_table: MemTable) -> Status:
+        return self.iterate(WriteBatch.Handler(mem_table, self.sequence_number()))
+
     def serialize(self) -> bytearray:
         """
-        Serialize the WriteBatch to a byte array.
-        sequence_number: 4 Bytes
-        count: 4 Bytes
-        content: records[count]
-        records = match ValueType {
-            case kTypeValue:    kTypeValueSize|key_size|key_content|value_size|value_content
-            case kTypeDeletion: kTypeDeletionSize|key_size|key_content
-        }
-        :return:  byte array
+        Return the serialized batch, which is the rep itself without a copy.
         """
-        assert self._sequence_number is not None
-        buf = bytearray(self._sequence_number.to_bytes(4, byte_order))
-        buf.extend(bytearray(self._count.to_bytes(4, byte_order)))
-        content = bytearray()
-
-        def mapper(entry: Tuple[str, str, ValueType]) -> bytearray:
-            k, v, t = entry
-            if t == ValueType.kTypeValue:
-                buffer = bytearray(ValueType.kTypeValue.value.to_bytes(1, byte_order))
-                buffer.extend(bytearray(len(k).to_bytes(4, byte_order)))
-                buffer.extend(bytearray(k.encode('utf-8')))
-                buffer.extend(bytearray(len(v).to_bytes(4, byte_order)))
-                buffer.extend(bytearray(v.encode('utf-8')))
-                return buffer
-            elif t == ValueType.kTypeDeletion:
-                buffer = bytearray(ValueType.kTypeDeletion.value.to_bytes(1, byte_order))
-                buffer.extend(bytearray(len(k).to_bytes(4, byte_order)))
-                buffer.extend(bytearray(k.encode('utf-8')))
-                return buffer
-            else:
-                raise Exception("unknown WriteBatch tag")
-
-        for entry in map(mapper, self):
-            content.extend(entry)
-
-        buf.extend(content)
-        return buf
+        return self._rep
 
     @staticmethod
     def deserialize(data: bytearray) -> 'WriteBatch':
-        seq = int.from_bytes(data[:4], byte_order)
-        assert seq >= 0
-        count = int.from_bytes(data[4:8], byte_order)
-        assert count > 0
-
-        content = data[8:]
-        records = []
-        size = 0
-        for i in range(count):
-            t = int.from_bytes(content[:1], byte_order)
-            t = ValueType(t)
-            if t == ValueType.kTypeValue:
-                key_size = int.from_bytes(content[1:5], byte_order)
-                key = content[5:5 + key_size].decode('utf-8')
-                value_size = int.from_bytes(content[5 + key_size:9 + key_size], byte_order)
-                value = content[9 + key_size:9 + key_size + value_size].decode('utf-8')
-                records.append((key, value, t))
-                size = size + len(key) + len(value)
-                content = content[9 + key_size + value_size:]
-            else:
-                key_size = int.from_bytes(content[1:5], byte_order)
-                key = content[5:5 + key_size].decode('utf-8')
-                records.append((key, '', t))
-                size = size + len(key)
-                content = content[5 + key_size:]
-
+        """
+        Make a WriteBatch of the serialized data. The records are checked when
+        the batch is iterated.
+        """
+        if len(data) < HEADER_SIZE:
+            raise ValueError('malformed WriteBatch (too small)')
         batch = WriteBatch()
-        batch._sequence_number = seq
-        batch._count = count
-        batch._batch = records
-        batch._size = size
+        batch._rep = bytearray(data)
         return batch
 
     def __eq__(self, other):
-        if self._count != other._count or self._sequence_number != other._sequence_number:
-            return False
-        for i in range(self._count):
-            if self._batch[i][0] != other._batch[i][0] or self._batch[i][1] != other._batch[i][1] or self._batch[i][
-                2] != other._batch[i][2]:
-                return False
-        return True
+        return self._rep == other._rep